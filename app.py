@@ -1,14 +1,47 @@
+import sqlite3
+
 from flask import Flask, current_app, render_template
-from extensions import db
+from sqlalchemy import event
+from extensions import db, migrate
+from rollup import create_rollup_triggers
+from search import create_search_index
 from flask_login import LoginManager
 
 login_manager = LoginManager()
 
-def create_app():
+
+def sqlite_pragmas(config):
+    """
+    PRAGMA для новых соединений: профиль SQLITE_PRAGMAS. При архивировании WAL
+    журнал всегда WAL, а автоматическая контрольная точка отложена до
+    WAL_AUTOCHECKPOINT_PAGES страниц: обычно журнал раньше переносит в базу
+    архиватор, уже отправив кадры. Отключать её совсем нельзя: архиватор
+    работает не во всех процессах (flask load, BACKUP_SCHEDULER=0), и без
+    него журнал рос бы без предела. Если журнал начнётся заново до
+    копирования кадров, архиватор начнёт новую линию времени.
+    """
+    pragmas = dict(config['SQLITE_PRAGMAS'])
+    if config['WAL_ARCHIVE']:
+        pragmas.update(journal_mode='WAL', wal_autocheckpoint=config['WAL_AUTOCHECKPOINT_PAGES'])
+    return pragmas
+
+
+def set_sqlite_pragmas(pragmas):
+    """Возвращает обработчик события connect, применяющий pragmas к каждому соединению с SQLite."""
+    def on_connect(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            for name, value in pragmas.items():
+                dbapi_connection.execute(f"PRAGMA {name}={value}")
+    return on_connect
+
+
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object('config.DevelopmentConfig')
+    app.config.update(config_overrides or {})
     app.jinja_env.globals.update(enumerate=enumerate)
     db.init_app(app)
+    migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'main.login'
 
@@ -19,9 +52,26 @@ def create_app():
         def load_user(user_id):
             return db.session.get(User, int(user_id))
 
+        from reports import report_cache, report_queue
+        report_cache.init_app(app)
+        report_queue.init_app(app)
+
+        from maintenance import db_gate
+        db_gate.init_app(app)
+
+        from write_queue import write_queue
+        write_queue.init_app(app)
+
+        from backup_scheduler import backup_scheduler, backup_uploader
+        backup_scheduler.init_app(app)
+        backup_uploader.init_app(app)
+
         from routes import main_bp
         app.register_blueprint(main_bp)
 
+        from commands import register_commands
+        register_commands(app)
+
         @app.errorhandler(404)
         def not_found_error(error):
             return render_template('errors/404.html'), 404
@@ -31,7 +81,11 @@ def create_app():
             db.session.rollback()
             return render_template('errors/500.html'), 500
 
+        event.listen(db.engine, 'connect', set_sqlite_pragmas(sqlite_pragmas(app.config)))
         db.create_all()
+        with db.engine.begin() as conn:
+            create_search_index(conn)
+            create_rollup_triggers(conn)
         create_admin_user()
 
     return app
@@ -0,0 +1,325 @@
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from backup_system import WalArchiver, backup_disk_usage, differential_backup, full_backup, get_last_backup, \
+    incremental_backup, prune_backups, read_backup_log, verify_backups, wal_archive_status
+from backup_targets import LocalTarget, S3Target, upload_backups
+from extensions import db
+
+# Типы бэкапов в порядке приоритета: если наступил срок полного,
+# дифференциальный и инкрементальный в этот раз не нужны
+BACKUP_TYPES = ('full', 'differential', 'incremental')
+# Какие бэкапы сдвигают срок следующего бэкапа данного типа
+COVERED_BY = {
+    'full': ('full',),
+    'differential': ('full', 'differential'),
+    'incremental': ('full', 'differential', 'incremental'),
+}
+
+
+def backup_options():
+    """Параметры онлайн-копирования и сжатия из конфигурации."""
+    return {
+        "db_path": db.engine.url.database,
+        "pages": current_app.config['BACKUP_PAGES_PER_STEP'],
+        "pause": current_app.config['BACKUP_STEP_PAUSE'],
+        "compression": current_app.config['BACKUP_COMPRESSION'] or None,
+        "workers": current_app.config['BACKUP_WORKERS']
+    }
+
+
+def backup_target():
+    """Хранилище копий бэкапов из конфигурации или None, если копирование выключено."""
+    config = current_app.config
+    options = {
+        "part_size": int(config['BACKUP_UPLOAD_PART_SIZE'] * 1024 * 1024),
+        "workers": config['BACKUP_UPLOAD_WORKERS'],
+        "bandwidth": config['BACKUP_UPLOAD_BANDWIDTH'] * 1024 * 1024
+    }
+    if config['BACKUP_TARGET'] == 'local':
+        return LocalTarget(config['BACKUP_TARGET_DIR'], **options)
+    if config['BACKUP_TARGET'] == 's3':
+        return S3Target(
+            config['BACKUP_S3_ENDPOINT'],
+            config['BACKUP_S3_BUCKET'],
+            config['BACKUP_S3_ACCESS_KEY'],
+            config['BACKUP_S3_SECRET_KEY'],
+            region=config['BACKUP_S3_REGION'],
+            prefix=config['BACKUP_S3_PREFIX'],
+            **options
+        )
+    return None
+
+
+def run_backup(backup_type):
+    """Делает бэкап указанного типа с параметрами из конфигурации и ставит его в очередь на отправку."""
+    if backup_type == 'full':
+        result = full_backup(storage=current_app.config['BACKUP_STORAGE'], **backup_options())
+    elif backup_type == 'differential':
+        result = differential_backup(**backup_options())
+    else:
+        result = incremental_backup(**backup_options())
+    if result[0]:
+        backup_uploader.submit()
+    return result
+
+
+def prune_by_config():
+    """Удаляет бэкапы, не попавшие в схему хранения из конфигурации."""
+    return prune_backups(
+        daily=current_app.config['BACKUP_KEEP_DAILY'],
+        weekly=current_app.config['BACKUP_KEEP_WEEKLY'],
+        monthly=current_app.config['BACKUP_KEEP_MONTHLY']
+    )
+
+
+def verify_by_config(backup_ids=None, only_unverified=False, mode=None, workers=None):
+    """Проверяет бэкапы; режим и число процессов по умолчанию берутся из конфигурации."""
+    return verify_backups(
+        backup_ids,
+        mode=mode or current_app.config['BACKUP_VERIFY_MODE'],
+        workers=workers or current_app.config['BACKUP_VERIFY_WORKERS'],
+        only_unverified=only_unverified
+    )
+
+
+def verification_summary(entries=None):
+    """Сколько бэкапов проверено, сколько с ошибками и доля исправных среди проверенных."""
+    entries = read_backup_log() if entries is None else entries
+    results = [entry['verification'] for entry in entries if entry.get('verification')]
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    return {
+        "total": len(entries),
+        "verified": len(results),
+        "failed": failed,
+        "score": 100.0 * (len(results) - failed) / len(results) if results else None,
+    }
+
+
+class BackupUploader:
+    """
+    Отправка бэкапов в хранилище в фоновом потоке: запрос или планировщик
+    только ставит её в очередь и не ждёт окончания. Проходы идут по одному;
+    постановка во время прохода даёт ещё один проход после него.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queued = False
+        self.running = False
+        self.last_result = None
+
+    def init_app(self, app):
+        self._app = app
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='backup-uploader')
+
+    def submit(self):
+        """
+        Ставит в очередь отправку ещё не отправленных бэкапов.
+
+        Returns:
+            bool: False, если хранилище не настроено
+        """
+        target = backup_target()
+        if target is None:
+            return False
+        with self._lock:
+            if self._queued:
+                return True
+            self._queued = True
+        self._executor.submit(self._run, target)
+        return True
+
+    def _run(self, target):
+        with self._lock:
+            self._queued = False
+        self.running = True
+        try:
+            success, msg = upload_backups(target)
+        except Exception as e:
+            self._app.logger.exception("Ошибка отправки бэкапов")
+            success, msg = False, f"❌ Ошибка отправки бэкапов: {e}"
+        finally:
+            self.running = False
+        self.last_result = (datetime.now(), success, msg)
+        self._app.logger.info("Отправка бэкапов: %s", msg)
+
+    def status(self, entries=None):
+        """Сведения для страницы настроек: хранилище, сколько бэкапов отправлено, последний результат."""
+        target = backup_target()
+        if target is None:
+            return None
+        entries = read_backup_log() if entries is None else entries
+        return {
+            "location": target.location,
+            "uploaded": sum(1 for entry in entries
+                            if (entry.get('remote') or {}).get('location') == target.location),
+            "total": len(entries),
+            "running": self.running,
+            "last_result": self.last_result,
+        }
+
+
+class BackupScheduler:
+    """
+    Планировщик бэкапов в фоновом потоке.
+
+    Срок следующего бэкапа считается от последнего бэкапа того же или более
+    полного типа из журнала, поэтому перезапуск приложения и ручные бэкапы
+    не вызывают лишних запусков. После каждого бэкапа старые бэкапы удаляются
+    по схеме хранения и проверяются новые бэкапы. Запуски из разных процессов не пересекаются благодаря
+    файлу блокировки backup_system.
+
+    Во втором потоке работает архиватор WAL (если WAL_ARCHIVE включён):
+    архивирует только один процесс, остальные ждут, пока роль освободится.
+    """
+
+    # Как часто проверять, не пора ли делать бэкап (сек)
+    TICK = 60
+
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._archive_thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Время последней попытки: если база не менялась, бэкап не создаётся,
+        # и без этого попытка повторялась бы на каждой проверке
+        self._attempts = {}
+        self.intervals = {}
+        self.last_result = None
+
+    def init_app(self, app):
+        self._app = app
+        self.intervals = {
+            'full': app.config['BACKUP_FULL_INTERVAL'],
+            'differential': app.config['BACKUP_DIFFERENTIAL_INTERVAL'],
+            'incremental': app.config['BACKUP_INCREMENTAL_INTERVAL'],
+        }
+        if app.config['BACKUP_SCHEDULER']:
+            # Поток запускается с первым запросом, а не при создании приложения,
+            # чтобы CLI-команды (миграции, загрузка) не делали бэкапы
+            app.before_request(self.start)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None and any(self.intervals.values()):
+                self._thread = threading.Thread(target=self.run_forever, name='backup-scheduler', daemon=True)
+                self._thread.start()
+        self.start_archiver()
+
+    def start_archiver(self):
+        """Запускает поток архивирования WAL, если оно включено."""
+        with self._start_lock:
+            if self._archive_thread is not None or not self._app.config['WAL_ARCHIVE']:
+                return
+            self._archive_thread = threading.Thread(target=self.archive_forever, name='wal-archiver', daemon=True)
+            self._archive_thread.start()
+            # При выходе отправить последние кадры и освободить роль архиватора
+            atexit.register(self._stop_archiver)
+
+    def _stop_archiver(self):
+        self._stop.set()
+        self._archive_thread.join(timeout=30)
+
+    def stop(self):
+        self._stop.set()
+
+    def archive_forever(self):
+        """Отправляет кадры WAL в архив каждые WAL_ARCHIVE_INTERVAL секунд до вызова stop()."""
+        with self._app.app_context():
+            archiver = WalArchiver(db.engine.url.database, self._app.config['WAL_CHECKPOINT_PAGES'])
+        interval = self._app.config['WAL_ARCHIVE_INTERVAL']
+        try:
+            while not self._stop.is_set():
+                try:
+                    if archiver.active or archiver.acquire():
+                        archiver.ship()
+                except Exception:
+                    self._app.logger.exception("Ошибка архивирования WAL")
+                self._stop.wait(interval)
+        finally:
+            archiver.release()
+
+    def run_forever(self):
+        """Проверяет сроки бэкапов каждые TICK секунд до вызова stop()."""
+        while not self._stop.is_set():
+            with self._app.app_context():
+                try:
+                    self.run_pending()
+                except Exception:
+                    current_app.logger.exception("Ошибка бэкапа по расписанию")
+            self._stop.wait(self.TICK)
+
+    def next_runs(self, now=None):
+        """
+        Returns:
+            dict: Тип бэкапа -> время следующего запуска (только включённые типы)
+        """
+        now = now or datetime.now()
+        runs = {}
+        for backup_type in BACKUP_TYPES:
+            hours = self.intervals.get(backup_type)
+            if not hours:
+                continue
+            moments = [self._attempts.get(backup_type)]
+            for covering in COVERED_BY[backup_type]:
+                entry = get_last_backup(covering)
+                if entry is not None:
+                    moments.append(datetime.fromisoformat(entry['timestamp']))
+            moments = [moment for moment in moments if moment is not None]
+            runs[backup_type] = max(moments) + timedelta(hours=hours) if moments else now
+        return runs
+
+    def next_run(self):
+        """
+        Returns:
+            tuple: (тип, время) ближайшего запуска или None, если планировщик выключен
+        """
+        runs = self.next_runs()
+        if not runs:
+            return None
+        return min(runs.items(), key=lambda item: item[1])
+
+    def run_pending(self):
+        """
+        Делает один бэкап, срок которого наступил (самый полный из них),
+        удаляет старые бэкапы и проверяет новые.
+
+        Returns:
+            tuple: (success, msg) или None, если запускать было нечего
+        """
+        now = datetime.now()
+        due = [backup_type for backup_type, moment in self.next_runs(now).items() if moment <= now]
+        if not due:
+            return None
+        backup_type = due[0]
+        self._attempts[backup_type] = now
+        success, msg = run_backup(backup_type)
+        if success:
+            _, prune_msg = prune_by_config()
+            _, verify_msg = verify_by_config(only_unverified=True)
+            msg = f"{msg} {prune_msg} {verify_msg}"
+        self.last_result = (now, success, msg)
+        current_app.logger.info("Бэкап по расписанию (%s): %s", backup_type, msg)
+        return success, msg
+
+    def status(self):
+        """Сведения для страницы настроек: ближайший запуск и место на диске."""
+        return {
+            "in_app": self._app.config['BACKUP_SCHEDULER'],
+            "next_run": self.next_run(),
+            "last_result": self.last_result,
+            "disk_usage": backup_disk_usage(),
+            "wal": wal_archive_status(),
+        }
+
+
+backup_uploader = BackupUploader()
+backup_scheduler = BackupScheduler()
@@ -2,13 +2,115 @@
 import os
 import shutil
 import json
+import functools
+import hashlib
+import lzma
+import multiprocessing
+import sqlite3
+import struct
+import tempfile
+import threading
+import zlib
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import time
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # Константы
+# Журнал бэкапов - таблица в отдельной базе SQLite: запись добавляется одной
+# транзакцией, поэтому сбой посреди записи не портит остальные записи.
+# Старый журнал в JSON переносится в неё при первом обращении
+BACKUP_CATALOG_FILE = 'backups/catalog.db'
 BACKUP_LOG_FILE = 'backups/backup_log.json'
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    filename TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    details TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS ix_backups_type_id ON backups (type, id);
+CREATE INDEX IF NOT EXISTS ix_backups_path ON backups (path);
+CREATE TABLE IF NOT EXISTS wal_segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timeline TEXT NOT NULL,
+    shipped_at TEXT NOT NULL,
+    path TEXT NOT NULL,
+    frames INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_wal_segments_timeline ON wal_segments (timeline, shipped_at);
+"""
 DEFAULT_DB_PATH = 'database.db'
+# Онлайн-копирование: страниц за один шаг и пауза между шагами (сек)
+DEFAULT_PAGES_PER_STEP = 1024
+DEFAULT_STEP_PAUSE = 0.01
+
+# Постраничные бэкапы: файл хешей страниц (по 20 байт SHA-1 на страницу)
+# и файл изменённых страниц с заголовком (размер страницы, число страниц, изменено)
+HASHES_SUFFIX = '.hashes'
+HASH_SIZE = 20
+DELTA_MAGIC = b'MILKDLT1'
+DELTA_HEADER = struct.Struct('>IQQ')
+DELTA_PAGE = struct.Struct('>Q')
+
+# Сжатые бэкапы: заголовок (алгоритм, размер фрагмента) и независимо сжатые
+# фрагменты, у каждого - исходный и сжатый размер и SHA-256 исходных данных
+COMPRESSED_SUFFIX = '.bkz'
+COMPRESSED_MAGIC = b'MILKBKZ1'
+COMPRESSED_HEADER = struct.Struct('>8sI')
+CHUNK_HEADER = struct.Struct('>II32s')
+COMPRESSORS = {
+    'zlib': (lambda data, level: zlib.compress(data, level), zlib.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+    'none': (lambda data, level: data, bytes),
+}
+DEFAULT_COMPRESSION = 'zlib'
+COMPRESSION_LEVEL = 6
+COMPRESSION_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_WORKERS = os.cpu_count() or 2
+
+# Репозиторий с дедупликацией: уникальные фрагменты снимков хранятся один раз
+# под своим SHA-256, у каждого бэкапа - манифест со списком фрагментов.
+# Граница фрагмента - страница, хеш которой делится на REPOSITORY_AVG_PAGES
+REPOSITORY_DIR = 'backups/repository'
+REPOSITORY_MIN_PAGES = 16
+REPOSITORY_AVG_PAGES = 64
+REPOSITORY_MAX_PAGES = 256
+# Бэкапы в репозиторий и сборка мусора не должны идти одновременно
+_repository_lock = threading.Lock()
+
+# Непрерывный архив WAL: кадры журнала копируются в сегменты каждые несколько
+# секунд. Архив делится на линии времени: линия начинается при запуске
+# архиватора или после восстановления, и только внутри линии архив непрерывен
+WAL_ARCHIVE_DIR = 'backups/wal'
+WAL_TIMELINE_FILE = 'backups/wal/timeline'
+WAL_ARCHIVER_LOCK = 'backups/wal/.archiver'
+# Архиватор отмечается в файле блокировки при каждом проходе; без отметки
+# дольше WAL_ARCHIVER_STALE секунд роль архиватора может занять другой процесс
+WAL_ARCHIVER_STALE = 60
+WAL_HEADER = struct.Struct('>IIIIIIII')
+WAL_FRAME_HEADER = struct.Struct('>IIIIII')
+WAL_SEGMENT_MAGIC = b'MILKWAL1'
+WAL_SEGMENT_HEADER = struct.Struct('>II')
+WAL_SEGMENT_FRAME = struct.Struct('>II')
+DEFAULT_WAL_CHECKPOINT_PAGES = 1000
+
+# Файл блокировки: бэкап, восстановление и очистка не идут одновременно,
+# в том числе из разных процессов (веб-приложение, планировщик, CLI).
+# Блокировку файла держит ОС и снимает её, даже если процесс упал или был убит
+BACKUP_LOCK_FILE = 'backups/.lock'
+_lock_state = threading.local()
 
 
 def ensure_backup_dirs():
@@ -16,11 +118,15 @@ def ensure_backup_dirs():
     os.makedirs('backups/full', exist_ok=True)
     os.makedirs('backups/incremental', exist_ok=True)
     os.makedirs('backups/differential', exist_ok=True)
+    os.makedirs(WAL_ARCHIVE_DIR, exist_ok=True)
+    os.makedirs(os.path.join(REPOSITORY_DIR, 'chunks'), exist_ok=True)
+    os.makedirs(os.path.join(REPOSITORY_DIR, 'manifests'), exist_ok=True)
 
 
 def get_timestamp():
-    """Возвращает текущую метку времени в формате YYYYMMDD_HHMMSS."""
-    return datetime.now().strftime('%Y%m%d_%H%M%S')
+    """Возвращает текущую метку времени в формате YYYYMMDD_HHMMSS_ffffff."""
+    # Микросекунды - чтобы два бэкапа за одну секунду не получили одно имя
+    return datetime.now().strftime('%Y%m%d_%H%M%S_%f')
 
 
 def get_iso_timestamp():
@@ -28,29 +134,255 @@ def get_iso_timestamp():
     return datetime.now().isoformat()
 
 
-def read_backup_log():
-    """Загружает журнал бэкапов из файла."""
+def _acquire_lock_file():
+    """
+    Блокирует файл блокировки (flock, в Windows - первый байт файла).
+
+    Returns:
+        int: Дескриптор заблокированного файла или None, если его держит другой запуск
+    """
+    fd = os.open(BACKUP_LOCK_FILE, os.O_CREAT | os.O_RDWR)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    # PID только для того, кто разбирается, чем занята блокировка
+    os.ftruncate(fd, 0)
+    os.write(fd, f"{os.getpid()}\n".encode())
+    return fd
+
+
+def _release_lock_file(fd):
+    """Снимает блокировку. Файл не удаляется: иначе другой запуск мог бы заблокировать уже удалённый файл."""
+    try:
+        if fcntl is None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+def exclusive(func):
+    """
+    Выполняет операцию с бэкапами под файлом блокировки. Если блокировку
+    держит другой запуск, операция не выполняется и возвращается (False, msg).
+    Вложенные вызовы в том же потоке блокировку не запрашивают повторно.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_lock_state, 'depth', 0)
+        if depth == 0:
+            ensure_backup_dirs()
+            fd = _acquire_lock_file()
+            if fd is None:
+                return False, "ℹ️  Уже выполняется другая операция с бэкапами, повторите позже."
+        _lock_state.depth = depth + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _lock_state.depth = depth
+            if depth == 0:
+                _release_lock_file(fd)
+    return wrapper
+
+
+@contextmanager
+def _catalog():
+    """Соединение с журналом бэкапов; изменения фиксируются одной транзакцией."""
     ensure_backup_dirs()
+    conn = sqlite3.connect(BACKUP_CATALOG_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            conn.executescript(CATALOG_SCHEMA)
+            _import_json_log(conn)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
 
-    if not os.path.exists(BACKUP_LOG_FILE):
-        return []
 
+def _import_json_log(conn):
+    """Переносит записи из старого журнала backup_log.json в таблицу."""
+    if not os.path.exists(BACKUP_LOG_FILE):
+        return
     try:
         with open(BACKUP_LOG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
+            log_entries = json.load(f)
+    except json.JSONDecodeError:
+        log_entries = []
+    for entry in log_entries:
+        _insert_entry(conn, dict(entry))
+    os.replace(BACKUP_LOG_FILE, f"{BACKUP_LOG_FILE}.imported")
+
+
+def _insert_entry(conn, entry):
+    columns = {key: entry.pop(key) for key in ('type', 'timestamp', 'filename', 'path')}
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO backups (type, timestamp, filename, path, details) VALUES (?, ?, ?, ?, ?)",
+        (columns['type'], columns['timestamp'], columns['filename'], columns['path'],
+         json.dumps(entry, ensure_ascii=False))
+    )
+    return cursor.lastrowid
+
+
+def _entry(row):
+    """Запись журнала в виде словаря: колонки таблицы и дополнительные поля."""
+    if row is None:
+        return None
+    entry = json.loads(row['details'])
+    entry.update(id=row['id'], type=row['type'], timestamp=row['timestamp'],
+                 filename=row['filename'], path=row['path'])
+    return entry
 
 
-def save_backup_log(log_entries):
-    """Сохраняет журнал бэкапов в файл."""
-    ensure_backup_dirs()
+def _find_entry(where, params=()):
+    with _catalog() as conn:
+        return _entry(conn.execute(
+            f"SELECT * FROM backups WHERE {where} ORDER BY id DESC LIMIT 1", params
+        ).fetchone())
+
+
+def read_backup_log():
+    """Возвращает все записи журнала бэкапов, от старых к новым."""
+    with _catalog() as conn:
+        return [_entry(row) for row in conn.execute("SELECT * FROM backups ORDER BY id")]
+
+
+def get_backup(backup_id):
+    """Возвращает запись журнала по её id или None."""
+    return _find_entry("id = ?", (backup_id,))
+
+
+def get_backup_by_filename(filename):
+    return _find_entry("filename = ?", (filename,))
+
+
+def get_backup_by_path(path):
+    return _find_entry("path = ?", (path,))
+
 
-    with open(BACKUP_LOG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(log_entries, f, indent=2, ensure_ascii=False)
+def update_backup_entry(backup_id, **fields):
+    """Добавляет или заменяет дополнительные поля записи журнала."""
+    with _catalog() as conn:
+        row = conn.execute("SELECT details FROM backups WHERE id = ?", (backup_id,)).fetchone()
+        if row is None:
+            return
+        details = json.loads(row['details'])
+        details.update(fields)
+        conn.execute("UPDATE backups SET details = ? WHERE id = ?",
+                     (json.dumps(details, ensure_ascii=False), backup_id))
 
 
-def log_backup(backup_type, filename, path):
+def delete_backup_entry(backup_id):
+    """Удаляет запись из журнала (файлы бэкапа не трогает)."""
+    with _catalog() as conn:
+        conn.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
+
+
+def online_copy(db_path, backup_path, pages=DEFAULT_PAGES_PER_STEP, pause=DEFAULT_STEP_PAUSE):
+    """
+    Копирует базу через онлайн-API резервного копирования SQLite.
+
+    Копирование идёт внутри одной транзакции чтения, поэтому копия согласована
+    на момент её начала. В режиме WAL запись в базу при этом не блокируется
+    и не заставляет SQLite начинать копирование заново. Страницы переносятся
+    шагами по pages штук с паузой между шагами, чтобы не занимать диск надолго.
+    Файл появляется под итоговым именем только после успешного копирования.
+
+    Args:
+        db_path (str): Путь к файлу базы данных
+        backup_path (str): Путь к файлу копии
+        pages (int): Страниц за один шаг (больше - быстрее, но дольше блокировка)
+        pause (float): Пауза между шагами в секундах
+
+    Returns:
+        float: Длительность копирования в секундах
+    """
+    started = time.perf_counter()
+    tmp_path = f"{backup_path}.part"
+
+    def progress(status, remaining, total):
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Снимок базы на всё время копирования
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target, pages=pages, progress=progress)
+            # Копия - один самодостаточный файл, без -wal и -shm рядом
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+        source.execute("ROLLBACK")
+        os.replace(tmp_path, backup_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    return time.perf_counter() - started
+
+
+def _snapshot(db_path, snapshot_path, pages, pause):
+    """
+    Онлайн-копия базы для бэкапа. Возвращает поля записи журнала:
+    момент начала копии и линию времени архива WAL, если архиватор работает.
+    Кадры WAL, отправленные в архив после snapshot_at, докатывают копию вперёд.
+    """
+    details = {"snapshot_at": get_iso_timestamp(), "wal_timeline": current_wal_timeline()}
+    online_copy(db_path, snapshot_path, pages, pause)
+    return details
+
+
+def copy_into_database(source_path, db_path):
+    """
+    Записывает базу source_path в рабочую базу db_path через API резервного
+    копирования SQLite.
+
+    Файл рабочей базы не подменяется: страницы переписываются внутри него
+    под блокировкой SQLite, поэтому соединения других процессов остаются
+    рабочими и после копирования видят новое содержимое.
+
+    Args:
+        source_path (str): Путь к файлу базы-источника
+        db_path (str): Путь к рабочей базе
+
+    Returns:
+        float: Длительность копирования в секундах
+    """
+    started = time.perf_counter()
+    source = sqlite3.connect(source_path)
+    try:
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            wal = target.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+            # В режиме WAL размер страницы базы-приёмника поменять нельзя,
+            # поэтому при несовпадении переходим на обычный журнал
+            if wal and read_page_size(source_path) != target.execute("PRAGMA page_size").fetchone()[0]:
+                target.execute("PRAGMA journal_mode=DELETE")
+                wal = False
+            source.backup(target)
+            if wal:
+                # Переносим записанные страницы из журнала в файл базы
+                target.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return time.perf_counter() - started
+
+
+def log_backup(backup_type, filename, path, **details):
     """
     Добавляет запись о бэкапе в журнал.
 
@@ -58,18 +390,37 @@ def log_backup(backup_type, filename, path):
         backup_type (str): Тип бэкапа ('full', 'incremental', 'differential')
         filename (str): Имя файла бэкапа
         path (str): Полный путь к файлу бэкапа
-    """
-    log_entries = read_backup_log()
+        **details: Дополнительные поля записи (родительский бэкап, число страниц и т.п.)
 
+    Returns:
+        int: id записи
+    """
     log_entry = {
         "type": backup_type,
         "timestamp": get_iso_timestamp(),
         "filename": filename,
         "path": path
     }
+    log_entry.update(details)
+
+    with _catalog() as conn:
+        return _insert_entry(conn, log_entry)
+
+
+def get_last_backup(backup_type=None):
+    """
+    Возвращает запись журнала о последнем бэкапе.
 
-    log_entries.append(log_entry)
-    save_backup_log(log_entries)
+    Args:
+        backup_type (str): Тип бэкапа или None для любого типа
+
+    Returns:
+        dict: Запись журнала или None
+    """
+    # Одно чтение по индексу (type, id) или по первичному ключу
+    if backup_type is None:
+        return _find_entry("1")
+    return _find_entry("type = ?", (backup_type,))
 
 
 def get_last_full_backup_time():
@@ -79,17 +430,10 @@ def get_last_full_backup_time():
     Returns:
         float: Временная метка Unix последнего полного бэкапа или None
     """
-    log_entries = read_backup_log()
-
-    # Ищем все полные бэкапы
-    full_backups = [entry for entry in log_entries if entry.get('type') == 'full']
-
-    if not full_backups:
+    last_full = get_last_backup('full')
+    if last_full is None:
         return None
 
-    # Берём последний по времени
-    last_full = max(full_backups, key=lambda x: x['timestamp'])
-
     # Преобразуем ISO timestamp в Unix timestamp
     dt = datetime.fromisoformat(last_full['timestamp'])
     return dt.timestamp()
@@ -102,25 +446,590 @@ def get_last_backup_time():
     Returns:
         float: Временная метка Unix последнего бэкапа или None
     """
-    log_entries = read_backup_log()
-
-    if not log_entries:
+    last_backup = get_last_backup()
+    if last_backup is None:
         return None
 
-    # Берём последнюю запись по времени
-    last_backup = max(log_entries, key=lambda x: x['timestamp'])
-
     dt = datetime.fromisoformat(last_backup['timestamp'])
     return dt.timestamp()
 
 
-def full_backup(db_path=DEFAULT_DB_PATH, backup_dir="backups/full"):
+# --- Постраничные копии ---
+def read_page_size(path):
+    """Читает размер страницы из заголовка файла SQLite."""
+    with open(path, 'rb') as f:
+        f.seek(16)
+        value = int.from_bytes(f.read(2), 'big')
+    # Значение 1 в заголовке означает 65536
+    return 65536 if value == 1 else value
+
+
+def hash_pages(path, page_size):
+    """
+    Считает SHA-1 каждой страницы файла базы.
+
+    Returns:
+        bytes: Хеши страниц подряд, по HASH_SIZE байт на страницу
+    """
+    hashes = bytearray()
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            hashes += hashlib.sha1(page).digest()
+    return bytes(hashes)
+
+
+def file_sha256(path):
+    """SHA-256 содержимого файла (hex)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_page_hashes(backup_path, hashes):
+    with open(backup_path + HASHES_SUFFIX, 'wb') as f:
+        f.write(hashes)
+
+
+def load_page_hashes(entry):
+    """
+    Возвращает хеши страниц базы в состоянии на момент бэкапа.
+
+    Для старых записей журнала (полная копия файла без хешей) хеши
+    считаются по самому файлу бэкапа.
+    """
+    hashes_path = entry['path'] + HASHES_SUFFIX
+    if os.path.exists(hashes_path):
+        with open(hashes_path, 'rb') as f:
+            return f.read()
+    if entry.get('parent') is None:
+        return hash_pages(entry['path'], read_page_size(entry['path']))
+    raise FileNotFoundError(f"Нет хешей страниц для {entry['filename']}")
+
+
+def changed_pages(hashes, parent_hashes):
+    """Номера страниц, хеш которых отличается от родительского."""
+    return [
+        number for number in range(len(hashes) // HASH_SIZE)
+        if hashes[number * HASH_SIZE:(number + 1) * HASH_SIZE]
+        != parent_hashes[number * HASH_SIZE:(number + 1) * HASH_SIZE]
+    ]
+
+
+def write_delta(snapshot_path, dst, page_size, page_count, numbers):
+    """
+    Записывает в файл изменений заголовок и перечисленные страницы снимка.
+
+    Returns:
+        int: Размер записанных данных в байтах
+    """
+    dst.write(DELTA_MAGIC)
+    dst.write(DELTA_HEADER.pack(page_size, page_count, len(numbers)))
+    with open(snapshot_path, 'rb') as src:
+        for number in numbers:
+            src.seek(number * page_size)
+            dst.write(DELTA_PAGE.pack(number))
+            dst.write(src.read(page_size))
+    return len(DELTA_MAGIC) + DELTA_HEADER.size + len(numbers) * (DELTA_PAGE.size + page_size)
+
+
+def apply_delta(src, db_path):
+    """Записывает страницы из файла изменений в файл базы и обрезает его до нужного размера."""
+    with open(db_path, 'r+b') as dst:
+        if src.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise ValueError("Неверный формат файла изменений")
+        page_size, page_count, changed = DELTA_HEADER.unpack(src.read(DELTA_HEADER.size))
+        for _ in range(changed):
+            (number,) = DELTA_PAGE.unpack(src.read(DELTA_PAGE.size))
+            dst.seek(number * page_size)
+            dst.write(src.read(page_size))
+        dst.truncate(page_count * page_size)
+
+
+# --- Сжатие ---
+def _compress_chunk(codec, data):
+    packed = COMPRESSORS[codec][0](data, COMPRESSION_LEVEL)
+    return CHUNK_HEADER.pack(len(data), len(packed), hashlib.sha256(data).digest()) + packed
+
+
+def _decompress_chunk(codec, packed, raw_size, digest, number):
+    try:
+        data = COMPRESSORS[codec][1](packed)
+    except (zlib.error, lzma.LZMAError):
+        data = None
+    if data is None or len(data) != raw_size or hashlib.sha256(data).digest() != digest:
+        raise ValueError(f"Фрагмент {number} повреждён: контрольная сумма не совпадает")
+    return data
+
+
+class CompressedWriter:
+    """
+    Файл бэкапа, который сжимает записываемые данные фрагментами.
+
+    Фрагменты сжимаются параллельно в пуле потоков (zlib и lzma отпускают GIL)
+    и записываются по порядку; в памяти одновременно не больше 2 * workers фрагментов.
+    """
+
+    def __init__(self, path, codec=DEFAULT_COMPRESSION, workers=DEFAULT_WORKERS,
+                 chunk_size=COMPRESSION_CHUNK_SIZE):
+        if codec not in COMPRESSORS:
+            raise ValueError(f"Неизвестный алгоритм сжатия: {codec}")
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self.window = 2 * workers
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.file = open(path, 'wb')
+        self.file.write(COMPRESSED_MAGIC + COMPRESSED_HEADER.pack(codec.encode(), chunk_size))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backup-compress')
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._submit(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+
+    def _submit(self, chunk):
+        self.pending.append(self.executor.submit(_compress_chunk, self.codec, chunk))
+        while len(self.pending) >= self.window:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        try:
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_container_header(f, path):
+    """Проверяет заголовок сжатого файла и возвращает алгоритм сжатия."""
+    if f.read(len(COMPRESSED_MAGIC)) != COMPRESSED_MAGIC:
+        raise ValueError(f"Неверный формат сжатого бэкапа: {path}")
+    codec, _ = COMPRESSED_HEADER.unpack(f.read(COMPRESSED_HEADER.size))
+    return codec.rstrip(b'\0').decode()
+
+
+def _read_chunk_records(f):
+    """Читает из файла фрагменты: (исходный размер, сжатые данные, SHA-256)."""
+    while True:
+        header = f.read(CHUNK_HEADER.size)
+        if not header:
+            return
+        if len(header) < CHUNK_HEADER.size:
+            raise ValueError("Сжатый бэкап обрезан")
+        raw_size, packed_size, digest = CHUNK_HEADER.unpack(header)
+        packed = f.read(packed_size)
+        if len(packed) < packed_size:
+            raise ValueError("Сжатый бэкап обрезан")
+        yield raw_size, packed, digest
+
+
+class CompressedReader:
+    """
+    Чтение сжатого бэкапа: фрагменты распаковываются в пуле потоков с опережением,
+    у каждого проверяется SHA-256.
+    """
+
+    def __init__(self, path, workers=DEFAULT_WORKERS):
+        self.path = path
+        self.window = 2 * workers
+        self.pending = deque()
+        self.number = 0
+        self.buffer = b''
+        self.position = 0
+        self.records = self._records()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backup-decompress')
+
+    def _records(self):
+        """Фрагменты по порядку: (алгоритм, исходный размер, сжатые данные, SHA-256)."""
+        with open(self.path, 'rb') as f:
+            codec = _read_container_header(f, self.path)
+            for raw_size, packed, digest in _read_chunk_records(f):
+                yield codec, raw_size, packed, digest
+
+    def _fill(self):
+        while len(self.pending) < self.window:
+            record = next(self.records, None)
+            if record is None:
+                return
+            codec, raw_size, packed, digest = record
+            self.pending.append(self.executor.submit(
+                _decompress_chunk, codec, packed, raw_size, digest, self.number
+            ))
+            self.number += 1
+
+    def read(self, size=-1):
+        result = bytearray()
+        while size < 0 or len(result) < size:
+            if self.position >= len(self.buffer):
+                self._fill()
+                if not self.pending:
+                    break
+                self.buffer = self.pending.popleft().result()
+                self.position = 0
+            available = len(self.buffer) - self.position
+            take = available if size < 0 else min(size - len(result), available)
+            result += self.buffer[self.position:self.position + take]
+            self.position += take
+        return bytes(result)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# --- Репозиторий с дедупликацией ---
+def content_defined_chunks(hashes):
+    """
+    Делит страницы снимка на фрагменты по содержимому.
+
+    Фрагмент заканчивается на странице, хеш которой делится на REPOSITORY_AVG_PAGES
+    (но не короче REPOSITORY_MIN_PAGES и не длиннее REPOSITORY_MAX_PAGES страниц).
+    Граница зависит от содержимого, а не от смещения, поэтому вставка или удаление
+    страниц меняет только соседние фрагменты, а не все последующие.
+
+    Args:
+        hashes (bytes): Хеши страниц (hash_pages)
+
+    Returns:
+        list: Пары (первая страница, число страниц)
+    """
+    page_count = len(hashes) // HASH_SIZE
+    chunks = []
+    first = 0
+    for number in range(page_count):
+        length = number - first + 1
+        digest = hashes[number * HASH_SIZE:number * HASH_SIZE + 4]
+        boundary = int.from_bytes(digest, 'big') % REPOSITORY_AVG_PAGES == 0
+        if (boundary and length >= REPOSITORY_MIN_PAGES) or length >= REPOSITORY_MAX_PAGES:
+            chunks.append((first, length))
+            first = number + 1
+    if first < page_count:
+        chunks.append((first, page_count - first))
+    return chunks
+
+
+def _chunk_path(digest, repository_dir=REPOSITORY_DIR):
+    return os.path.join(repository_dir, 'chunks', digest[:2], digest)
+
+
+def _write_chunk(path, codec, data):
+    """Сохраняет фрагмент в репозиторий: сжатый файл из одного фрагмента."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, 'wb') as f:
+        f.write(COMPRESSED_MAGIC + COMPRESSED_HEADER.pack(codec.encode(), len(data)))
+        f.write(_compress_chunk(codec, data))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def store_in_repository(snapshot_path, manifest_path, page_size, hashes, codec, workers,
+                        repository_dir=REPOSITORY_DIR):
+    """
+    Сохраняет снимок в репозиторий: новые фрагменты сжимаются и записываются
+    параллельно, уже имеющиеся только упоминаются в манифесте.
+
+    Returns:
+        dict: Статистика - всего фрагментов, новых фрагментов и записано байт
+    """
+    chunks = []
+    stored = set()
+    new_chunks = 0
+    written = 0
+    pending = deque()
+    with open(snapshot_path, 'rb') as src, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backup-chunks') as executor:
+        for first, count in content_defined_chunks(hashes):
+            src.seek(first * page_size)
+            data = src.read(count * page_size)
+            digest = hashlib.sha256(data).hexdigest()
+            chunks.append([digest, len(data)])
+            path = _chunk_path(digest, repository_dir)
+            if digest in stored or os.path.exists(path):
+                continue
+            stored.add(digest)
+            new_chunks += 1
+            pending.append(executor.submit(_write_chunk, path, codec, data))
+            while len(pending) >= 2 * workers:
+                written += pending.popleft().result()
+        while pending:
+            written += pending.popleft().result()
+
+    manifest = {
+        "page_size": page_size,
+        "page_count": len(hashes) // HASH_SIZE,
+        "chunks": chunks
+    }
+    tmp_path = f"{manifest_path}.part"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    return {"chunks": len(chunks), "new_chunks": new_chunks, "written": written}
+
+
+class RepositoryReader(CompressedReader):
+    """Собирает снимок из фрагментов репозитория по манифесту."""
+
+    def __init__(self, manifest_path, workers=DEFAULT_WORKERS, repository_dir=REPOSITORY_DIR):
+        self.repository_dir = repository_dir
+        super().__init__(manifest_path, workers)
+
+    def _records(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        for digest, _ in manifest['chunks']:
+            path = _chunk_path(digest, self.repository_dir)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"В репозитории нет фрагмента {digest}")
+            with open(path, 'rb') as chunk:
+                codec = _read_container_header(chunk, path)
+                for raw_size, packed, chunk_digest in _read_chunk_records(chunk):
+                    if chunk_digest.hex() != digest:
+                        raise ValueError(f"Фрагмент {digest} не соответствует своему имени")
+                    yield codec, raw_size, packed, chunk_digest
+
+
+@exclusive
+def collect_repository_garbage(repository_dir=REPOSITORY_DIR):
+    """
+    Удаляет из репозитория фрагменты, на которые не ссылается ни один манифест
+    из журнала бэкапов, и манифесты, которых в журнале уже нет.
+
+    Returns:
+        tuple: (success, msg) где success - bool, msg - строка с результатом
+    """
+    ensure_backup_dirs()
+    with _repository_lock:
+        manifests = {
+            os.path.normpath(entry['path']) for entry in read_backup_log()
+            if entry.get('storage') == 'repository' and os.path.exists(entry['path'])
+        }
+        referenced = set()
+        try:
+            for path in manifests:
+                with open(path, 'r', encoding='utf-8') as f:
+                    referenced.update(digest for digest, _ in json.load(f)['chunks'])
+        except (OSError, ValueError) as e:
+            # Без полного списка ссылок удалять ничего нельзя
+            return False, f"❌ Не удалось прочитать манифест {path}: {e}"
+
+        removed = 0
+        freed = 0
+        manifests_dir = os.path.join(repository_dir, 'manifests')
+        for name in os.listdir(manifests_dir):
+            path = os.path.normpath(os.path.join(manifests_dir, name))
+            base = path[:-len(HASHES_SUFFIX)] if path.endswith(HASHES_SUFFIX) else path
+            if base not in manifests:
+                os.remove(path)
+
+        chunks_dir = os.path.join(repository_dir, 'chunks')
+        for prefix in os.listdir(chunks_dir):
+            for name in os.listdir(os.path.join(chunks_dir, prefix)):
+                if name not in referenced:
+                    path = os.path.join(chunks_dir, prefix, name)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+
+    return True, f"✅ Сборка мусора: удалено фрагментов {removed}, освобождено {freed / (1024 * 1024):.1f} МБ"
+
+
+def open_backup_file(entry, workers=DEFAULT_WORKERS):
+    """Открывает файл бэкапа на чтение, распаковывая его, если он сжат."""
+    if entry.get('storage') == 'repository':
+        return RepositoryReader(entry['path'], workers)
+    if entry.get('compression'):
+        return CompressedReader(entry['path'], workers)
+    return open(entry['path'], 'rb')
+
+
+def create_backup_file(path, compression=None, workers=DEFAULT_WORKERS):
+    """Открывает файл бэкапа на запись, со сжатием или без."""
+    if compression:
+        return CompressedWriter(path, compression, workers)
+    return open(path, 'wb')
+
+
+def backup_chain(entry):
+    """
+    Возвращает цепочку бэкапов от полного до entry включительно.
+
+    Raises:
+        ValueError: Если в журнале нет одного из родительских бэкапов
+    """
+    chain = [entry]
+    while chain[-1].get('parent'):
+        parent = get_backup_by_filename(chain[-1]['parent'])
+        if parent is None:
+            raise ValueError(f"В журнале нет родительского бэкапа {chain[-1]['parent']}")
+        chain.append(parent)
+    return list(reversed(chain))
+
+
+def backup_files(entry):
+    """
+    Файлы бэкапа: файл или манифест, хеши страниц и, для бэкапа
+    в репозитории, фрагменты из манифеста. Манифест идёт после фрагментов.
+    """
+    files = []
+    if entry.get('storage') == 'repository':
+        with open(entry['path'], 'r', encoding='utf-8') as f:
+            files.extend(dict.fromkeys(_chunk_path(digest) for digest, _ in json.load(f)['chunks']))
+    files.append(entry['path'])
+    if os.path.exists(entry['path'] + HASHES_SUFFIX):
+        files.append(entry['path'] + HASHES_SUFFIX)
+    return files
+
+
+def build_database(entry, target_path, workers=DEFAULT_WORKERS):
+    """
+    Собирает файл базы из цепочки: копия полного бэкапа, затем по порядку
+    изменения инкрементальных и дифференциальных бэкапов.
+    """
+    chain = backup_chain(entry)
+    with open_backup_file(chain[0], workers) as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COMPRESSION_CHUNK_SIZE)
+    for item in chain[1:]:
+        with open_backup_file(item, workers) as src:
+            apply_delta(src, target_path)
+
+
+def _compression_details(compression, raw_size, backup_path, started):
+    """Поля записи журнала о размере, степени сжатия и скорости бэкапа."""
+    elapsed = time.perf_counter() - started
+    return {
+        "compression": compression or None,
+        "raw_size": raw_size,
+        "size": os.path.getsize(backup_path),
+        "elapsed": round(elapsed, 3),
+        # Контрольная сумма файла: проверка находит повреждение без распаковки
+        "sha256": file_sha256(backup_path)
+    }
+
+
+def _describe(details):
+    """Краткое описание размера и скорости бэкапа для сообщения."""
+    mb = details['raw_size'] / (1024 * 1024)
+    speed = mb / details['elapsed'] if details['elapsed'] else 0.0
+    ratio = details['raw_size'] / details['size'] if details['size'] else 0.0
+    return f"{mb:.1f} МБ, сжатие {ratio:.1f}x, {speed:.1f} МБ/с, {details['elapsed']:.1f} с"
+
+
+def _page_backup(backup_type, parent, db_path, backup_dir, pages, pause, compression, workers):
+    """
+    Делает снимок базы и сохраняет только страницы, изменённые относительно parent.
+
+    Returns:
+        tuple: (success, msg)
+    """
+    timestamp = get_timestamp()
+    filename = f"{backup_type}_{timestamp}.delta" + (COMPRESSED_SUFFIX if compression else '')
+    backup_path = os.path.join(backup_dir, filename)
+    snapshot_path = os.path.join(backup_dir, f"{backup_type}_{timestamp}.snapshot")
+
+    started = time.perf_counter()
+    try:
+        snapshot = _snapshot(db_path, snapshot_path, pages, pause)
+        page_size = read_page_size(snapshot_path)
+        hashes = hash_pages(snapshot_path, page_size)
+        parent_hashes = load_page_hashes(parent)
+        if page_size != (parent.get('page_size') or read_page_size(parent['path'])):
+            # После VACUUM с другим размером страницы сохраняется всё
+            parent_hashes = b''
+        numbers = changed_pages(hashes, parent_hashes)
+        if not numbers:
+            return False, None
+        page_count = len(hashes) // HASH_SIZE
+        with create_backup_file(backup_path, compression, workers) as dst:
+            raw_size = write_delta(snapshot_path, dst, page_size, page_count, numbers)
+    except Exception:
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        raise
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+    save_page_hashes(backup_path, hashes)
+    details = _compression_details(compression, raw_size, backup_path, started)
+    log_backup(backup_type, filename, backup_path,
+               parent=parent['filename'],
+               page_size=page_size,
+               page_count=page_count,
+               changed_pages=len(numbers),
+               **snapshot,
+               **details)
+    return True, f"{backup_path}: {len(numbers)} из {page_count} страниц ({_describe(details)})"
+
+
+def _full_backup_to_repository(snapshot_path, timestamp, page_size, hashes, compression, workers, started,
+                               snapshot):
+    """Сохраняет снимок полного бэкапа в репозиторий с дедупликацией."""
+    filename = f"full_{timestamp}.manifest.json"
+    manifest_path = os.path.join(REPOSITORY_DIR, 'manifests', filename)
+    raw_size = os.path.getsize(snapshot_path)
+
+    with _repository_lock:
+        stats = store_in_repository(snapshot_path, manifest_path, page_size, hashes,
+                                    compression or 'none', workers)
+        save_page_hashes(manifest_path, hashes)
+        elapsed = time.perf_counter() - started
+        log_backup('full', filename, manifest_path,
+                   storage='repository',
+                   page_size=page_size,
+                   page_count=len(hashes) // HASH_SIZE,
+                   compression=compression or None,
+                   raw_size=raw_size,
+                   size=stats['written'],
+                   elapsed=round(elapsed, 3),
+                   chunks=stats['chunks'],
+                   new_chunks=stats['new_chunks'],
+                   **snapshot)
+
+    return True, (f"✅ Полный бэкап сохранён в репозиторий: {manifest_path} "
+                  f"(новых фрагментов {stats['new_chunks']} из {stats['chunks']}, "
+                  f"записано {stats['written'] / (1024 * 1024):.1f} МБ из {raw_size / (1024 * 1024):.1f} МБ, "
+                  f"{elapsed:.1f} с)")
+
+
+@exclusive
+def full_backup(db_path=DEFAULT_DB_PATH, backup_dir="backups/full",
+                pages=DEFAULT_PAGES_PER_STEP, pause=DEFAULT_STEP_PAUSE,
+                compression=DEFAULT_COMPRESSION, workers=DEFAULT_WORKERS, storage='files'):
     """
     Создаёт полную резервную копию базы данных.
 
     Args:
         db_path (str): Путь к файлу базы данных
         backup_dir (str): Директория для сохранения бэкапа
+        pages (int): Страниц за один шаг онлайн-копирования
+        pause (float): Пауза между шагами в секундах
+        compression (str): Алгоритм сжатия ('zlib', 'lzma') или None
+        workers (int): Потоков для сжатия
+        storage (str): 'files' - отдельный файл, 'repository' - фрагменты
+            в репозитории с дедупликацией и манифест
 
     Returns:
         tuple: (success, msg) где success - bool, msg - строка с результатом
@@ -133,30 +1042,66 @@ def full_backup(db_path=DEFAULT_DB_PATH, backup_dir="backups/full"):
 
     # Создаём имя файла
     timestamp = get_timestamp()
-    filename = f"full_{timestamp}.db"
+    filename = f"full_{timestamp}.db" + (COMPRESSED_SUFFIX if compression else '')
     backup_path = os.path.join(backup_dir, filename)
+    snapshot_path = os.path.join(backup_dir, f"full_{timestamp}.snapshot")
 
+    started = time.perf_counter()
     try:
-        # Копируем файл
-        shutil.copy2(db_path, backup_path)
-        msg = f"✅ Полный бэкап создан: {backup_path}"
+        # Копируем базу онлайн, не останавливая запись
+        snapshot = _snapshot(db_path, snapshot_path, pages, pause)
+
+        # Хеши страниц - основа для следующих инкрементальных и дифференциальных бэкапов
+        page_size = read_page_size(snapshot_path)
+        hashes = hash_pages(snapshot_path, page_size)
+        raw_size = os.path.getsize(snapshot_path)
+
+        if storage == 'repository':
+            return _full_backup_to_repository(snapshot_path, timestamp, page_size, hashes,
+                                              compression, workers, started, snapshot)
+
+        if compression:
+            with open(snapshot_path, 'rb') as src, CompressedWriter(backup_path, compression, workers) as dst:
+                shutil.copyfileobj(src, dst, COMPRESSION_CHUNK_SIZE)
+        else:
+            os.replace(snapshot_path, backup_path)
+        save_page_hashes(backup_path, hashes)
+
+        details = _compression_details(compression, raw_size, backup_path, started)
+        msg = f"✅ Полный бэкап создан: {backup_path} ({_describe(details)})"
 
         # Логируем
-        log_backup('full', filename, backup_path)
+        log_backup('full', filename, backup_path,
+                   page_size=page_size,
+                   page_count=len(hashes) // HASH_SIZE,
+                   **snapshot,
+                   **details)
 
         return True, msg
     except Exception as e:
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
         return False, f"❌ Ошибка при создании полного бэкапа: {e}"
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
 
 
-def incremental_backup(db_path=DEFAULT_DB_PATH, last_backup_time=None, backup_dir="backups/incremental"):
+@exclusive
+def incremental_backup(db_path=DEFAULT_DB_PATH, backup_dir="backups/incremental",
+                       pages=DEFAULT_PAGES_PER_STEP, pause=DEFAULT_STEP_PAUSE,
+                       compression=DEFAULT_COMPRESSION, workers=DEFAULT_WORKERS):
     """
-    Создаёт инкрементальную резервную копию, если файл БД изменился.
+    Создаёт инкрементальную резервную копию: сохраняет только страницы,
+    изменённые с момента последнего бэкапа любого типа.
 
     Args:
         db_path (str): Путь к файлу базы данных
-        last_backup_time (float): Время последнего бэкапа (Unix timestamp)
         backup_dir (str): Директория для сохранения бэкапа
+        pages (int): Страниц за один шаг онлайн-копирования
+        pause (float): Пауза между шагами в секундах
+        compression (str): Алгоритм сжатия ('zlib', 'lzma') или None
+        workers (int): Потоков для сжатия
 
     Returns:
         tuple: (success, msg) где success - bool, msg - строка с результатом
@@ -167,46 +1112,39 @@ def incremental_backup(db_path=DEFAULT_DB_PATH, last_backup_time=None, backup_di
     if not os.path.exists(db_path):
         return False, f"❌ Файл базы данных не найден: {db_path}"
 
-    # Если время не указано, получаем время последнего бэкапа из лога
-    if last_backup_time is None:
-        last_backup_time = get_last_backup_time()
+    # Родитель - последний бэкап любого типа
+    parent = get_last_backup()
 
     # Если нет информации о предыдущих бэкапах, предлагаем сделать полный
-    if last_backup_time is None:
+    if parent is None:
         return False, "ℹ️  Нет информации о предыдущих бэкапах. Рекомендуется сначала сделать полный бэкап."
 
-    # Получаем время модификации файла БД
-    db_mtime = os.path.getmtime(db_path)
-
-    # Сравниваем с временем последнего бэкапа
-    if db_mtime <= last_backup_time:
-        return False, "ℹ️  База данных не изменялась с момента последнего бэкапа."
-
-    # Создаём инкрементальный бэкап
-    timestamp = get_timestamp()
-    filename = f"incremental_{timestamp}.db"
-    backup_path = os.path.join(backup_dir, filename)
-
     try:
-        shutil.copy2(db_path, backup_path)
-        msg = f"✅ Инкрементальный бэкап создан: {backup_path}"
-
-        # Логируем
-        log_backup('incremental', filename, backup_path)
-
-        return True, msg
+        success, details = _page_backup('incremental', parent, db_path, backup_dir, pages, pause,
+                                       compression, workers)
     except Exception as e:
         return False, f"❌ Ошибка при создании инкрементального бэкапа: {e}"
 
+    if not success:
+        return False, "ℹ️  База данных не изменялась с момента последнего бэкапа."
+    return True, f"✅ Инкрементальный бэкап создан: {details}"
+
 
-def differential_backup(db_path=DEFAULT_DB_PATH, last_full_backup_time=None, backup_dir="backups/differential"):
+@exclusive
+def differential_backup(db_path=DEFAULT_DB_PATH, backup_dir="backups/differential",
+                        pages=DEFAULT_PAGES_PER_STEP, pause=DEFAULT_STEP_PAUSE,
+                        compression=DEFAULT_COMPRESSION, workers=DEFAULT_WORKERS):
     """
-    Создаёт дифференциальную резервную копию.
+    Создаёт дифференциальную резервную копию: сохраняет только страницы,
+    изменённые с момента последнего полного бэкапа.
 
     Args:
         db_path (str): Путь к файлу базы данных
-        last_full_backup_time (float): Время последнего полного бэкапа (Unix timestamp)
         backup_dir (str): Директория для сохранения бэкапа
+        pages (int): Страниц за один шаг онлайн-копирования
+        pause (float): Пауза между шагами в секундах
+        compression (str): Алгоритм сжатия ('zlib', 'lzma') или None
+        workers (int): Потоков для сжатия
 
     Returns:
         tuple: (success, msg) где success - bool, msg - строка с результатом
@@ -217,45 +1155,72 @@ def differential_backup(db_path=DEFAULT_DB_PATH, last_full_backup_time=None, bac
     if not os.path.exists(db_path):
         return False, f"❌ Файл базы данных не найден: {db_path}"
 
-    # Если время не указано, получаем время последнего полного бэкапа из лога
-    if last_full_backup_time is None:
-        last_full_backup_time = get_last_full_backup_time()
+    # Родитель - последний полный бэкап
+    parent = get_last_backup('full')
 
     # Проверяем наличие полного бэкапа
-    if last_full_backup_time is None:
+    if parent is None:
         return False, "ℹ️  Нет информации о полных бэкапах. Сначала сделайте полный бэкап."
 
-    # Получаем время модификации файла БД
-    db_mtime = os.path.getmtime(db_path)
+    try:
+        success, details = _page_backup('differential', parent, db_path, backup_dir, pages, pause,
+                                       compression, workers)
+    except Exception as e:
+        return False, f"❌ Ошибка при создании дифференциального бэкапа: {e}"
 
-    # Сравниваем с временем последнего полного бэкапа
-    if db_mtime <= last_full_backup_time:
+    if not success:
         return False, "ℹ️  База данных не изменялась с момента последнего полного бэкапа."
+    return True, f"✅ Дифференциальный бэкап создан: {details}"
 
-    # Создаём дифференциальный бэкап
-    timestamp = get_timestamp()
-    filename = f"differential_{timestamp}.db"
-    backup_path = os.path.join(backup_dir, filename)
 
-    try:
-        shutil.copy2(db_path, backup_path)
-        msg = f"✅ Дифференциальный бэкап создан: {backup_path}"
+def _install_database(restored_path, db_path, quiesce=None):
+    """
+    Сохраняет копию текущей базы и записывает собранную базу в рабочую.
 
-        # Логируем
-        log_backup('differential', filename, backup_path)
+    Returns:
+        tuple: (сообщение о копии текущей базы, длительность простоя в секундах)
+    """
+    # Если файл БД существует, сохраняем копию текущей БД
+    if os.path.exists(db_path):
+        bak_path = f"{db_path}.bak_{get_timestamp()}"
+        online_copy(db_path, bak_path, pause=0)
+        backup_msg = f"ℹ️  Текущая БД сохранена в: {bak_path}"
+    else:
+        backup_msg = ""
+
+    with (quiesce or nullcontext)():
+        # После восстановления у базы новая история: архив WAL начинает новую линию времени
+        start_wal_timeline()
+        elapsed = copy_into_database(restored_path, db_path)
+    return backup_msg, elapsed
+
+
+@exclusive
+def restore_backup(backup_file_path, db_path=DEFAULT_DB_PATH, workers=DEFAULT_WORKERS, quiesce=None,
+                   check='quick'):
+    """
+    Восстанавливает базу данных из резервной копии.
 
-        return True, msg
-    except Exception as e:
-        return False, f"❌ Ошибка при создании дифференциального бэкапа: {e}"
+    Для инкрементального и дифференциального бэкапа база собирается
+    из цепочки: полный бэкап и изменения всех бэкапов до выбранного.
+    Сжатые бэкапы распаковываются параллельно с проверкой контрольных сумм.
 
+    Бэкап, не прошедший проверку (verify_backups), не восстанавливается.
+    Собранная база проверяется до записи в рабочую так же, как при
+    проверке бэкапов, поэтому повреждённая копия рабочую базу не затрёт.
 
-def restore_backup(backup_file_path, db_path=DEFAULT_DB_PATH):
-    """
-    Восстанавливает базу данных из резервной копии.
+    Сборка и сохранение текущей базы идут, пока приложение работает.
+    Работа с базой приостанавливается (quiesce) только на время записи
+    собранной базы в рабочую через API резервного копирования SQLite,
+    поэтому перезапуск приложения не нужен.
 
     Args:
         backup_file_path (str): Путь к файлу резервной копии
         db_path (str): Путь к файлу базы данных для восстановления
+        workers (int): Потоков для распаковки
+        quiesce (callable): Фабрика контекстного менеджера, который
+            приостанавливает работу приложения с базой
+        check (str): Проверка собранной базы: 'quick', 'full' или None
 
     Returns:
         tuple: (success, msg) где success - bool, msg - строка с результатом
@@ -264,23 +1229,695 @@ def restore_backup(backup_file_path, db_path=DEFAULT_DB_PATH):
     if not os.path.exists(backup_file_path):
         return False, f"❌ Файл резервной копии не найден: {backup_file_path}"
 
-    try:
-        # Если файл БД существует, создаём резервную копию текущей БД
-        if os.path.exists(db_path):
-            bak_timestamp = get_timestamp()
-            bak_path = f"{db_path}.bak_{bak_timestamp}"
-            shutil.move(db_path, bak_path)
-            backup_msg = f"ℹ️  Текущая БД перемещена в: {bak_path}"
-        else:
-            backup_msg = ""
+    entry = get_backup_by_path(backup_file_path)
+    if entry is None:
+        entry = {"filename": os.path.basename(backup_file_path), "path": backup_file_path}
 
-        # Восстанавливаем из бэкапа
-        shutil.copy2(backup_file_path, db_path)
-        restore_msg = f"✅ База данных восстановлена из: {backup_file_path}"
+    verification = entry.get('verification') or {}
+    if verification.get('status') == 'failed':
+        return False, (f"❌ Бэкап не прошёл проверку {verification['checked_at'][:16]}: "
+                       f"{'; '.join(verification['errors'])}. Проверьте его заново, если файлы исправлены.")
+    warning = "" if verification else "⚠️  Бэкап не проверялся заранее, собранная база проверена перед восстановлением."
+
+    restored_path = f"{db_path}.restore"
+    try:
+        started = time.perf_counter()
+        errors = []
+        for item in backup_chain(entry):
+            errors += _check_file(item)
+        if not errors:
+            build_database(entry, restored_path, workers)
+            errors = _check_database(restored_path, entry, check)
+        if 'id' in entry:
+            update_backup_entry(entry['id'], verification=_verification(check, errors,
+                                                                        time.perf_counter() - started))
+        if errors:
+            return False, f"❌ Бэкап повреждён, база не восстановлена: {'; '.join(errors)}"
+
+        backup_msg, elapsed = _install_database(restored_path, db_path, quiesce)
+        restore_msg = f"✅ База данных восстановлена из: {backup_file_path} (простой {elapsed:.2f} с)"
 
         # Объединяем сообщения
-        full_msg = f"{backup_msg} {restore_msg}".strip()
+        full_msg = f"{warning} {backup_msg} {restore_msg}".strip()
 
         return True, full_msg
     except Exception as e:
-        return False, f"❌ Ошибка при восстановлении: {e}"
\ No newline at end of file
+        return False, f"❌ Ошибка при восстановлении: {e}"
+    finally:
+        if os.path.exists(restored_path):
+            os.remove(restored_path)
+
+
+# --- Проверка ---
+# Режимы проверки: PRAGMA quick_check (быстрее, без сверки индексов с таблицами)
+# или полный integrity_check
+VERIFY_PRAGMAS = {'quick': 'quick_check', 'full': 'integrity_check'}
+# Сколько сообщений PRAGMA сохранять в журнале
+VERIFY_MAX_ERRORS = 5
+
+
+def _verification(mode, errors, elapsed):
+    """Результат проверки в том виде, в каком он хранится в журнале."""
+    return {
+        "status": "failed" if errors else "ok",
+        "mode": mode,
+        "checked_at": get_iso_timestamp(),
+        "errors": errors,
+        "elapsed": round(elapsed, 3)
+    }
+
+
+def _check_file(entry):
+    """Сверяет файл бэкапа с контрольной суммой из журнала."""
+    if not os.path.exists(entry['path']):
+        return [f"Нет файла {entry['path']}"]
+    if entry.get('sha256') and file_sha256(entry['path']) != entry['sha256']:
+        return [f"Контрольная сумма файла {entry['filename']} не совпадает"]
+    return []
+
+
+def _check_database(path, entry, mode):
+    """
+    Проверяет собранную из бэкапа базу: хеши страниц должны совпасть
+    с сохранёнными при бэкапе, PRAGMA quick_check/integrity_check - вернуть ok.
+    """
+    errors = []
+    if os.path.exists(entry['path'] + HASHES_SUFFIX):
+        with open(entry['path'] + HASHES_SUFFIX, 'rb') as f:
+            expected = f.read()
+        if hash_pages(path, read_page_size(path)) != expected:
+            errors.append(f"Страницы собранной базы не совпадают с бэкапом {entry['filename']}")
+    return errors + _integrity_errors(path, mode)
+
+
+def _integrity_errors(path, mode):
+    """Сообщения PRAGMA quick_check/integrity_check или пустой список, если база исправна."""
+    if not mode:
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute(f"PRAGMA {VERIFY_PRAGMAS[mode]}({VERIFY_MAX_ERRORS})")]
+    finally:
+        conn.close()
+    return [] if rows == ['ok'] else rows
+
+
+def _verify_tree(entries, check_ids, mode, temp_dir):
+    """
+    Проверяет бэкапы одного полного бэкапа и его потомков (выполняется
+    в отдельном процессе). База собирается один раз: каждый бэкап цепочки
+    применяется к состоянию родителя, а не собирается заново от полного.
+
+    Args:
+        entries (list): Записи журнала: полный бэкап и нужные потомки
+        check_ids (set): id бэкапов, для которых нужен результат
+        mode (str): 'quick' или 'full'
+        temp_dir (str): Каталог для временных файлов
+
+    Returns:
+        dict: id -> результат проверки
+    """
+    children = defaultdict(list)
+    for entry in sorted(entries, key=lambda item: item['id']):
+        children[entry.get('parent')].append(entry)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='verify_', dir=temp_dir) as tmp:
+        counter = iter(range(len(entries) + 1))
+        # В стеке: бэкап, файл с состоянием его родителя, ошибка родителя
+        stack = [(root, os.path.join(tmp, f"{next(counter)}.db"), None) for root in children[None]]
+        while stack:
+            entry, state_path, parent_error = stack.pop()
+            started = time.perf_counter()
+            errors = [parent_error] if parent_error else _check_file(entry)
+            if not errors:
+                try:
+                    with open_backup_file(entry, workers=1) as src:
+                        if entry.get('parent'):
+                            apply_delta(src, state_path)
+                        else:
+                            with open(state_path, 'wb') as dst:
+                                shutil.copyfileobj(src, dst, COMPRESSION_CHUNK_SIZE)
+                    errors = _check_database(state_path, entry, mode if entry['id'] in check_ids else None)
+                except Exception as e:
+                    errors = [str(e)]
+            if entry['id'] in check_ids:
+                results[entry['id']] = _verification(mode, errors, time.perf_counter() - started)
+
+            error = f"Родительский бэкап {entry['filename']} не прошёл проверку" if errors else None
+            kids = children[entry['filename']]
+            for number, child in enumerate(kids):
+                child_path = state_path
+                if number < len(kids) - 1 and not errors:
+                    # Ветвление цепочки: у каждого потомка своя копия состояния
+                    child_path = os.path.join(tmp, f"{next(counter)}.db")
+                    shutil.copyfile(state_path, child_path)
+                stack.append((child, child_path, error))
+    return results
+
+
+@exclusive
+def verify_backups(backup_ids=None, mode='quick', workers=DEFAULT_WORKERS, only_unverified=False):
+    """
+    Проверяет, что бэкапы восстанавливаются: сверяет контрольные суммы файлов,
+    собирает базу по цепочке, сверяет хеши страниц и выполняет PRAGMA
+    quick_check или integrity_check. Цепочки разных полных бэкапов
+    проверяются параллельно в пуле процессов. Результаты записываются в журнал.
+
+    Args:
+        backup_ids (list): id бэкапов или None для всех
+        mode (str): 'quick' или 'full'
+        workers (int): Число процессов
+        only_unverified (bool): Проверять только ещё не проверенные бэкапы
+
+    Returns:
+        tuple: (success, msg) где success - bool, msg - строка с результатом
+    """
+    if mode not in VERIFY_PRAGMAS:
+        return False, f"❌ Неизвестный режим проверки: {mode}"
+
+    started = time.perf_counter()
+    entries = read_backup_log()
+    by_filename = {entry['filename']: entry for entry in entries}
+    targets = [
+        entry for entry in entries
+        if (backup_ids is None or entry['id'] in backup_ids)
+        and not (only_unverified and entry.get('verification'))
+    ]
+    if not targets:
+        return True, "ℹ️  Нет бэкапов для проверки."
+
+    # Группируем по полному бэкапу, с которого начинается цепочка
+    trees = defaultdict(dict)
+    check_ids = defaultdict(set)
+    results = {}
+    for entry in targets:
+        chain = [entry]
+        while chain[-1].get('parent') in by_filename:
+            chain.append(by_filename[chain[-1]['parent']])
+        if chain[-1].get('parent'):
+            results[entry['id']] = _verification(mode, [f"В журнале нет родительского бэкапа {chain[-1]['parent']}"], 0.0)
+            continue
+        root = chain[-1]['id']
+        trees[root].update((item['id'], item) for item in chain)
+        check_ids[root].add(entry['id'])
+
+    if trees:
+        # spawn: пул запускается и из многопоточного веб-приложения
+        context = multiprocessing.get_context('spawn')
+        roots = sorted(trees, key=lambda root: len(trees[root]), reverse=True)
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(roots))), mp_context=context) as pool:
+            futures = [
+                pool.submit(_verify_tree, list(trees[root].values()), check_ids[root], mode, 'backups')
+                for root in roots
+            ]
+            for future in futures:
+                results.update(future.result())
+
+    for backup_id, result in results.items():
+        update_backup_entry(backup_id, verification=result)
+
+    failed = sum(1 for result in results.values() if result['status'] == 'failed')
+    elapsed = time.perf_counter() - started
+    msg = f"проверено бэкапов: {len(results)}, с ошибками: {failed} ({elapsed:.1f} с)"
+    if failed:
+        return False, f"❌ Проверка: {msg}"
+    return True, f"✅ Проверка: {msg}"
+
+# --- Архив WAL ---
+def current_wal_timeline():
+    """Линия времени архива WAL или None, если архиватор не работает."""
+    try:
+        if time.time() - os.path.getmtime(WAL_ARCHIVER_LOCK) > WAL_ARCHIVER_STALE:
+            return None
+        with open(WAL_TIMELINE_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def start_wal_timeline():
+    """Начинает новую линию времени архива WAL и возвращает её имя."""
+    ensure_backup_dirs()
+    timeline = get_timestamp()
+    with open(WAL_TIMELINE_FILE, 'w', encoding='utf-8') as f:
+        f.write(timeline)
+    return timeline
+
+
+def _wal_checksum(data, s1, s2, big_endian):
+    """Контрольная сумма WAL: два 32-битных накопителя по парам слов данных."""
+    for x0, x1 in struct.iter_unpack('>II' if big_endian else '<II', data):
+        s1 = (s1 + x0 + s2) & 0xFFFFFFFF
+        s2 = (s2 + x1 + s1) & 0xFFFFFFFF
+    return s1, s2
+
+
+class WalArchiver:
+    """
+    Копирует кадры журнала WAL рабочей базы в сегменты архива.
+
+    Кадр попадает в сегмент, только если совпадают соль и цепочка
+    контрольных сумм журнала, и только целыми транзакциями (до кадра
+    с фиксацией). Контрольные точки делает сам архиватор под блокировкой
+    записи и только после копирования всех кадров, поэтому журнал
+    не начинается заново, пока в нём есть неотправленные кадры.
+    Автоматические контрольные точки приложения должны срабатывать реже
+    архиватора (PRAGMA wal_autocheckpoint больше checkpoint_pages). Если журнал
+    всё же начался заново без ведома архиватора, непрерывность потеряна
+    и начинается новая линия времени.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, checkpoint_pages=DEFAULT_WAL_CHECKPOINT_PAGES):
+        self.db_path = db_path
+        self.wal_path = f"{db_path}-wal"
+        self.checkpoint_pages = checkpoint_pages
+        self.timeline = None
+        self.active = False
+        self._token = None
+        self._conn = None
+        self._header = None
+        self._offset = 0
+        self._checksum = None
+        # Журнал целиком перенесён в базу архиватором и все кадры отправлены
+        self._complete = False
+
+    def acquire(self):
+        """Занимает роль архиватора; False, если архивирует другой процесс."""
+        ensure_backup_dirs()
+        try:
+            if time.time() - os.path.getmtime(WAL_ARCHIVER_LOCK) < WAL_ARCHIVER_STALE:
+                return False
+            os.remove(WAL_ARCHIVER_LOCK)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(WAL_ARCHIVER_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        self._token = f"{os.getpid()} {get_timestamp()}"
+        os.write(fd, self._token.encode())
+        os.close(fd)
+
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA wal_autocheckpoint=0")
+        self.timeline = start_wal_timeline()
+        self._header = None
+        self._complete = False
+        self.active = True
+        return True
+
+    def _still_owner(self):
+        try:
+            with open(WAL_ARCHIVER_LOCK, 'r', encoding='utf-8') as f:
+                if f.read() != self._token:
+                    return False
+        except FileNotFoundError:
+            return False
+        os.utime(WAL_ARCHIVER_LOCK)
+        return True
+
+    def ship(self):
+        """
+        Отправляет в архив новые кадры и, если журнал вырос, делает контрольную точку.
+
+        Returns:
+            int: Число отправленных кадров
+        """
+        if not self.active:
+            return 0
+        if not self._still_owner():
+            # Пока этот процесс стоял, архиватором стал другой
+            self.release(final=False)
+            return 0
+        try:
+            with open(WAL_TIMELINE_FILE, 'r', encoding='utf-8') as f:
+                timeline = f.read().strip()
+        except FileNotFoundError:
+            timeline = None
+        if timeline != self.timeline:
+            # Базу восстановили из бэкапа - архив продолжается новой линией
+            self.timeline = timeline or start_wal_timeline()
+        shipped = self._ship_frames()
+        if self._offset and (self._offset - WAL_HEADER.size) // (WAL_FRAME_HEADER.size + self._header[2]) \
+                >= self.checkpoint_pages:
+            shipped += self.checkpoint()
+        return shipped
+
+    def checkpoint(self):
+        """
+        Под блокировкой записи отправляет последние кадры и переносит журнал
+        в файл базы. Следующая запись начнёт журнал заново.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            shipped = self._ship_frames()
+            # Из соединения с открытой транзакцией контрольную точку не сделать
+            other = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                busy, log, done = other.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            finally:
+                other.close()
+            self._complete = not busy and log == done
+        finally:
+            self._conn.execute("ROLLBACK")
+        return shipped
+
+    def _ship_frames(self):
+        shipped_at = None
+        frames = bytearray()
+        count = 0
+        try:
+            f = open(self.wal_path, 'rb')
+        except FileNotFoundError:
+            return 0
+        with f:
+            header = f.read(WAL_HEADER.size)
+            if len(header) < WAL_HEADER.size:
+                return 0
+            values = WAL_HEADER.unpack(header)
+            if values[0] not in (0x377f0682, 0x377f0683):
+                return 0
+            if self._header is None or values[3:6] != self._header[3:6]:
+                # Журнал начат заново: новая соль и новая цепочка контрольных сумм
+                big_endian = values[0] & 1
+                if _wal_checksum(header[:24], 0, 0, big_endian) != values[6:8]:
+                    return 0
+                if self._header is not None and not self._complete:
+                    # Часть кадров прежнего журнала не попала в архив
+                    self.timeline = start_wal_timeline()
+                self._header = values
+                self._offset = WAL_HEADER.size
+                self._checksum = values[6:8]
+                self._complete = False
+
+            page_size = self._header[2]
+            big_endian = self._header[0] & 1
+            salts = self._header[4:6]
+            f.seek(self._offset)
+            offset = self._offset
+            checksum = committed_checksum = self._checksum
+            pending = bytearray()
+            pending_count = 0
+            while True:
+                frame_header = f.read(WAL_FRAME_HEADER.size)
+                page = f.read(page_size)
+                if len(frame_header) < WAL_FRAME_HEADER.size or len(page) < page_size:
+                    break
+                page_number, db_size, salt1, salt2, c1, c2 = WAL_FRAME_HEADER.unpack(frame_header)
+                if (salt1, salt2) != salts:
+                    break
+                next_checksum = _wal_checksum(page, *_wal_checksum(frame_header[:8], *checksum, big_endian),
+                                              big_endian)
+                if next_checksum != (c1, c2):
+                    break
+                checksum = next_checksum
+                pending += WAL_SEGMENT_FRAME.pack(page_number, db_size) + page
+                pending_count += 1
+                if db_size:
+                    # Кадр с фиксацией: транзакция целиком в журнале
+                    frames += pending
+                    count += pending_count
+                    pending = bytearray()
+                    pending_count = 0
+                    offset = f.tell()
+                    committed_checksum = checksum
+            shipped_at = get_iso_timestamp()
+
+        if not count:
+            return 0
+        self._complete = False
+        path = os.path.join(WAL_ARCHIVE_DIR, shipped_at[:10], f"{get_timestamp()}.wal")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            out.write(WAL_SEGMENT_MAGIC + WAL_SEGMENT_HEADER.pack(page_size, count))
+            out.write(zlib.compress(bytes(frames), COMPRESSION_LEVEL))
+        with _catalog() as conn:
+            conn.execute(
+                "INSERT INTO wal_segments (timeline, shipped_at, path, frames, size) VALUES (?, ?, ?, ?, ?)",
+                (self.timeline, shipped_at, path, count, os.path.getsize(path))
+            )
+        self._offset = offset
+        self._checksum = committed_checksum
+        return count
+
+    def release(self, final=True):
+        """Отправляет последние кадры (final) и освобождает роль архиватора."""
+        if not self.active:
+            return
+        try:
+            if final and self._still_owner():
+                self._ship_frames()
+                os.remove(WAL_ARCHIVER_LOCK)
+        finally:
+            self._conn.close()
+            self.active = False
+
+
+def apply_wal_segment(path, db_path):
+    """Записывает кадры сегмента архива WAL в файл базы, обрезая его при каждой фиксации."""
+    with open(path, 'rb') as f:
+        if f.read(len(WAL_SEGMENT_MAGIC)) != WAL_SEGMENT_MAGIC:
+            raise ValueError(f"Неверный формат сегмента WAL: {path}")
+        page_size, count = WAL_SEGMENT_HEADER.unpack(f.read(WAL_SEGMENT_HEADER.size))
+        try:
+            frames = zlib.decompress(f.read())
+        except zlib.error as e:
+            raise ValueError(f"Сегмент WAL {path} повреждён: {e}") from e
+    if read_page_size(db_path) != page_size:
+        raise ValueError(f"Размер страницы сегмента WAL {path} не совпадает с базой")
+
+    step = WAL_SEGMENT_FRAME.size + page_size
+    view = memoryview(frames)
+    with open(db_path, 'r+b') as dst:
+        for start in range(0, count * step, step):
+            page_number, db_size = WAL_SEGMENT_FRAME.unpack_from(frames, start)
+            dst.seek((page_number - 1) * page_size)
+            dst.write(view[start + WAL_SEGMENT_FRAME.size:start + step])
+            if db_size:
+                dst.truncate(db_size * page_size)
+
+
+def wal_segments(timeline, since, until):
+    """Сегменты линии времени, отправленные в архив в промежутке [since, until], по порядку."""
+    with _catalog() as conn:
+        return [dict(row) for row in conn.execute(
+            "SELECT * FROM wal_segments WHERE timeline = ? AND shipped_at >= ? AND shipped_at <= ? ORDER BY id",
+            (timeline, since, until)
+        )]
+
+
+def wal_archive_status():
+    """
+    Сведения об архиве WAL: работает ли архиватор, с какого и по какой
+    момент можно восстановить базу, сколько сегментов и места они занимают.
+    """
+    bases = [entry['snapshot_at'] for entry in read_backup_log() if entry.get('wal_timeline')]
+    with _catalog() as conn:
+        segments, size, latest = conn.execute(
+            "SELECT count(*), coalesce(sum(size), 0), max(shipped_at) FROM wal_segments"
+        ).fetchone()
+    return {
+        "timeline": current_wal_timeline(),
+        "earliest": min(bases) if bases else None,
+        "latest": max([latest] + bases if latest else bases) if bases else None,
+        "segments": segments,
+        "size": size,
+    }
+
+
+@exclusive
+def restore_to_time(target, db_path=DEFAULT_DB_PATH, workers=DEFAULT_WORKERS, quiesce=None, check='quick'):
+    """
+    Восстанавливает базу на момент target: собирает последний бэкап,
+    сделанный до target при работающем архиваторе, и докатывает его
+    сегментами архива WAL той же линии времени, отправленными до target.
+
+    Args:
+        target (datetime): Момент, на который нужна база
+        db_path (str): Путь к рабочей базе
+        workers (int): Потоков для распаковки
+        quiesce (callable): См. restore_backup
+        check (str): Проверка собранной базы: 'quick', 'full' или None
+
+    Returns:
+        tuple: (success, msg) где success - bool, msg - строка с результатом
+    """
+    moment = target.isoformat()
+    bases = [
+        entry for entry in read_backup_log()
+        if entry.get('wal_timeline') and entry.get('snapshot_at') and entry['snapshot_at'] <= moment
+        and (entry.get('verification') or {}).get('status') != 'failed'
+    ]
+    if not bases:
+        return False, f"ℹ️  Нет бэкапа с архивом WAL, сделанного до {target:%d.%m.%Y %H:%M:%S}."
+    base = max(bases, key=lambda entry: entry['snapshot_at'])
+    segments = wal_segments(base['wal_timeline'], base['snapshot_at'], moment)
+
+    restored_path = f"{db_path}.restore"
+    try:
+        build_database(base, restored_path, workers)
+        for segment in segments:
+            apply_wal_segment(segment['path'], restored_path)
+        errors = _integrity_errors(restored_path, check)
+        if errors:
+            return False, f"❌ Собранная база повреждена, база не восстановлена: {'; '.join(errors)}"
+
+        backup_msg, elapsed = _install_database(restored_path, db_path, quiesce)
+        recovered_at = datetime.fromisoformat(segments[-1]['shipped_at'] if segments else base['snapshot_at'])
+        restore_msg = (f"✅ База данных восстановлена на {recovered_at:%d.%m.%Y %H:%M:%S}: "
+                       f"бэкап {base['filename']} и {len(segments)} сегментов WAL (простой {elapsed:.2f} с)")
+        return True, f"{backup_msg} {restore_msg}".strip()
+    except Exception as e:
+        return False, f"❌ Ошибка при восстановлении: {e}"
+    finally:
+        if os.path.exists(restored_path):
+            os.remove(restored_path)
+
+
+# --- Хранение ---
+def select_retained(entries, daily=7, weekly=4, monthly=12):
+    """
+    Выбирает бэкапы, которые остаются по схеме «дед-отец-сын»: последний
+    бэкап каждого из daily последних дней, weekly последних недель
+    и monthly последних месяцев, в которые делались бэкапы. Вместе с ними
+    остаются самый новый и последний полный бэкап и все родители по цепочкам.
+
+    Args:
+        entries (list): Записи журнала
+        daily (int): Сколько дней хранить
+        weekly (int): Сколько недель хранить
+        monthly (int): Сколько месяцев хранить
+
+    Returns:
+        set: id записей, которые нужно сохранить
+    """
+    newest = sorted(entries, key=lambda entry: entry['id'], reverse=True)
+    keep = set()
+    periods = (
+        (daily, lambda moment: moment.date()),
+        (weekly, lambda moment: moment.isocalendar()[:2]),
+        (monthly, lambda moment: (moment.year, moment.month)),
+    )
+    for count, period in periods:
+        seen = set()
+        for entry in newest:
+            key = period(datetime.fromisoformat(entry['timestamp']))
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            keep.add(entry['id'])
+
+    if newest:
+        keep.add(newest[0]['id'])
+    last_full = next((entry for entry in newest if entry['type'] == 'full'), None)
+    if last_full is not None:
+        keep.add(last_full['id'])
+
+    # Без родителей бэкап не восстановить
+    by_id = {entry['id']: entry for entry in entries}
+    by_filename = {entry['filename']: entry for entry in entries}
+    for entry_id in list(keep):
+        entry = by_id[entry_id]
+        while entry.get('parent') in by_filename:
+            entry = by_filename[entry['parent']]
+            keep.add(entry['id'])
+    return keep
+
+
+@exclusive
+def prune_backups(daily=7, weekly=4, monthly=12):
+    """
+    Удаляет бэкапы, не попавшие в схему хранения (см. select_retained):
+    сначала запись журнала, затем файлы. Освободившиеся фрагменты
+    репозитория удаляются сборкой мусора, а сегменты WAL, которыми
+    не докатить ни один оставшийся бэкап, - вместе с записями о них.
+
+    Returns:
+        tuple: (success, msg) где success - bool, msg - строка с результатом
+    """
+    entries = read_backup_log()
+    keep = select_retained(entries, daily, weekly, monthly)
+    removed = 0
+    freed = 0
+    repository = False
+    try:
+        for entry in entries:
+            if entry['id'] in keep:
+                continue
+            delete_backup_entry(entry['id'])
+            for path in (entry['path'], entry['path'] + HASHES_SUFFIX):
+                if os.path.exists(path):
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+            repository = repository or entry.get('storage') == 'repository'
+            removed += 1
+        segments, segments_size = _prune_wal_segments([entry for entry in entries if entry['id'] in keep])
+        freed += segments_size
+    except OSError as e:
+        return False, f"❌ Ошибка при удалении старых бэкапов: {e}"
+
+    msg = (f"✅ Удалено старых бэкапов: {removed}, сегментов WAL: {segments}, "
+           f"освобождено {freed / (1024 * 1024):.1f} МБ")
+    if repository:
+        success, gc_msg = collect_repository_garbage()
+        msg = f"{msg}. {gc_msg}"
+        if not success:
+            return False, msg
+    return True, msg
+
+
+def _prune_wal_segments(kept):
+    """
+    Удаляет сегменты WAL, отправленные раньше самого старого оставшегося
+    бэкапа своей линии времени: докатывать ими нечего.
+
+    Returns:
+        tuple: (число удалённых сегментов, освобождено байт)
+    """
+    cutoff = {}
+    for entry in kept:
+        if entry.get('wal_timeline') and entry.get('snapshot_at'):
+            timeline = entry['wal_timeline']
+            cutoff[timeline] = min(cutoff.get(timeline, entry['snapshot_at']), entry['snapshot_at'])
+
+    with _catalog() as conn:
+        stale = conn.execute(
+            f"SELECT id, path, size FROM wal_segments WHERE timeline NOT IN ({', '.join('?' * len(cutoff))})",
+            tuple(cutoff)
+        ).fetchall()
+        for timeline, moment in cutoff.items():
+            stale += conn.execute(
+                "SELECT id, path, size FROM wal_segments WHERE timeline = ? AND shipped_at < ?", (timeline, moment)
+            ).fetchall()
+        conn.executemany("DELETE FROM wal_segments WHERE id = ?", [(row['id'],) for row in stale])
+
+    for row in stale:
+        if os.path.exists(row['path']):
+            os.remove(row['path'])
+    for name in os.listdir(WAL_ARCHIVE_DIR):
+        path = os.path.join(WAL_ARCHIVE_DIR, name)
+        if os.path.isdir(path) and not os.listdir(path):
+            os.rmdir(path)
+    return len(stale), sum(row['size'] for row in stale)
+
+
+def backup_disk_usage(backup_root='backups'):
+    """
+    Место, занятое бэкапами, и свободное место на диске.
+
+    Returns:
+        dict: used и free в байтах
+    """
+    ensure_backup_dirs()
+    used = 0
+    for root, _, files in os.walk(backup_root):
+        for name in files:
+            try:
+                used += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return {"used": used, "free": shutil.disk_usage(backup_root).free}
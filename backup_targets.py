@@ -0,0 +1,432 @@
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+from backup_system import backup_files, get_iso_timestamp, read_backup_log, update_backup_entry
+
+# Каталог бэкапов; ключи в хранилище - пути файлов относительно него
+BACKUP_ROOT = 'backups'
+# Незавершённые загрузки по частям: по файлу состояния на загрузку,
+# чтобы после сбоя продолжить с первой неотправленной части
+UPLOAD_STATE_DIR = 'backups/uploads'
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_UPLOAD_WORKERS = 4
+# Данные отправляются блоками такого размера, ограничение скорости - на каждый блок
+SEND_BLOCK_SIZE = 64 * 1024
+# S3 не принимает части меньше 5 МБ, кроме последней
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_NAMESPACE = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class UploadNotFound(Exception):
+    """Хранилище не знает загрузку по частям (отменена или устарела)."""
+
+
+class BandwidthLimiter:
+    """
+    Ограничивает общую скорость отправки всех потоков: каждый блок
+    занимает в расписании size / rate секунд, и поток ждёт своей очереди.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, size):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+    def blocks(self, data):
+        """Делит данные на блоки, выдавая каждый не быстрее заданной скорости."""
+        view = memoryview(data)
+        for offset in range(0, len(data), SEND_BLOCK_SIZE):
+            block = view[offset:offset + SEND_BLOCK_SIZE]
+            self.consume(len(block))
+            yield block
+
+
+class BackupTarget:
+    """
+    Хранилище копий бэкапов вне сервера.
+
+    Файл не больше одной части отправляется целиком, больший - по частям
+    в несколько потоков. Отправленные части записываются в файл состояния,
+    поэтому прерванная загрузка продолжается с того места, где остановилась.
+    Объект появляется в хранилище только после сборки всех частей.
+    Подклассы реализуют exists, _put_object и операции загрузки по частям.
+    """
+
+    min_part_size = 1
+
+    def __init__(self, part_size=DEFAULT_PART_SIZE, workers=DEFAULT_UPLOAD_WORKERS, bandwidth=0):
+        self.part_size = max(part_size, self.min_part_size)
+        self.workers = workers
+        self.limiter = BandwidthLimiter(bandwidth)
+        self.location = None
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def _put_object(self, key, data):
+        raise NotImplementedError
+
+    def _begin_upload(self, key):
+        raise NotImplementedError
+
+    def _put_part(self, key, upload_id, number, data):
+        raise NotImplementedError
+
+    def _complete_upload(self, key, upload_id, parts):
+        raise NotImplementedError
+
+    def _abort_upload(self, key, upload_id):
+        raise NotImplementedError
+
+    def upload(self, path, key):
+        """
+        Отправляет файл в хранилище под ключом key.
+
+        Returns:
+            int: Сколько байт отправлено (без частей, отправленных до прерывания)
+        """
+        size = os.path.getsize(path)
+        if size <= self.part_size:
+            with open(path, 'rb') as f:
+                self._put_object(key, f.read())
+            return size
+        try:
+            return self._upload_parts(path, key, size)
+        except UploadNotFound:
+            # Хранилище забыло загрузку - начинаем её заново
+            self._remove_state(key)
+            return self._upload_parts(path, key, size)
+
+    def _state_path(self, key):
+        name = hashlib.sha1(f"{self.location}\n{key}".encode()).hexdigest()
+        return os.path.join(UPLOAD_STATE_DIR, f"{name}.json")
+
+    def _load_state(self, path, key, size):
+        """Состояние прерванной загрузки того же файла или новая загрузка."""
+        source = {"size": size, "mtime": os.path.getmtime(path), "part_size": self.part_size}
+        try:
+            with open(self._state_path(key), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = None
+        if state is not None and state['source'] != source:
+            # Файл изменился или поменялся размер части
+            self._abort_upload(key, state['upload_id'])
+            state = None
+        if state is None:
+            state = {"key": key, "source": source, "upload_id": self._begin_upload(key), "parts": {}}
+            self._save_state(state)
+        return state
+
+    def _save_state(self, state):
+        path = self._state_path(state['key'])
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _remove_state(self, key):
+        if os.path.exists(self._state_path(key)):
+            os.remove(self._state_path(key))
+
+    def _upload_parts(self, path, key, size):
+        os.makedirs(UPLOAD_STATE_DIR, exist_ok=True)
+        state = self._load_state(path, key, size)
+        state_lock = threading.Lock()
+        count = (size + self.part_size - 1) // self.part_size
+        pending = [number for number in range(1, count + 1) if str(number) not in state['parts']]
+
+        def send(number):
+            with open(path, 'rb') as f:
+                f.seek((number - 1) * self.part_size)
+                data = f.read(self.part_size)
+            etag = self._put_part(key, state['upload_id'], number, data)
+            with state_lock:
+                state['parts'][str(number)] = etag
+                self._save_state(state)
+            return len(data)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backup-upload') as executor:
+            futures = [executor.submit(send, number) for number in pending]
+        # Ошибка одной части не отменяет остальные: отправленные пригодятся при повторе
+        sent = sum(future.result() for future in futures)
+
+        parts = sorted((int(number), etag) for number, etag in state['parts'].items())
+        self._complete_upload(key, state['upload_id'], parts)
+        self._remove_state(key)
+        return sent
+
+
+class LocalTarget(BackupTarget):
+    """
+    Каталог для копий: второй диск или смонтированный сетевой ресурс.
+    Части складываются в служебный каталог .uploads и собираются в файл
+    при завершении загрузки.
+    """
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.root = os.path.abspath(root)
+        self.location = self.root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def _upload_dir(self, upload_id):
+        return os.path.join(self.root, '.uploads', upload_id)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'wb') as f:
+            for block in self.limiter.blocks(data):
+                f.write(block)
+        os.replace(tmp_path, path)
+
+    def _put_object(self, key, data):
+        self._write(self._path(key), data)
+
+    def _begin_upload(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        return upload_id
+
+    def _put_part(self, key, upload_id, number, data):
+        if not os.path.isdir(self._upload_dir(upload_id)):
+            raise UploadNotFound(upload_id)
+        self._write(os.path.join(self._upload_dir(upload_id), str(number)), data)
+        return hashlib.sha256(data).hexdigest()
+
+    def _complete_upload(self, key, upload_id, parts):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'wb') as dst:
+            for number, etag in parts:
+                with open(os.path.join(self._upload_dir(upload_id), str(number)), 'rb') as src:
+                    data = src.read()
+                if hashlib.sha256(data).hexdigest() != etag:
+                    raise ValueError(f"Часть {number} файла {key} повреждена")
+                dst.write(data)
+        os.replace(tmp_path, path)
+        self._abort_upload(key, upload_id)
+
+    def _abort_upload(self, key, upload_id):
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+
+class S3Target(BackupTarget):
+    """
+    S3-совместимое хранилище (Amazon S3, MinIO, Ceph и др.).
+    Запросы подписываются AWS Signature V4, bucket указывается в пути,
+    поэтому подходит и локальный сервер по адресу вида http://localhost:9000.
+    """
+
+    min_part_size = S3_MIN_PART_SIZE
+
+    def __init__(self, endpoint, bucket, access_key, secret_key, region='us-east-1', prefix='', timeout=60,
+                 **kwargs):
+        super().__init__(**kwargs)
+        url = urlsplit(endpoint)
+        self.secure = url.scheme == 'https'
+        self.host = url.netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.timeout = timeout
+        self.location = f"{url.scheme}://{self.host}/{bucket}/{prefix}"
+
+    def _sign(self, method, path, query, headers, payload_hash):
+        """Добавляет к заголовкам подпись AWS Signature V4."""
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        signed = sorted(headers)
+        canonical_request = '\n'.join([
+            method, path, query,
+            ''.join(f"{name}:{headers[name].strip()}\n" for name in signed),
+            ';'.join(signed),
+            payload_hash
+        ])
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (amz_date[:8], self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={';'.join(signed)}, Signature={signature}")
+
+    def _request(self, method, key, params=None, body=b'', missing_ok=False):
+        """
+        Выполняет запрос к объекту key.
+
+        Returns:
+            tuple: (ответ http.client, тело ответа); ответ None,
+                если объекта нет и missing_ok
+
+        Raises:
+            UploadNotFound: Если хранилище не знает загрузку по частям
+            OSError: При любом другом ответе с ошибкой
+        """
+        path = '/' + quote(f"{self.bucket}/{self.prefix}{key}", safe='/~')
+        query = '&'.join(f"{quote(name, safe='~')}={quote(str(value), safe='~')}"
+                         for name, value in sorted((params or {}).items()))
+        headers = {'host': self.host, 'content-length': str(len(body))}
+        self._sign(method, path, query, headers, hashlib.sha256(body).hexdigest())
+
+        connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        conn = connection_class(self.host, timeout=self.timeout)
+        try:
+            conn.putrequest(method, f"{path}?{query}" if query else path, skip_host=True,
+                            skip_accept_encoding=True)
+            for name, value in headers.items():
+                conn.putheader(name, value)
+            conn.endheaders()
+            for block in self.limiter.blocks(body):
+                conn.send(block)
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+
+        if response.status == 404 and missing_ok:
+            return None, data
+        # CompleteMultipartUpload может вернуть ошибку в теле ответа с кодом 200
+        error = self._error_code(data) if response.status >= 300 or data.startswith(b'<?xml') else None
+        if error == 'NoSuchUpload':
+            raise UploadNotFound(params.get('uploadId') if params else None)
+        if response.status >= 300 or error:
+            raise OSError(f"S3 {method} {key}: {response.status} {error or response.reason}")
+        return response, data
+
+    @staticmethod
+    def _error_code(data):
+        try:
+            root = ElementTree.fromstring(data)
+        except ElementTree.ParseError:
+            return None
+        if root.tag.replace(S3_NAMESPACE, '') != 'Error':
+            return None
+        return root.findtext('Code')
+
+    def exists(self, key):
+        response, _ = self._request('HEAD', key, missing_ok=True)
+        return response is not None
+
+    def _put_object(self, key, data):
+        self._request('PUT', key, body=data)
+
+    def _begin_upload(self, key):
+        _, data = self._request('POST', key, {'uploads': ''})
+        return ElementTree.fromstring(data).findtext(f'{S3_NAMESPACE}UploadId')
+
+    def _put_part(self, key, upload_id, number, data):
+        response, _ = self._request('PUT', key, {'partNumber': number, 'uploadId': upload_id}, data)
+        return response.getheader('ETag')
+
+    def _complete_upload(self, key, upload_id, parts):
+        body = ''.join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in parts
+        )
+        self._request('POST', key, {'uploadId': upload_id},
+                      f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode())
+
+    def _abort_upload(self, key, upload_id):
+        try:
+            self._request('DELETE', key, {'uploadId': upload_id})
+        except (OSError, UploadNotFound):
+            pass
+
+
+def remote_key(path):
+    """Ключ файла бэкапа в хранилище: путь относительно каталога бэкапов."""
+    return os.path.relpath(path, BACKUP_ROOT).replace(os.sep, '/')
+
+
+def upload_backup(entry, target):
+    """
+    Отправляет в хранилище файлы бэкапа, которых там ещё нет,
+    и отмечает в журнале, куда и когда отправлен бэкап.
+
+    Returns:
+        int: Сколько байт отправлено
+    """
+    sent = 0
+    for path in backup_files(entry):
+        key = remote_key(path)
+        # Ключи не повторяются, а объект появляется только целиком:
+        # уже имеющийся объект отправлять не нужно
+        if not target.exists(key):
+            sent += target.upload(path, key)
+    update_backup_entry(entry['id'], remote={
+        "location": target.location,
+        "uploaded_at": get_iso_timestamp(),
+        "sent": sent
+    })
+    return sent
+
+
+def upload_backups(target, backup_ids=None):
+    """
+    Отправляет в хранилище бэкапы, которые ещё не были туда отправлены,
+    от старых к новым.
+
+    Args:
+        target (BackupTarget): Хранилище
+        backup_ids (list): id бэкапов или None - все бэкапы
+
+    Returns:
+        tuple: (success, msg) где success - bool, msg - строка с результатом
+    """
+    entries = [
+        entry for entry in read_backup_log()
+        if (backup_ids is None or entry['id'] in backup_ids)
+        and (entry.get('remote') or {}).get('location') != target.location
+    ]
+    if not entries:
+        return True, f"ℹ️  Все бэкапы уже отправлены в {target.location}."
+
+    started = time.perf_counter()
+    sent = 0
+    errors = []
+    for entry in entries:
+        try:
+            sent += upload_backup(entry, target)
+        except (OSError, ValueError, UploadNotFound) as e:
+            errors.append(f"{entry['filename']}: {e}")
+    elapsed = time.perf_counter() - started
+    speed = sent / elapsed / (1024 * 1024) if elapsed else 0.0
+    msg = (f"Отправлено в {target.location}: бэкапов {len(entries) - len(errors)} из {len(entries)}, "
+           f"{sent / (1024 * 1024):.1f} МБ за {elapsed:.1f} с ({speed:.1f} МБ/с)")
+    if errors:
+        return False, f"❌ {msg}. Ошибки: {'; '.join(errors)}"
+    return True, f"✅ {msg}"
@@ -0,0 +1,333 @@
+import csv
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import MultiDict
+from wtforms import Form
+
+from extensions import db
+from forms import AddMaterialForm, AddOrderForm, AddProductForm
+from models import Material, Order, Organization, Product
+from reports import report_cache
+from utils import chunked, iter_json_array
+
+# Форматы файлов массовой загрузки
+FORMATS = ('csv', 'ndjson', 'json')
+
+
+class BulkLoadResult:
+    """Итоги массовой загрузки: сколько строк добавлено, пропущено и отклонено."""
+
+    # Сколько сообщений об ошибках сохранять для показа пользователю
+    MAX_ERRORS = 10
+
+    def __init__(self):
+        self.inserted = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def total(self):
+        return self.inserted + self.skipped + self.invalid
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.total / elapsed if elapsed > 0 else 0.0
+
+    def add_error(self, number, message):
+        """Отмечает строку номер number как некорректную."""
+        self.invalid += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(f"строка {number}: {message}")
+
+    def summary(self):
+        return (f"добавлено: {self.inserted}, пропущено (уже есть): {self.skipped}, "
+                f"с ошибками: {self.invalid}")
+
+
+def read_records(stream, fmt, key=None):
+    """
+    Читает записи из текстового потока по одной.
+
+    Args:
+        stream: Текстовый поток
+        fmt (str): 'csv' (первая строка - заголовок), 'ndjson' (объект в строке)
+            или 'json' (массив объектов)
+        key (str): Ключ массива в JSON-объекте верхнего уровня
+
+    Yields:
+        dict: Записи файла
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        yield from iter_json_array(stream, key=key)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+
+def _text(value, max_length, default=None):
+    """Приводит значение к строке и проверяет длину, как Length(max=...) в формах."""
+    if value is None or value == '':
+        value = default
+    if value is None:
+        return None
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise ValueError
+    return value
+
+
+def clean_organization(item):
+    """
+    Проверяет запись организации из файла импорта.
+
+    Returns:
+        dict: Значения колонок или None, если запись некорректна
+    """
+    if not isinstance(item, dict):
+        return None
+    try:
+        inn = _text(item.get('inn'), 12)
+        if not inn:
+            return None
+        return {
+            "name": _text(item.get('name'), 100, default='Не указано'),
+            "inn": inn,
+            "address": _text(item.get('address'), 200, default=''),
+            "phone": _text(item.get('phone'), 20, default=''),
+            "salesman": bool(item.get('salesman', False)),
+            "buyer": bool(item.get('buyer', True))
+        }
+    except ValueError:
+        return None
+
+
+class FormRowValidator:
+    """
+    Проверяет записи файла полями и валидаторами формы из forms.py.
+
+    Из формы берутся только перечисленные поля, без CSRF и без методов
+    validate_<поле>: уникальность проверяется для всей порции одним запросом.
+    Один экземпляр формы переиспользуется для всех записей.
+    """
+
+    def __init__(self, form_class, fields):
+        row_form = type(f"{form_class.__name__}Row", (Form,),
+                        {name: getattr(form_class, name) for name in fields})
+        self.form = row_form()
+        self.fields = fields
+
+    def __call__(self, item):
+        """
+        Returns:
+            tuple: (значения полей, None) или (None, текст ошибки)
+        """
+        if not isinstance(item, dict):
+            return None, "ожидался объект с полями"
+        formdata = MultiDict(
+            (name, str(item[name]).strip()) for name in self.fields
+            if item.get(name) is not None and str(item[name]).strip() != ''
+        )
+        self.form.process(formdata)
+        if not self.form.validate():
+            return None, '; '.join(
+                f"{name}: {' '.join(errors)}" for name, errors in self.form.errors.items()
+            )
+        return {
+            name: float(value) if isinstance(value, Decimal) else value
+            for name, value in self.form.data.items()
+        }, None
+
+
+def _skip_existing(column):
+    """
+    Возвращает шаг обработки порции, пропускающий строки, у которых значение
+    колонки уже есть в базе или раньше встречалось в файле.
+    """
+    def prepare(rows, result):
+        values = {row[column.key] for _, row in rows}
+        existing = set(db.session.scalars(select(column).where(column.in_(values))))
+        new_rows = []
+        for number, row in rows:
+            if row[column.key] in existing:
+                result.skipped += 1
+            else:
+                existing.add(row[column.key])
+                new_rows.append((number, row))
+        return new_rows
+    return prepare
+
+
+def _bulk_insert(items, validate, statement, result, chunk_size, prepare=(), after_commit=None):
+    """
+    Общий цикл массовой загрузки: записи проверяются и собираются в порции,
+    каждая порция проходит шаги prepare (пакетные проверки по базе),
+    вставляется одним executemany и коммитится.
+
+    Args:
+        items: Итератор записей
+        validate (callable): Запись -> (значения колонок, None) или (None, ошибка)
+        statement: INSERT для executemany
+        result (BulkLoadResult): Куда накапливать итоги
+        chunk_size (int): Размер порции (по умолчанию IMPORT_CHUNK_SIZE)
+        prepare (tuple): Функции (rows, result) -> rows для порции из (номер, значения)
+        after_commit (callable): Вызывается со вставленными строками после коммита порции
+    """
+    result = result or BulkLoadResult()
+    chunk_size = chunk_size or current_app.config['IMPORT_CHUNK_SIZE']
+
+    for chunk in chunked(enumerate(items, 1), chunk_size):
+        rows = []
+        for number, item in chunk:
+            row, error = validate(item)
+            if row is None:
+                result.add_error(number, error)
+            else:
+                rows.append((number, row))
+        for step in prepare:
+            if rows:
+                rows = step(rows, result)
+        if not rows:
+            continue
+
+        new_rows = [row for _, row in rows]
+        db.session.execute(statement, new_rows)
+        db.session.commit()
+        result.inserted += len(new_rows)
+        if after_commit:
+            after_commit(new_rows)
+
+    return result
+
+
+def load_organizations(items, result=None, chunk_size=None):
+    """
+    Импортирует организации порциями: для каждой порции одним запросом IN
+    проверяются существующие ИНН, новые строки вставляются одним executemany,
+    после чего порция коммитится.
+
+    Args:
+        items: Итератор записей (словарей) из файла
+        result (BulkLoadResult): Куда накапливать итоги
+        chunk_size (int): Размер порции (по умолчанию IMPORT_CHUNK_SIZE)
+
+    Returns:
+        BulkLoadResult: Итоги импорта
+    """
+    def validate(item):
+        row = clean_organization(item)
+        return (row, None) if row else (None, "нет ИНН или слишком длинное значение")
+
+    # Организация с тем же ИНН, добавленная параллельно, просто пропускается
+    statement = sqlite_insert(Organization.__table__).on_conflict_do_nothing(index_elements=['inn'])
+    return _bulk_insert(items, validate, statement, result, chunk_size,
+                        prepare=(_skip_existing(Organization.inn),))
+
+
+def load_materials(items, result=None, chunk_size=None):
+    """Загружает материалы. Поля и правила проверки - как в AddMaterialForm."""
+    validate = FormRowValidator(AddMaterialForm, ('name', 'description', 'quantity', 'unit', 'price_per_unit'))
+    return _bulk_insert(items, validate, insert(Material.__table__), result, chunk_size)
+
+
+def load_products(items, result=None, chunk_size=None):
+    """
+    Загружает товары. Поля и правила проверки - как в AddProductForm;
+    товары с уже существующим названием пропускаются.
+    """
+    validate = FormRowValidator(AddProductForm, ('name', 'weight', 'quantity', 'cost'))
+    return _bulk_insert(items, validate, insert(Product.__table__), result, chunk_size,
+                        prepare=(_skip_existing(Product.name),))
+
+
+def _resolve_organizations(rows, result):
+    """
+    Подставляет organization_id по ИНН (organization_inn) или проверяет
+    переданный organization_id - одним запросом на порцию.
+    """
+    inns = {row['organization_inn'] for _, row in rows if row.get('organization_inn')}
+    ids = {row['organization_id'] for _, row in rows if not row.get('organization_inn')}
+    by_inn = dict(db.session.execute(
+        select(Organization.inn, Organization.id).where(Organization.inn.in_(inns))
+    ).all()) if inns else {}
+    known_ids = set(db.session.scalars(
+        select(Organization.id).where(Organization.id.in_(ids))
+    )) if ids else set()
+
+    resolved = []
+    for number, row in rows:
+        inn = row.pop('organization_inn', None)
+        organization_id = by_inn.get(inn) if inn else row['organization_id']
+        if organization_id is None or (not inn and organization_id not in known_ids):
+            result.add_error(number, f"организация {inn or row['organization_id']} не найдена")
+            continue
+        row['organization_id'] = organization_id
+        resolved.append((number, row))
+    return resolved
+
+
+def load_orders(items, result=None, chunk_size=None):
+    """
+    Загружает заказы. Номер и стоимость проверяются как в AddOrderForm,
+    организация задаётся ИНН (organization_inn) или id (organization_id).
+    Заказы с уже существующим номером пропускаются.
+
+    Строки вставляются мимо ORM, поэтому кэш отчётов сбрасывается здесь;
+    поисковый индекс и дневную сводку обновляют триггеры.
+    """
+    form_validate = FormRowValidator(AddOrderForm, ('order_number', 'total_price'))
+
+    def validate(item):
+        row, error = form_validate(item)
+        if row is None:
+            return None, error
+        try:
+            inn = _text(item.get('organization_inn'), 12)
+        except ValueError:
+            return None, "ИНН организации длиннее 12 символов"
+        if inn:
+            row['organization_inn'] = inn
+            return row, None
+        try:
+            row['organization_id'] = int(item.get('organization_id'))
+        except (TypeError, ValueError):
+            return None, "не указана организация (organization_inn или organization_id)"
+        return row, None
+
+    def set_created_at(rows, result):
+        now = datetime.utcnow()
+        for _, row in rows:
+            row['created_at'] = now
+        return rows
+
+    statement = sqlite_insert(Order.__table__).on_conflict_do_nothing(index_elements=['order_number'])
+    return _bulk_insert(
+        items, validate, statement, result, chunk_size,
+        prepare=(_resolve_organizations, _skip_existing(Order.order_number), set_created_at),
+        after_commit=lambda rows: report_cache.invalidate({row['created_at'] for row in rows})
+    )
+
+
+LOADERS = {
+    'organizations': load_organizations,
+    'materials': load_materials,
+    'products': load_products,
+    'orders': load_orders,
+}
@@ -0,0 +1,292 @@
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import insert
+
+from backup_scheduler import backup_scheduler, backup_target, verify_by_config
+from backup_system import VERIFY_PRAGMAS
+from backup_targets import upload_backups
+from bulk_load import FORMATS, LOADERS, BulkLoadResult, read_records
+from extensions import db
+from rollup import rebuild_rollup
+from search import rebuild_search_index
+from models import User, Material, Organization, Order, Report, Product
+from utils import keyset_query
+
+
+def register_commands(app):
+    """Регистрирует CLI-команды приложения (flask <команда>)."""
+    app.cli.add_command(check_indexes)
+    app.cli.add_command(rebuild_search)
+    app.cli.add_command(rebuild_rollup_command)
+    app.cli.add_command(load_command)
+    app.cli.add_command(backup_daemon)
+    app.cli.add_command(verify_backups_command)
+    app.cli.add_command(upload_backups_command)
+    app.cli.add_command(bench_sqlite)
+
+
+def explain_query_plan(query):
+    """
+    Возвращает строки EXPLAIN QUERY PLAN для запроса SQLAlchemy.
+    """
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        # sqlite3 больше не адаптирует datetime сам, значение на план не влияет
+        params.append(str(value) if isinstance(value, datetime) else value)
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def list_queries():
+    """
+    Запросы списков и фильтров из routes.py в том виде, в каком их выполняют страницы.
+    """
+    moment = datetime(2026, 1, 1)
+
+    def page(query, model, descending=False):
+        return keyset_query(query, model.created_at, model.id, descending=descending).limit(50)
+
+    return [
+        ("Пользователи", page(User.query, User)),
+        ("Пользователи: роль", page(User.query.filter(User.role == 'admin'), User)),
+        ("Пользователи: активные", page(User.query.filter(User.active == True), User)),
+        ("Материалы", page(Material.query, Material)),
+        ("Материалы: количество", page(Material.query.filter(Material.quantity >= 10, Material.quantity <= 20),
+                                       Material)),
+        ("Организации", page(Organization.query, Organization)),
+        ("Организации: продавцы", page(Organization.query.filter(Organization.salesman == True), Organization)),
+        ("Организации: покупатели", page(Organization.query.filter(Organization.buyer == True), Organization)),
+        ("Экспорт заказчиков", Organization.query.filter_by(buyer=True)),
+        ("Заказы", page(Order.list_rows(), Order)),
+        ("Заказы: период", page(Order.list_rows().filter(Order.created_at >= moment, Order.created_at <= moment),
+                                Order)),
+        ("Отчёт: заказы за период", Order.query.filter(Order.created_at >= moment, Order.created_at <= moment)),
+        ("Отчёты", page(Report.query, Report, descending=True)),
+        ("Товары", page(Product.query, Product)),
+    ]
+
+
+@click.command('check-indexes')
+def check_indexes():
+    """Проверяет через EXPLAIN QUERY PLAN, что запросы списков используют индексы."""
+    failed = 0
+    for title, query in list_queries():
+        plan = explain_query_plan(query)
+        # «SCAN table» без «USING ... INDEX» означает полный просмотр таблицы
+        full_scans = [line for line in plan if line.startswith('SCAN') and 'INDEX' not in line]
+        if full_scans:
+            failed += 1
+        click.echo(f"{'❌' if full_scans else '✅'} {title}")
+        for line in plan:
+            click.echo(f"      {line}")
+
+    if failed:
+        click.echo(f"Запросов без индекса: {failed}. Выполните 'flask db upgrade'.")
+        sys.exit(1)
+    click.echo("Все запросы списков используют индексы.")
+
+
+@click.command('rebuild-search')
+def rebuild_search():
+    """Перестраивает полнотекстовые индексы поиска (FTS5)."""
+    with db.engine.begin() as conn:
+        rebuild_search_index(conn)
+    click.echo("Поисковые индексы перестроены.")
+
+
+@click.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Пересчитывает дневную сводку заказов (order_daily_stats) с нуля."""
+    with db.engine.begin() as conn:
+        rebuild_rollup(conn)
+    click.echo("Дневная сводка заказов пересчитана.")
+
+
+@click.command('load')
+@click.argument('entity', type=click.Choice(sorted(LOADERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help="Формат файла (по умолчанию - по расширению).")
+@click.option('--chunk-size', type=int, default=None, help="Строк в одной транзакции (по умолчанию IMPORT_CHUNK_SIZE).")
+def load_command(entity, path, fmt, chunk_size):
+    """Массово загружает материалы, товары, заказы или организации из CSV/NDJSON/JSON."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise click.BadParameter(f"укажите --format ({', '.join(FORMATS)})", param_hint='--format')
+
+    result = BulkLoadResult()
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        try:
+            LOADERS[entity](read_records(stream, fmt, key=entity), result, chunk_size)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"Ошибка: {e}. До ошибки {result.summary()}.")
+            sys.exit(1)
+
+    for error in result.errors:
+        click.echo(f"  {error}")
+    click.echo(f"Загрузка завершена: {result.summary()}.")
+    click.echo(f"Обработано {result.total} строк за {result.elapsed:.1f} с ({result.rows_per_second:.0f} строк/с).")
+
+
+@click.command('backup-daemon')
+@click.option('--once', is_flag=True, help="Сделать бэкап, если наступил срок, и выйти (для cron).")
+def backup_daemon(once):
+    """Делает бэкапы по расписанию (BACKUP_*_INTERVAL) и удаляет старые по схеме хранения."""
+    if not any(backup_scheduler.intervals.values()) and not current_app.config['WAL_ARCHIVE']:
+        click.echo("Все интервалы бэкапов равны 0 и архив WAL выключен.")
+        sys.exit(1)
+
+    if once:
+        result = backup_scheduler.run_pending()
+        click.echo(result[1] if result else "Срок бэкапов ещё не наступил.")
+        sys.exit(0 if result is None or result[0] else 1)
+
+    backup_scheduler.start_archiver()
+    click.echo("Планировщик бэкапов запущен, Ctrl+C - остановка.")
+    try:
+        while True:
+            result = backup_scheduler.run_pending() if any(backup_scheduler.intervals.values()) else None
+            if result:
+                click.echo(f"{datetime.now():%Y-%m-%d %H:%M:%S} {result[1]}")
+            time.sleep(backup_scheduler.TICK)
+    except KeyboardInterrupt:
+        click.echo("Планировщик бэкапов остановлен.")
+
+
+@click.command('verify-backups')
+@click.option('--all', 'verify_all', is_flag=True, help="Проверить все бэкапы, а не только непроверенные.")
+@click.option('--mode', type=click.Choice(sorted(VERIFY_PRAGMAS)), default=None,
+              help="quick - PRAGMA quick_check, full - integrity_check (по умолчанию BACKUP_VERIFY_MODE).")
+@click.option('--workers', type=int, default=None, help="Число процессов (по умолчанию BACKUP_VERIFY_WORKERS).")
+def verify_backups_command(verify_all, mode, workers):
+    """Проверяет, что бэкапы восстанавливаются, и записывает результат в журнал."""
+    success, msg = verify_by_config(only_unverified=not verify_all, mode=mode, workers=workers)
+    click.echo(msg)
+    if not success:
+        sys.exit(1)
+
+
+@click.command('upload-backups')
+def upload_backups_command():
+    """Отправляет в хранилище BACKUP_TARGET бэкапы, которых там ещё нет."""
+    target = backup_target()
+    if target is None:
+        click.echo("Хранилище для копий бэкапов не настроено (BACKUP_TARGET).")
+        sys.exit(1)
+    success, msg = upload_backups(target)
+    click.echo(msg)
+    if not success:
+        sys.exit(1)
+
+
+def bench_requests(app, count, threads, make_request):
+    """
+    Выполняет count запросов из threads клиентов одновременно.
+
+    Args:
+        make_request: Функция (client, номер запроса) -> ответ
+
+    Returns:
+        tuple: (запросов в секунду, число ошибок)
+    """
+    numbers = itertools.count()
+    errors = []
+    ready = threading.Barrier(threads + 1)
+
+    def worker():
+        client = app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'admin'})
+        ready.wait()
+        while (number := next(numbers)) < count:
+            try:
+                response = make_request(client, number)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return count / (time.perf_counter() - started), len(errors)
+
+
+@click.command('bench-sqlite')
+@click.option('--rows', type=int, default=5000, help="Организаций в тестовой базе.")
+@click.option('--requests', 'count', type=int, default=300, help="Запросов в каждом замере.")
+@click.option('--threads', type=int, default=8, help="Одновременных клиентов.")
+def bench_sqlite(rows, count, threads):
+    """
+    Сравнивает скорость страниц списка и добавления организаций на временной
+    базе с настройками SQLite по умолчанию, с профилем SQLITE_PRAGMAS
+    и с профилем и групповой фиксацией (WRITE_QUEUE).
+    """
+    from app import create_app
+
+    # Журнал SQL (SQLALCHEMY_ECHO) общий для всех движков и замедлил бы замер
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+    profiles = [
+        ("По умолчанию", {'SQLITE_PRAGMAS': {}, 'WRITE_QUEUE': False}),
+        ("SQLITE_PRAGMAS", {'WRITE_QUEUE': False}),
+        ("+ WRITE_QUEUE", {'WRITE_QUEUE': True}),
+    ]
+    scenarios = [
+        ("Список", lambda client, number: client.get('/organizations')),
+        ("Запись", lambda client, number: add_organization(client, number)),
+        ("Смешанно", lambda client, number: add_organization(client, number) if number % 5 == 0
+            else client.get('/organizations')),
+    ]
+    inn = itertools.count(10 ** 11)
+
+    def add_organization(client, number):
+        return client.post('/add-organization', data={
+            'name': f'Тест {number}', 'inn': str(next(inn)), 'address': 'Адрес', 'phone': '000'
+        })
+
+    with tempfile.TemporaryDirectory() as tmp:
+        apps = []
+        for number, (profile, overrides) in enumerate(profiles):
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, f"{number}.db"),
+                'SQLALCHEMY_ECHO': False,
+                'WAL_ARCHIVE': False,
+                'BACKUP_SCHEDULER': False,
+                'WTF_CSRF_ENABLED': False,
+                **overrides
+            })
+            with app.app_context():
+                db.session.execute(insert(Organization), [
+                    {'name': f'Организация {i}', 'inn': str(i), 'address': 'Адрес', 'phone': '000'}
+                    for i in range(rows)
+                ])
+                db.session.commit()
+            apps.append((profile, app))
+
+        click.echo(f"{'Профиль':<16}" + ''.join(f"{name + ', запр/с':>18}" for name, _ in scenarios)
+                   + f"{'Ошибок':>8}")
+        for profile, app in apps:
+            line = f"{profile:<16}"
+            errors = 0
+            for _, make_request in scenarios:
+                speed, failed = bench_requests(app, count, threads, make_request)
+                line += f"{speed:>18.1f}"
+                errors += failed
+            click.echo(line + f"{errors:>8}")
+            with app.app_context():
+                db.engine.dispose()
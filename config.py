@@ -7,7 +7,104 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
                               'sqlite:///' + os.path.join(basedir, 'database.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Настройки каждого нового соединения с SQLite (PRAGMA имя=значение).
+    # В режиме WAL чтение не ждёт записи; synchronous=NORMAL в этом режиме
+    # не портит базу при сбое питания, но может потерять последние транзакции.
+    # cache_size < 0 - размер кэша в КиБ, mmap_size - в байтах, busy_timeout - в мс
+    SQLITE_PRAGMAS = {
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE') or -64000),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024),
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+        'foreign_keys': os.environ.get('SQLITE_FOREIGN_KEYS', 'ON'),
+    }
     DEBUG = False
+    # Групповая фиксация: при WRITE_QUEUE=1 изменения из разных запросов выполняет
+    # один поток, объединяя до WRITE_BATCH_SIZE изменений в одну транзакцию и добирая
+    # их WRITE_BATCH_WAIT сек. Транзакция, не выполненная из-за занятой базы,
+    # повторяется не более WRITE_LOCK_RETRIES раз (и без очереди тоже)
+    WRITE_QUEUE = os.environ.get('WRITE_QUEUE', '0') == '1'
+    WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE') or 64)
+    WRITE_BATCH_WAIT = float(os.environ.get('WRITE_BATCH_WAIT') or 0)
+    WRITE_LOCK_RETRIES = int(os.environ.get('WRITE_LOCK_RETRIES') or 5)
+    # Количество строк на одной странице списков
+    ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE') or 50)
+    # Размер порции при массовом импорте: одна проверка IN, один executemany и один коммит
+    IMPORT_CHUNK_SIZE = 1000
+    # Потоковый вывод полного списка: строк за одну выборку из курсора
+    # и фрагментов шаблона, накапливаемых перед отправкой клиенту
+    STREAM_BATCH_SIZE = 500
+    STREAM_BUFFER_SIZE = 64
+    # Максимальное число результатов отчётов в кэше
+    REPORT_CACHE_SIZE = 128
+    # Сколько организаций выводить в отчёте о производительности
+    REPORT_TOP_ORGANIZATIONS = 10
+    # Шрифты с кириллицей для PDF-экспорта, используется первый найденный
+    PDF_FONT_PATHS = [
+        os.environ.get('PDF_FONT_PATH'),
+        'C:/Windows/Fonts/arial.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+        '/Library/Fonts/Arial.ttf',
+    ]
+    # Фоновая генерация отчётов: число потоков и максимум заданий в очереди
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS') or 2)
+    REPORT_QUEUE_SIZE = int(os.environ.get('REPORT_QUEUE_SIZE') or 20)
+    # Онлайн-бэкап через API SQLite: страниц за шаг и пауза между шагами (сек).
+    # Меньший шаг и большая пауза - дольше бэкап, но меньше задержка запросов
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP') or 1024)
+    BACKUP_STEP_PAUSE = float(os.environ.get('BACKUP_STEP_PAUSE') or 0.01)
+    # Сжатие бэкапов: 'zlib', 'lzma' или пустая строка (без сжатия);
+    # фрагменты сжимаются и распаковываются параллельно в BACKUP_WORKERS потоках
+    BACKUP_COMPRESSION = os.environ.get('BACKUP_COMPRESSION', 'zlib')
+    BACKUP_WORKERS = int(os.environ.get('BACKUP_WORKERS') or os.cpu_count() or 2)
+    # Хранение полных бэкапов: 'files' - отдельный файл на бэкап,
+    # 'repository' - общий репозиторий фрагментов с дедупликацией
+    BACKUP_STORAGE = os.environ.get('BACKUP_STORAGE', 'files')
+    # Восстановление без перезапуска: сколько ждать завершения начатых запросов (сек)
+    RESTORE_WAIT_TIMEOUT = float(os.environ.get('RESTORE_WAIT_TIMEOUT') or 30)
+    # Бэкапы по расписанию: интервалы в часах (0 - тип отключён).
+    # BACKUP_SCHEDULER=0 выключает фоновый поток в веб-приложении,
+    # тогда расписание выполняет отдельный процесс `flask backup-daemon`
+    BACKUP_SCHEDULER = os.environ.get('BACKUP_SCHEDULER', '1') == '1'
+    BACKUP_FULL_INTERVAL = float(os.environ.get('BACKUP_FULL_INTERVAL') or 24)
+    BACKUP_DIFFERENTIAL_INTERVAL = float(os.environ.get('BACKUP_DIFFERENTIAL_INTERVAL') or 6)
+    BACKUP_INCREMENTAL_INTERVAL = float(os.environ.get('BACKUP_INCREMENTAL_INTERVAL') or 1)
+    # Хранение «дед-отец-сын»: последний бэкап каждого из стольких дней, недель и месяцев
+    BACKUP_KEEP_DAILY = int(os.environ.get('BACKUP_KEEP_DAILY') or 7)
+    BACKUP_KEEP_WEEKLY = int(os.environ.get('BACKUP_KEEP_WEEKLY') or 4)
+    BACKUP_KEEP_MONTHLY = int(os.environ.get('BACKUP_KEEP_MONTHLY') or 12)
+    # Проверка бэкапов: 'quick' (PRAGMA quick_check) или 'full' (integrity_check),
+    # цепочки разных полных бэкапов проверяются в BACKUP_VERIFY_WORKERS процессах.
+    # Тем же режимом проверяется собранная база перед восстановлением
+    BACKUP_VERIFY_MODE = os.environ.get('BACKUP_VERIFY_MODE', 'quick')
+    BACKUP_VERIFY_WORKERS = int(os.environ.get('BACKUP_VERIFY_WORKERS') or os.cpu_count() or 2)
+    # Непрерывный архив WAL для восстановления на любой момент: кадры журнала
+    # отправляются в архив каждые WAL_ARCHIVE_INTERVAL секунд, контрольная точка -
+    # когда в журнале набирается WAL_CHECKPOINT_PAGES страниц. Архиватор работает
+    # в потоке планировщика или в `flask backup-daemon`
+    WAL_ARCHIVE = os.environ.get('WAL_ARCHIVE', '1') == '1'
+    WAL_ARCHIVE_INTERVAL = float(os.environ.get('WAL_ARCHIVE_INTERVAL') or 5)
+    WAL_CHECKPOINT_PAGES = int(os.environ.get('WAL_CHECKPOINT_PAGES') or 1000)
+    # Автоматическая контрольная точка SQLite при архиве WAL: позже архиватора,
+    # чтобы не опережать его, но журнал не растёт без предела там, где архиватора нет
+    WAL_AUTOCHECKPOINT_PAGES = int(os.environ.get('WAL_AUTOCHECKPOINT_PAGES') or 4 * WAL_CHECKPOINT_PAGES)
+    # Копии бэкапов вне сервера: '' - выключено, 'local' - каталог BACKUP_TARGET_DIR,
+    # 's3' - S3-совместимое хранилище (Amazon S3, MinIO). Копии отправляются в фоне
+    # после каждого бэкапа; файлы больше BACKUP_UPLOAD_PART_SIZE МБ - частями
+    # в BACKUP_UPLOAD_WORKERS потоков, не быстрее BACKUP_UPLOAD_BANDWIDTH МБ/с (0 - без ограничения)
+    BACKUP_TARGET = os.environ.get('BACKUP_TARGET', '')
+    BACKUP_TARGET_DIR = os.environ.get('BACKUP_TARGET_DIR', '')
+    BACKUP_S3_ENDPOINT = os.environ.get('BACKUP_S3_ENDPOINT', 'http://localhost:9000')
+    BACKUP_S3_BUCKET = os.environ.get('BACKUP_S3_BUCKET', 'milk-backups')
+    BACKUP_S3_ACCESS_KEY = os.environ.get('BACKUP_S3_ACCESS_KEY', '')
+    BACKUP_S3_SECRET_KEY = os.environ.get('BACKUP_S3_SECRET_KEY', '')
+    BACKUP_S3_REGION = os.environ.get('BACKUP_S3_REGION', 'us-east-1')
+    BACKUP_S3_PREFIX = os.environ.get('BACKUP_S3_PREFIX', '')
+    BACKUP_UPLOAD_PART_SIZE = float(os.environ.get('BACKUP_UPLOAD_PART_SIZE') or 8)
+    BACKUP_UPLOAD_WORKERS = int(os.environ.get('BACKUP_UPLOAD_WORKERS') or 4)
+    BACKUP_UPLOAD_BANDWIDTH = float(os.environ.get('BACKUP_UPLOAD_BANDWIDTH') or 0)
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,246 @@
+import json
+import os
+import tempfile
+import unicodedata
+from urllib.parse import quote
+
+from flask import current_app, send_file
+from openpyxl import Workbook
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from utils import chunked
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PDF_MIMETYPE = 'application/pdf'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+ORDER_COLUMNS = ('Номер заказа', 'Организация', 'Общая стоимость', 'Дата создания')
+
+
+def send_export(write, download_name, mimetype):
+    """
+    Формирует файл экспорта во временном файле и отдаёт его потоком.
+
+    Временный файл анонимный: у каждого запроса свой, и он удаляется
+    сразу после отправки, поэтому параллельные выгрузки не мешают друг другу.
+
+    Args:
+        write (callable): Функция, записывающая файл в переданный объект
+        download_name (str): Имя файла для скачивания
+        mimetype (str): MIME-тип ответа
+    """
+    tmp = tempfile.TemporaryFile()
+    try:
+        write(tmp)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    return send_file(tmp, as_attachment=True, download_name=download_name, mimetype=mimetype)
+
+
+def set_attachment(response, download_name):
+    """
+    Добавляет к ответу заголовок Content-Disposition для скачивания файла.
+    Имя с кириллицей передаётся в filename* (RFC 5987), как это делает send_file.
+    """
+    fallback = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+    response.headers.set('Content-Disposition', 'attachment', filename=fallback,
+                         **{'filename*': f"UTF-8''{quote(download_name)}"})
+
+
+def _order_values(row):
+    return (
+        row.order_number,
+        row.organization_name,
+        row.total_price,
+        row.created_at.strftime('%d.%m.%Y %H:%M') if row.created_at else ''
+    )
+
+
+# --- JSON ---
+def iter_organizations_json(rows, ndjson=False, batch_size=500):
+    """
+    Отдаёт организации фрагментами JSON (массив) или NDJSON (по записи в строке).
+    Фрагменты собираются по batch_size записей, чтобы не писать в сокет по строчке.
+
+    Args:
+        rows: Итератор строк с полями name, inn, address, phone, salesman, buyer
+        ndjson (bool): Формат NDJSON вместо JSON-массива
+        batch_size (int): Записей в одном фрагменте
+    """
+    first = True
+    if not ndjson:
+        yield '[\n'
+    for batch in chunked(rows, batch_size):
+        items = [
+            json.dumps({
+                "name": row.name,
+                "inn": row.inn,
+                "address": row.address,
+                "phone": row.phone,
+                "salesman": row.salesman,
+                "buyer": row.buyer
+            }, ensure_ascii=False)
+            for row in batch
+        ]
+        if ndjson:
+            yield '\n'.join(items) + '\n'
+        else:
+            yield ('' if first else ',\n') + ',\n'.join(f"    {item}" for item in items)
+        first = False
+    if not ndjson:
+        yield '\n]\n'
+
+
+# --- XLSX ---
+def write_orders_xlsx(rows, fileobj):
+    """
+    Записывает заказы в XLSX. Книга открыта в режиме write-only: строки сразу
+    уходят во временный файл листа и не копятся в памяти.
+
+    Args:
+        rows: Итератор строк Order.list_rows()
+        fileobj: Файл для записи
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Заказы')
+    sheet.append(ORDER_COLUMNS)
+    for row in rows:
+        sheet.append(_order_values(row))
+    workbook.save(fileobj)
+
+
+def write_report_xlsx(report, fileobj):
+    """Записывает отчёт в XLSX: сводка и, если есть, разделы отчёта о производительности."""
+    data = report.data or {}
+    workbook = Workbook(write_only=True)
+
+    summary = workbook.create_sheet('Отчёт')
+    summary.append(('Тип отчёта', report.report_type))
+    summary.append(('Начало периода', data.get('period_start')))
+    summary.append(('Конец периода', data.get('period_end')))
+    summary.append(('Количество заказов', data.get('total_orders')))
+    summary.append(('Выручка', data.get('total_revenue')))
+    if 'average_order_value' in data:
+        summary.append(('Средний чек', data['average_order_value']))
+
+    if 'top_organizations' in data:
+        top = workbook.create_sheet('Организации')
+        top.append(('Организация', 'Заказов', 'Выручка'))
+        for org in data['top_organizations']:
+            top.append((org['name'], org['orders'], org['revenue']))
+
+    if 'weekly' in data:
+        weekly = workbook.create_sheet('По неделям')
+        weekly.append(('Неделя с', 'Заказов', 'Выручка'))
+        for week in data['weekly']:
+            weekly.append((week['week'], week['orders'], week['revenue']))
+
+    workbook.save(fileobj)
+
+
+# --- PDF ---
+def _pdf_font():
+    """
+    Регистрирует шрифт с кириллицей из PDF_FONT_PATHS и возвращает его имя.
+    Если ни один файл не найден, используется встроенный Helvetica (без кириллицы).
+    """
+    if 'ExportFont' in pdfmetrics.getRegisteredFontNames():
+        return 'ExportFont'
+    for path in current_app.config['PDF_FONT_PATHS']:
+        if path and os.path.exists(path):
+            pdfmetrics.registerFont(TTFont('ExportFont', path))
+            return 'ExportFont'
+    return 'Helvetica'
+
+
+class _PdfTable:
+    """
+    Постраничный вывод таблицы на холсте reportlab.
+
+    Строки рисуются сразу по мере чтения и страница закрывается, как только
+    заполнена, поэтому таблица целиком в памяти не строится.
+    """
+
+    LINE_HEIGHT = 6 * mm
+    MARGIN = 15 * mm
+
+    def __init__(self, fileobj, title, columns, widths):
+        self.canvas = canvas.Canvas(fileobj, pagesize=A4, pageCompression=1)
+        self.font = _pdf_font()
+        self.title = title
+        self.columns = columns
+        self.widths = widths
+        self.page = 0
+        self.y = 0
+        self._new_page()
+
+    def _new_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        width, height = A4
+        self.canvas.setFont(self.font, 12)
+        self.canvas.drawString(self.MARGIN, height - self.MARGIN, self.title)
+        self.canvas.setFont(self.font, 8)
+        self.canvas.drawRightString(width - self.MARGIN, self.MARGIN / 2, f"Стр. {self.page}")
+        self.y = height - self.MARGIN - 2 * self.LINE_HEIGHT
+        self._draw(self.columns)
+
+    def _draw(self, values):
+        x = self.MARGIN
+        self.canvas.setFont(self.font, 9)
+        for value, width in zip(values, self.widths):
+            self.canvas.drawString(x, self.y, '' if value is None else str(value))
+            x += width
+        self.y -= self.LINE_HEIGHT
+
+    def row(self, values):
+        if self.y < self.MARGIN:
+            self._new_page()
+        self._draw(values)
+
+    def text(self, line):
+        self.row((line,))
+
+    def save(self):
+        self.canvas.save()
+
+
+def write_orders_pdf(rows, fileobj):
+    """Записывает заказы в PDF, постранично, по мере чтения строк из курсора."""
+    table = _PdfTable(fileobj, 'Заказы', ORDER_COLUMNS, (35 * mm, 70 * mm, 35 * mm, 40 * mm))
+    for row in rows:
+        table.row(_order_values(row))
+    table.save()
+
+
+def write_report_pdf(report, fileobj):
+    """Записывает отчёт в PDF."""
+    data = report.data or {}
+    table = _PdfTable(fileobj, f"Отчёт №{report.id} ({report.report_type})", ('', ''), (60 * mm, 100 * mm))
+    table.row(('Начало периода', data.get('period_start') or '—'))
+    table.row(('Конец периода', data.get('period_end') or '—'))
+    table.row(('Количество заказов', data.get('total_orders')))
+    table.row(('Выручка', f"{data.get('total_revenue', 0.0):.2f} руб."))
+    if 'average_order_value' in data:
+        table.row(('Средний чек', f"{data['average_order_value']:.2f} руб."))
+
+    if 'top_organizations' in data:
+        table.text('')
+        table.text('Организации с наибольшей выручкой:')
+        for org in data['top_organizations']:
+            table.row((org['name'], f"{org['orders']} заказов, {org['revenue']:.2f} руб."))
+
+    if 'weekly' in data:
+        table.text('')
+        table.text('Заказы по неделям:')
+        for week in data['weekly']:
+            table.row((f"Неделя с {week['week']}", f"{week['orders']} заказов, {week['revenue']:.2f} руб."))
+
+    table.save()
@@ -161,9 +161,9 @@ class FilterMaterialsForm(FlaskForm):
     """
     Форма фильтра для материалов.
     """
-    search_query = StringField('Поиск по названию материала:', validators=[Optional()])
-    min_quantity = DecimalField('Минимальное количество:', places=2, validators=[NumberRange(min=0)], default=None)
-    max_quantity = DecimalField('Максимальное количество:', places=2, validators=[NumberRange(min=0)], default=None)
+    search_query = StringField('Поиск по названию или описанию материала:', validators=[Optional()])
+    min_quantity = DecimalField('Минимальное количество:', places=2, validators=[Optional(), NumberRange(min=0)], default=None)
+    max_quantity = DecimalField('Максимальное количество:', places=2, validators=[Optional(), NumberRange(min=0)], default=None)
     submit = SubmitField('Применить фильтр')
 
 
@@ -171,7 +171,7 @@ class FilterOrganizationsForm(FlaskForm):
     """
     Форма фильтра для организаций.
     """
-    search_query = StringField('Поиск по названию организации:', validators=[Optional()])
+    search_query = StringField('Поиск по названию, ИНН или адресу организации:', validators=[Optional()])
     salesman_filter = BooleanField('Только продавцы', default=False)
     buyer_filter = BooleanField('Только покупатели', default=False)
     submit = SubmitField('Применить фильтр')
@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+from extensions import db
+
+
+class DatabaseGate:
+    """
+    Пропускает работу с базой и умеет приостановить её на время обслуживания.
+
+    Каждый запрос (и фоновое задание) проходит через шлюз. Пока идёт
+    обслуживание, например горячее восстановление из бэкапа, новые запросы
+    ждут на входе, а начатые успевают завершиться. Шлюз действует в пределах
+    одного процесса: запросы других процессов SQLite сам дождётся по блокировке файла.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active = 0
+        self._paused = False
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        self.enter()
+        g._db_gate = True
+
+    def _teardown_request(self, exc):
+        if g.pop('_db_gate', False):
+            self.leave()
+
+    def enter(self):
+        """Ждёт окончания обслуживания и занимает место в шлюзе."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._paused)
+            self._active += 1
+
+    def leave(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def shared(self):
+        """Работа с базой вне запроса (фоновые задания)."""
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    @contextmanager
+    def paused(self, timeout=30):
+        """
+        Приостанавливает работу с базой: закрывает вход, ждёт завершения
+        начатых запросов и закрывает соединения пула SQLAlchemy. После выхода
+        из блока новые запросы открывают соединения заново.
+
+        Args:
+            timeout (float): Сколько ждать завершения начатых запросов (сек)
+
+        Raises:
+            TimeoutError: Если запросы не завершились за timeout
+        """
+        # Запрос, который начал обслуживание, сам не должен его задерживать
+        holds_slot = has_request_context() and g.get('_db_gate', False)
+        if holds_slot:
+            db.session.remove()
+            self.leave()
+        try:
+            with self._condition:
+                self._condition.wait_for(lambda: not self._paused)
+                self._paused = True
+                if not self._condition.wait_for(lambda: self._active == 0, timeout):
+                    self._paused = False
+                    self._condition.notify_all()
+                    raise TimeoutError(f"Запросы к базе не завершились за {timeout} с")
+            try:
+                db.engine.dispose()
+                yield
+            finally:
+                with self._condition:
+                    self._paused = False
+                    self._condition.notify_all()
+        finally:
+            if holds_slot:
+                self.enter()
+
+
+db_gate = DatabaseGate()
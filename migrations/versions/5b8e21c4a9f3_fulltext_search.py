@@ -0,0 +1,26 @@
+"""Полнотекстовый поиск FTS5 по материалам, организациям и заказам
+
+Revision ID: 5b8e21c4a9f3
+Revises: d6ed507404c8
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from search import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e21c4a9f3'
+down_revision = 'd6ed507404c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_search_index(op.get_bind())
+
+
+def downgrade():
+    drop_search_index(op.get_bind())
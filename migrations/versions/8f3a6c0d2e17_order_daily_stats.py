@@ -0,0 +1,37 @@
+"""Дневная сводка заказов для отчётов
+
+Revision ID: 8f3a6c0d2e17
+Revises: 5b8e21c4a9f3
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from rollup import create_rollup_triggers, drop_rollup_triggers
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a6c0d2e17'
+down_revision = '5b8e21c4a9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('organization_id', sa.Integer(), nullable=False),
+        sa.Column('order_count', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['organization_id'], ['organizations.id']),
+        sa.PrimaryKeyConstraint('day', 'organization_id'),
+        if_not_exists=True
+    )
+    create_rollup_triggers(op.get_bind())
+
+
+def downgrade():
+    drop_rollup_triggers(op.get_bind())
+    op.drop_table('order_daily_stats')
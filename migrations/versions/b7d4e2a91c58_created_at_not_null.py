@@ -0,0 +1,41 @@
+"""Время создания во всех списках заполнено
+
+Revision ID: b7d4e2a91c58
+Revises: 8f3a6c0d2e17
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d4e2a91c58'
+down_revision = '8f3a6c0d2e17'
+branch_labels = None
+depends_on = None
+
+
+# Таблицы, списки которых листаются по ключу (created_at, id)
+TABLES = ['users', 'materials', 'organizations', 'orders', 'reports', 'products']
+
+
+def upgrade():
+    # Строка без created_at ломала курсор пагинации и выпадала из сравнения по ключу.
+    # Такие строки получают самое раннее время таблицы и остаются в начале списка.
+    # В модели колонки объявлены NOT NULL (для новых баз); в SQLite ограничение
+    # у существующей колонки меняется только пересозданием таблицы, а вместе с ней
+    # пришлось бы пересоздавать триггеры поиска и сводки, поэтому здесь только данные
+    now = sa.bindparam('now', datetime.utcnow(), type_=sa.DateTime())
+    for table in TABLES:
+        op.execute(sa.text(
+            f"UPDATE {table} SET created_at = coalesce((SELECT min(created_at) FROM {table}), :now) "
+            f"WHERE created_at IS NULL"
+        ).bindparams(now))
+
+
+def downgrade():
+    # Какие строки были без времени создания, не известно
+    pass
@@ -0,0 +1,45 @@
+"""Индексы для списков, фильтров и пагинации
+
+Revision ID: d6ed507404c8
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6ed507404c8'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (имя индекса, таблица, колонки)
+INDEXES = [
+    ('ix_users_created_at', 'users', ['created_at']),
+    ('ix_users_role_created_at', 'users', ['role', 'created_at']),
+    ('ix_users_active_created_at', 'users', ['active', 'created_at']),
+    ('ix_materials_created_at', 'materials', ['created_at']),
+    ('ix_materials_quantity', 'materials', ['quantity']),
+    ('ix_organizations_created_at', 'organizations', ['created_at']),
+    ('ix_organizations_salesman_created_at', 'organizations', ['salesman', 'created_at']),
+    ('ix_organizations_buyer_created_at', 'organizations', ['buyer', 'created_at']),
+    ('ix_orders_created_at', 'orders', ['created_at']),
+    ('ix_orders_organization_id', 'orders', ['organization_id']),
+    ('ix_reports_created_at', 'reports', ['created_at']),
+    ('ix_products_created_at', 'products', ['created_at']),
+]
+
+
+def upgrade():
+    # Таблицы создаются через db.create_all() при запуске приложения,
+    # поэтому на новой базе индексы уже могут существовать.
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
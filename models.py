@@ -8,12 +8,16 @@ from extensions import db
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_role_created_at', 'role', 'created_at'),
+        db.Index('ix_users_active_created_at', 'active', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
     role = db.Column(db.String(20), default='user')
     active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     def set_password(self, password):
@@ -46,10 +50,10 @@ class Material(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    quantity = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Float, nullable=False, index=True)
     unit = db.Column(db.String(20), nullable=False)
     price_per_unit = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     def __repr__(self):
@@ -58,6 +62,10 @@ class Material(db.Model):
 
 class Organization(db.Model):
     __tablename__ = 'organizations'
+    __table_args__ = (
+        db.Index('ix_organizations_salesman_created_at', 'salesman', 'created_at'),
+        db.Index('ix_organizations_buyer_created_at', 'buyer', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     inn = db.Column(db.String(12), unique=True, nullable=False)
@@ -65,7 +73,7 @@ class Organization(db.Model):
     phone = db.Column(db.String(20), nullable=False)
     salesman = db.Column(db.Boolean, default=False)
     buyer = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     def __repr__(self):
@@ -76,17 +84,47 @@ class Order(db.Model):
     __tablename__ = 'orders'
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(20), unique=True, nullable=False)
-    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=False)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=False, index=True)
     total_price = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     organization = relationship("Organization")
 
+    @classmethod
+    def list_rows(cls):
+        """
+        Запрос для таблицы заказов: выбирает только отображаемые колонки
+        и название организации одним JOIN-ом. Возвращает лёгкие строки (Row)
+        вместо объектов Order/Organization, без ленивой подгрузки связи.
+        """
+        return db.session.query(
+            cls.id,
+            cls.order_number,
+            cls.total_price,
+            cls.created_at,
+            Organization.name.label('organization_name')
+        ).join(Organization, cls.organization_id == Organization.id)
+
     def __repr__(self):
         return f"<Order('{self.order_number}', '{self.total_price}')>"
 
 
+class OrderDailyStat(db.Model):
+    """
+    Дневная сводка заказов по организациям: количество и выручка.
+    Поддерживается триггерами на таблице orders (см. rollup.py).
+    """
+    __tablename__ = 'order_daily_stats'
+    day = db.Column(db.Date, primary_key=True)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<OrderDailyStat('{self.day}', {self.organization_id}, {self.order_count})>"
+
+
 class Report(db.Model):
     __tablename__ = 'reports'
     id = db.Column(db.Integer, primary_key=True)
@@ -94,7 +132,7 @@ class Report(db.Model):
     period_start = db.Column(db.DateTime, nullable=False)
     period_end = db.Column(db.DateTime, nullable=False)
     data = db.Column(db.JSON)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     def __repr__(self):
         return f"<Report('{self.report_type}', '{self.period_start}-{self.period_end}')>"
@@ -107,7 +145,7 @@ class Product(db.Model):
     weight = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     cost = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
     def __repr__(self):
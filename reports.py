@@ -0,0 +1,285 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+
+from extensions import db
+from maintenance import db_gate
+from models import Order, Report
+from rollup import period_totals, top_organizations, weekly_totals
+
+
+def build_report_data(report_type, start=None, end=None):
+    """
+    Считает данные отчёта за период.
+
+    Args:
+        report_type (str): Тип отчёта
+        start (datetime): Начало периода или None
+        end (datetime): Конец периода или None
+
+    Returns:
+        dict: Данные для поля Report.data
+    """
+    data = {
+        "period_start": start.isoformat(timespec='minutes') if start else None,
+        "period_end": end.isoformat(timespec='minutes') if end else None
+    }
+
+    if report_type == 'performance':
+        # Итоги складываются из недельных сумм, отдельный запрос не нужен
+        weekly = weekly_totals(start, end)
+        total_orders = sum(week["orders"] for week in weekly)
+        total_revenue = sum(week["revenue"] for week in weekly)
+        data.update({
+            "average_order_value": total_revenue / total_orders if total_orders else 0.0,
+            "top_organizations": top_organizations(start, end, current_app.config['REPORT_TOP_ORGANIZATIONS']),
+            "weekly": weekly
+        })
+    else:
+        total_orders, total_revenue = period_totals(start, end)
+
+    data.update({
+        "total_orders": total_orders,
+        "total_revenue": float(total_revenue)
+    })
+    return data
+
+
+class ReportCache:
+    """
+    LRU-кэш результатов отчётов по ключу (report_type, period_start, period_end).
+
+    Записи сбрасываются после коммита изменений заказов, но только те,
+    в период которых попадает изменённый заказ.
+    """
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Растёт при каждом сбросе: результат, посчитанный до сброса, в кэш не кладётся
+        self._generation = 0
+
+    def init_app(self, app):
+        self.max_size = app.config['REPORT_CACHE_SIZE']
+        event.listen(db.session, 'before_flush', _collect_old_order_times)
+        event.listen(db.session, 'after_flush', _collect_new_order_times)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', _discard_order_changes)
+
+    def get_report_data(self, report_type, start=None, end=None):
+        """Возвращает данные отчёта из кэша или считает и кладёт их в кэш."""
+        key = (report_type, start, end)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(self._entries[key])
+            self.misses += 1
+            generation = self._generation
+
+        data = build_report_data(report_type, start, end)
+
+        with self._lock:
+            if self._generation != generation:
+                # Пока отчёт считался, заказы изменились: данные могли устареть
+                return dict(data)
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return dict(data)
+
+    def invalidate(self, moments):
+        """
+        Удаляет записи, в период которых попадает хотя бы один из моментов времени.
+
+        Args:
+            moments (iterable): Значения created_at изменённых заказов
+        """
+        moments = list(moments)
+        if not moments:
+            return
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                _, start, end = key
+                if any((start is None or start <= moment) and (end is None or moment <= end) for moment in moments):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Статистика для страницы настроек."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total * 100 if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
+
+    def _after_commit(self, session):
+        self.invalidate(session.info.pop('changed_order_times', ()))
+
+
+def _changed_order_times(session):
+    return session.info.setdefault('changed_order_times', set())
+
+
+def _collect_old_order_times(session, flush_context, instances):
+    """Перед flush запоминает прежние created_at изменяемых и удаляемых заказов."""
+    ids = [
+        inspect(obj).identity[0]
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Order) and inspect(obj).persistent
+        and (obj in session.deleted or session.is_modified(obj))
+    ]
+    if ids:
+        # Старое значение берём из базы: атрибут мог быть сброшен после коммита
+        old_times = session.execute(select(Order.created_at).where(Order.id.in_(ids))).scalars()
+        _changed_order_times(session).update(moment for moment in old_times if moment is not None)
+
+
+def _collect_new_order_times(session, flush_context):
+    """После flush запоминает created_at новых и изменённых заказов."""
+    moments = _changed_order_times(session)
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Order) and (obj in session.new or session.is_modified(obj)):
+            moments.add(obj.created_at or datetime.utcnow())
+
+
+def _discard_order_changes(session):
+    session.info.pop('changed_order_times', None)
+
+
+class ReportJob:
+    """Задание на генерацию отчёта в фоновом потоке."""
+
+    def __init__(self, report_type, start, end):
+        self.id = uuid.uuid4().hex
+        self.report_type = report_type
+        self.start = start
+        self.end = end
+        self.status = 'queued'
+        self.progress = 0
+        self.report_id = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "report_type": self.report_type,
+            "status": self.status,
+            "progress": self.progress,
+            "report_id": self.report_id,
+            "error": self.error
+        }
+
+
+class ReportJobQueue:
+    """
+    Очередь генерации отчётов на пуле потоков внутри процесса.
+
+    Запрос только ставит задание в очередь и сразу получает его id;
+    строка Report записывается, когда задание выполнено.
+    """
+
+    # Сколько хранить завершённые задания, чтобы страница успела узнать результат
+    KEEP_FINISHED = timedelta(minutes=10)
+
+    def __init__(self):
+        self._app = None
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.max_pending = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.max_pending = app.config['REPORT_QUEUE_SIZE']
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config['REPORT_WORKERS'], thread_name_prefix='report-job'
+        )
+
+    def submit(self, report_type, start=None, end=None):
+        """
+        Ставит генерацию отчёта в очередь.
+
+        Returns:
+            ReportJob: Задание или None, если очередь заполнена
+        """
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                return None
+            job = ReportJob(report_type, start, end)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def visible_jobs(self):
+        """Задания в очереди, в работе и недавно завершившиеся ошибкой, от старых к новым."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.status != 'done']
+        return sorted(jobs, key=lambda job: job.created_at)
+
+    def _prune(self):
+        threshold = datetime.utcnow() - self.KEEP_FINISHED
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at is not None and job.finished_at < threshold:
+                del self._jobs[job_id]
+
+    def _run(self, job):
+        with self._app.app_context(), db_gate.shared():
+            try:
+                job.status = 'running'
+                job.progress = 10
+                data = report_cache.get_report_data(job.report_type, job.start, job.end)
+                job.progress = 80
+
+                report = Report(
+                    report_type=job.report_type,
+                    period_start=job.start,
+                    period_end=job.end,
+                    data=data
+                )
+                db.session.add(report)
+                db.session.commit()
+                job.report_id = report.id
+                job.progress = 100
+                # finished_at - до статуса: _prune сравнивает его у завершённых заданий
+                job.finished_at = datetime.utcnow()
+                job.status = 'done'
+            except Exception as e:
+                db.session.rollback()
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                job.status = 'failed'
+
+
+report_cache = ReportCache()
+report_queue = ReportJobQueue()
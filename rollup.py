@@ -0,0 +1,194 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import func, literal, select, text, union_all
+
+from extensions import db
+from models import Order, OrderDailyStat, Organization
+
+# Добавляет заказ (new.*) в дневную сводку
+_ADD_NEW = """
+INSERT INTO order_daily_stats (day, organization_id, order_count, revenue)
+VALUES (date(new.created_at), new.organization_id, 1, new.total_price)
+ON CONFLICT (day, organization_id) DO UPDATE SET
+    order_count = order_count + 1,
+    revenue = revenue + excluded.revenue;
+"""
+
+# Вычитает заказ (old.*) из дневной сводки и удаляет опустевшую строку
+_REMOVE_OLD = """
+UPDATE order_daily_stats
+SET order_count = order_count - 1, revenue = revenue - old.total_price
+WHERE day = date(old.created_at) AND organization_id = old.organization_id;
+DELETE FROM order_daily_stats
+WHERE day = date(old.created_at) AND organization_id = old.organization_id AND order_count <= 0;
+"""
+
+ROLLUP_TRIGGERS = {
+    'orders_rollup_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_ai AFTER INSERT ON orders
+        WHEN new.created_at IS NOT NULL
+        BEGIN {_ADD_NEW} END""",
+    'orders_rollup_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_ad AFTER DELETE ON orders
+        WHEN old.created_at IS NOT NULL
+        BEGIN {_REMOVE_OLD} END""",
+    'orders_rollup_au_old': f"""
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_au_old
+        AFTER UPDATE OF created_at, organization_id, total_price ON orders
+        WHEN old.created_at IS NOT NULL
+        BEGIN {_REMOVE_OLD} END""",
+    'orders_rollup_au_new': f"""
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_au_new
+        AFTER UPDATE OF created_at, organization_id, total_price ON orders
+        WHEN new.created_at IS NOT NULL
+        BEGIN {_ADD_NEW} END""",
+}
+
+
+def create_rollup_triggers(conn):
+    """
+    Создаёт триггеры, поддерживающие таблицу order_daily_stats при вставке,
+    изменении и удалении заказов. Если триггеров ещё не было, сводка
+    заполняется из существующих заказов.
+
+    Args:
+        conn: Соединение SQLAlchemy с базой SQLite
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+
+    existing = conn.execute(
+        text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'orders_rollup_%'")
+    ).scalar()
+    for statement in ROLLUP_TRIGGERS.values():
+        conn.execute(text(statement))
+    if existing < len(ROLLUP_TRIGGERS):
+        rebuild_rollup(conn)
+
+
+def drop_rollup_triggers(conn):
+    """Удаляет триггеры сводки."""
+    for name in ROLLUP_TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+
+def rebuild_rollup(conn):
+    """Пересчитывает дневную сводку заново по таблице заказов."""
+    conn.execute(text("DELETE FROM order_daily_stats"))
+    conn.execute(text("""
+        INSERT INTO order_daily_stats (day, organization_id, order_count, revenue)
+        SELECT date(created_at), organization_id, count(*), sum(total_price)
+        FROM orders
+        WHERE created_at IS NOT NULL
+        GROUP BY date(created_at), organization_id
+    """))
+
+
+def _order_rows(*conditions):
+    """Заказы в том же виде, что и строки дневной сводки (для неполных дней)."""
+    return select(
+        func.date(Order.created_at).label('day'),
+        Order.organization_id.label('organization_id'),
+        literal(1).label('order_count'),
+        Order.total_price.label('revenue')
+    ).where(*conditions)
+
+
+def period_rows(start=None, end=None):
+    """
+    Возвращает подзапрос со строками (day, organization_id, order_count, revenue)
+    за период start <= created_at <= end.
+
+    Полные дни периода берутся из дневной сводки, поэтому объём данных зависит
+    от числа дней, а не заказов. Неполные первый и последний день добавляются
+    из таблицы заказов через индекс по created_at.
+
+    Args:
+        start (datetime): Начало периода или None
+        end (datetime): Конец периода (включительно) или None
+    """
+    # Первый день, целиком попадающий в период
+    first_day = None
+    if start is not None:
+        first_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    # День, в котором заканчивается период, всегда считается неполным
+    last_day = end.date() if end is not None else None
+
+    if first_day is not None and last_day is not None and first_day >= last_day:
+        # Период укладывается в пределы пары суток
+        return _order_rows(Order.created_at >= start, Order.created_at <= end).subquery()
+
+    rollup = select(
+        OrderDailyStat.day,
+        OrderDailyStat.organization_id,
+        OrderDailyStat.order_count,
+        OrderDailyStat.revenue
+    )
+    parts = []
+    if first_day is not None:
+        rollup = rollup.where(OrderDailyStat.day >= first_day)
+        if start.time() != time.min:
+            parts.append(_order_rows(Order.created_at >= start,
+                                     Order.created_at < datetime.combine(first_day, time.min)))
+    if last_day is not None:
+        rollup = rollup.where(OrderDailyStat.day < last_day)
+        parts.append(_order_rows(Order.created_at >= datetime.combine(last_day, time.min),
+                                 Order.created_at <= end))
+    return union_all(rollup, *parts).subquery()
+
+
+def period_totals(start=None, end=None):
+    """
+    Возвращает количество заказов и выручку за период start <= created_at <= end.
+
+    Returns:
+        tuple: (total_orders, total_revenue)
+    """
+    rows = period_rows(start, end)
+    total_orders, total_revenue = db.session.execute(
+        select(func.coalesce(func.sum(rows.c.order_count), 0), func.coalesce(func.sum(rows.c.revenue), 0.0))
+    ).one()
+    return total_orders, total_revenue
+
+
+def top_organizations(start=None, end=None, limit=10):
+    """
+    Организации с наибольшей выручкой за период.
+
+    Returns:
+        list: Словари с id, названием, количеством заказов и выручкой
+    """
+    rows = period_rows(start, end)
+    revenue = func.sum(rows.c.revenue).label('revenue')
+    result = db.session.execute(
+        select(Organization.id, Organization.name, func.sum(rows.c.order_count).label('orders'), revenue)
+        .join(Organization, Organization.id == rows.c.organization_id)
+        .group_by(Organization.id, Organization.name)
+        .order_by(revenue.desc())
+        .limit(limit)
+    )
+    return [
+        {"id": row.id, "name": row.name, "orders": row.orders, "revenue": float(row.revenue)}
+        for row in result
+    ]
+
+
+def weekly_totals(start=None, end=None):
+    """
+    Количество заказов и выручка по неделям периода (неделя начинается с понедельника).
+
+    Returns:
+        list: Словари с датой начала недели, количеством заказов и выручкой
+    """
+    rows = period_rows(start, end)
+    # date(day, 'weekday 0', '-6 days') - понедельник той же недели
+    week = func.date(rows.c.day, 'weekday 0', '-6 days').label('week')
+    result = db.session.execute(
+        select(week, func.sum(rows.c.order_count).label('orders'), func.sum(rows.c.revenue).label('revenue'))
+        .group_by(week)
+        .order_by(week)
+    )
+    return [
+        {"week": row.week, "orders": row.orders, "revenue": float(row.revenue)}
+        for row in result
+    ]
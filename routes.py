@@ -1,12 +1,13 @@
+import hashlib
 import signal
-import sys
-import time
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app, \
+    jsonify, abort, Response, stream_with_context
 from flask_login import login_required, login_user, logout_user, current_user
 
-from backup_system import full_backup, get_last_full_backup_time, get_last_backup_time, incremental_backup, \
-    differential_backup, read_backup_log, restore_backup
+from backup_system import read_backup_log, get_backup, restore_backup, restore_to_time, collect_repository_garbage
+from backup_scheduler import backup_scheduler, backup_uploader, prune_by_config, run_backup, verification_summary, \
+    verify_by_config
 from models import User, Material, Organization, Order, Report, Product
 from forms import (
     LoginForm, AddMaterialForm, EditMaterialForm, AddOrganizationForm,
@@ -16,13 +17,63 @@ from forms import (
 )
 from datetime import datetime
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from bulk_load import FORMATS, LOADERS, BulkLoadResult, load_organizations, read_records
+from exports import (
+    send_export, set_attachment, iter_organizations_json, write_orders_xlsx, write_orders_pdf, write_report_xlsx,
+    write_report_pdf, XLSX_MIMETYPE, PDF_MIMETYPE, NDJSON_MIMETYPE
+)
 from extensions import db
+from maintenance import db_gate
+from reports import report_cache, report_queue
+from search import search_filter
+from utils import iter_json_array, keyset_paginate, keyset_query, stream_page
+from write_queue import RowNotFound, add_row, delete_row, get_row, update_row, write_queue
+import io
 import os
 import json
 
 main_bp = Blueprint('main', __name__)
 
 
+def _render_list(template_name, query, model, rows_name, descending=False, **context):
+    """
+    Рендерит страницу списка. По умолчанию показывает одну страницу (пагинация
+    по ключу), а с параметром all=1 отдаёт весь отфильтрованный список потоком,
+    читая строки из курсора порциями. Пуст ли список, шаблон узнаёт из has_rows.
+    """
+    if request.values.get('all'):
+        # Запрос всегда истинен в шаблоне, поэтому наличие строк проверяется отдельно
+        has_rows = db.session.query(query.exists()).scalar()
+        rows = keyset_query(query, model.created_at, model.id, descending=descending)
+        rows = rows.yield_per(current_app.config['STREAM_BATCH_SIZE'])
+        return stream_page(template_name, next_cursor=None, has_rows=has_rows, **{rows_name: rows}, **context)
+
+    rows, next_cursor = keyset_paginate(
+        query, model.created_at, model.id, after=request.values.get('after'), descending=descending
+    )
+    return render_template(template_name, next_cursor=next_cursor, has_rows=bool(rows), **{rows_name: rows},
+                           **context)
+
+
+def _save(work):
+    """
+    Выполняет изменение через очередь записи. Если строку уже удалил другой
+    запрос или изменение нарушает ограничение базы, показывает ошибку.
+
+    Returns:
+        bool: True, если изменение сохранено
+    """
+    try:
+        write_queue.run(work)
+        return True
+    except RowNotFound:
+        flash("Запись уже удалена другим пользователем.", "danger")
+    except IntegrityError as e:
+        flash(f"Изменение не сохранено: {e.orig}.", "danger")
+    return False
+
+
 @main_bp.route('/')
 def home():
     return render_template('home.html')
@@ -96,8 +147,7 @@ def users_list():
         elif active == 'False':
             query = query.filter(User.active == False)
 
-    filtered_users = query.all()
-    return render_template('admin/users.html', users=filtered_users, filter_form=filter_form)
+    return _render_list('admin/users.html', query, User, 'users', filter_form=filter_form)
 
 
 @main_bp.route('/add-user', methods=['GET', 'POST'])
@@ -115,10 +165,9 @@ def add_user():
             active=form.active.data
         )
         new_user.set_password(form.password.data)
-        db.session.add(new_user)
-        db.session.commit()
-        flash(f"Пользователь {new_user.username} успешно добавлен.", 'success')
-        return redirect(url_for('main.users_list'))
+        if _save(add_row(new_user)):
+            flash(f"Пользователь {form.username.data} успешно добавлен.", 'success')
+            return redirect(url_for('main.users_list'))
     return render_template('admin/add_user.html', form=form)
 
 
@@ -134,11 +183,13 @@ def edit_user(id):
     form.user_id = user.id
 
     if form.validate_on_submit():
-        user.username = form.username.data
-        user.role = form.role.data
-        user.active = form.active.data
-        db.session.commit()
-        flash(f"Данные пользователя {user.username} успешно обновлены.", 'success')
+        if _save(update_row(
+            User, user.id,
+            username=form.username.data,
+            role=form.role.data,
+            active=form.active.data
+        )):
+            flash(f"Данные пользователя {form.username.data} успешно обновлены.", 'success')
         return redirect(url_for('main.users_list'))
     return render_template('admin/edit_user.html', form=form, user=user)
 
@@ -155,9 +206,9 @@ def delete_user(id):
         flash("Нельзя удалить самого себя.", "danger")
         return redirect(url_for('main.users_list'))
 
-    db.session.delete(user)
-    db.session.commit()
-    flash(f"Пользователь {user.username} удалён.", "success")
+    username = user.username
+    if _save(delete_row(User, user.id)):
+        flash(f"Пользователь {username} удалён.", "success")
     return redirect(url_for('main.users_list'))
 
 
@@ -174,14 +225,13 @@ def materials_list():
         max_qty = filter_form.max_quantity.data
 
         if search:
-            query = query.filter(Material.name.contains(search))
+            query = query.filter(search_filter(Material, search))
         if min_qty is not None:
             query = query.filter(Material.quantity >= min_qty)
         if max_qty is not None:
             query = query.filter(Material.quantity <= max_qty)
 
-    filtered_materials = query.all()
-    return render_template('materials.html', materials=filtered_materials, filter_form=filter_form)
+    return _render_list('materials.html', query, Material, 'materials', filter_form=filter_form)
 
 
 @main_bp.route('/add-material', methods=['GET', 'POST'])
@@ -196,10 +246,9 @@ def add_material():
             unit=form.unit.data,
             price_per_unit=float(form.price_per_unit.data)
         )
-        db.session.add(new_material)
-        db.session.commit()
-        flash(f"Материал {new_material.name} успешно добавлен.", 'success')
-        return redirect(url_for('main.materials_list'))
+        if _save(add_row(new_material)):
+            flash(f"Материал {form.name.data} успешно добавлен.", 'success')
+            return redirect(url_for('main.materials_list'))
     return render_template('add_material.html', form=form)
 
 
@@ -209,13 +258,15 @@ def edit_material(id):
     material = Material.query.get_or_404(id)
     form = EditMaterialForm(obj=material)
     if form.validate_on_submit():
-        material.name = form.name.data
-        material.description = form.description.data
-        material.quantity = float(form.quantity.data)
-        material.unit = form.unit.data
-        material.price_per_unit = float(form.price_per_unit.data)
-        db.session.commit()
-        flash(f"Материал {material.name} успешно обновлён.", 'success')
+        if _save(update_row(
+            Material, material.id,
+            name=form.name.data,
+            description=form.description.data,
+            quantity=float(form.quantity.data),
+            unit=form.unit.data,
+            price_per_unit=float(form.price_per_unit.data)
+        )):
+            flash(f"Материал {form.name.data} успешно обновлён.", 'success')
         return redirect(url_for('main.materials_list'))
     return render_template('edit_material.html', form=form, material=material)
 
@@ -224,9 +275,9 @@ def edit_material(id):
 @login_required
 def delete_material(id):
     material = Material.query.get_or_404(id)
-    db.session.delete(material)
-    db.session.commit()
-    flash(f"Материал {material.name} удалён.", "success")
+    name = material.name
+    if _save(delete_row(Material, material.id)):
+        flash(f"Материал {name} удалён.", "success")
     return redirect(url_for('main.materials_list'))
 
 
@@ -243,14 +294,13 @@ def organizations_list():
         buyer = filter_form.buyer_filter.data
 
         if search:
-            query = query.filter(Organization.name.contains(search))
+            query = query.filter(search_filter(Organization, search))
         if salesman:
             query = query.filter(Organization.salesman == True)
         if buyer:
             query = query.filter(Organization.buyer == True)
 
-    filtered_organizations = query.all()
-    return render_template('organizations.html', organizations=filtered_organizations, filter_form=filter_form)
+    return _render_list('organizations.html', query, Organization, 'organizations', filter_form=filter_form)
 
 
 @main_bp.route('/add-organization', methods=['GET', 'POST'])
@@ -266,10 +316,9 @@ def add_organization():
             salesman=form.salesman.data,
             buyer=form.buyer.data
         )
-        db.session.add(new_org)
-        db.session.commit()
-        flash(f"Организация {new_org.name} успешно добавлена.", 'success')
-        return redirect(url_for('main.organizations_list'))
+        if _save(add_row(new_org)):
+            flash(f"Организация {form.name.data} успешно добавлена.", 'success')
+            return redirect(url_for('main.organizations_list'))
     return render_template('add_organization.html', form=form)
 
 
@@ -279,14 +328,16 @@ def edit_organization(id):
     org = Organization.query.get_or_404(id)
     form = EditOrganizationForm(obj=org)
     if form.validate_on_submit():
-        org.name = form.name.data
-        org.inn = form.inn.data
-        org.address = form.address.data
-        org.phone = form.phone.data
-        org.salesman = form.salesman.data
-        org.buyer = form.buyer.data
-        db.session.commit()
-        flash(f"Организация {org.name} успешно обновлена.", 'success')
+        if _save(update_row(
+            Organization, org.id,
+            name=form.name.data,
+            inn=form.inn.data,
+            address=form.address.data,
+            phone=form.phone.data,
+            salesman=form.salesman.data,
+            buyer=form.buyer.data
+        )):
+            flash(f"Организация {form.name.data} успешно обновлена.", 'success')
         return redirect(url_for('main.organizations_list'))
     return render_template('edit_organization.html', form=form, org=org)
 
@@ -295,9 +346,13 @@ def edit_organization(id):
 @login_required
 def delete_organization(id):
     org = Organization.query.get_or_404(id)
-    db.session.delete(org)
-    db.session.commit()
-    flash(f"Организация {org.name} удалена.", "success")
+    orders = Order.query.filter_by(organization_id=org.id).count()
+    if orders:
+        flash(f"Организацию {org.name} нельзя удалить: у неё {orders} заказов.", "danger")
+        return redirect(url_for('main.organizations_list'))
+    name = org.name
+    if _save(delete_row(Organization, org.id)):
+        flash(f"Организация {name} удалена.", "success")
     return redirect(url_for('main.organizations_list'))
 
 
@@ -318,69 +373,90 @@ def import_organizations():
             flash("Файл не выбран.", "warning")
             return redirect(request.url)
         if file and file.filename.endswith('.json'):
+            result = BulkLoadResult()
             try:
-                content = file.read().decode('utf-8')
-                data = json.loads(content)
-                if isinstance(data, dict):
-                    data = data.get('organizations', [])
-                elif not isinstance(data, list):
-                    raise ValueError("Неверный формат JSON.")
-
-                imported_count = 0
-                for item in data:
-                    inn = item.get('inn')
-                    if not inn:
-                        continue
-                    if not Organization.query.filter_by(inn=inn).first():
-                        new_org = Organization(
-                            name=item.get('name', 'Не указано'),
-                            inn=inn,
-                            address=item.get('address', ''),
-                            phone=item.get('phone', ''),
-                            salesman=item.get('salesman', False),
-                            buyer=item.get('buyer', True)
-                        )
-                        db.session.add(new_org)
-                        imported_count += 1
-                db.session.commit()
-                flash(f"Импортировано {imported_count} новых организаций.", "success")
+                # Файл разбирается по одной записи, а не загружается целиком
+                stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig')
+                load_organizations(iter_json_array(stream, key='organizations'), result)
+                flash(f"Импорт завершён: {result.summary()}.", "success")
                 return redirect(url_for('main.organizations_list'))
             except Exception as e:
                 db.session.rollback()
-                flash(f"Ошибка при импорте: {e}", "danger")
+                flash(f"Ошибка при импорте: {e}. До ошибки {result.summary()}.", "danger")
         else:
             flash("Только .json файлы поддерживаются.", "danger")
     return render_template('admin/import_organizations.html')
 
 
-@main_bp.route('/export-organizations')
+@main_bp.route('/bulk-load', methods=['GET', 'POST'])
 @login_required
-def export_organizations():
+def bulk_load():
     if current_user.role != 'admin':
         flash("Доступ запрещён.", "danger")
         return redirect(url_for('main.dashboard'))
 
-    buyers = Organization.query.filter_by(buyer=True).all()
-    data = [
-        {
-            "name": org.name,
-            "inn": org.inn,
-            "address": org.address,
-            "phone": org.phone,
-            "salesman": org.salesman,
-            "buyer": org.buyer
-        }
-        for org in buyers
-    ]
-
-    temp_dir = os.path.join("temp")
-    os.makedirs(temp_dir, exist_ok=True)
-    file_path = os.path.join(temp_dir, "Заказчики.json")
+    if request.method == 'POST':
+        entity = request.form.get('entity')
+        file = request.files.get('file')
+        fmt = os.path.splitext(file.filename)[1].lstrip('.').lower() if file else ''
+        if entity not in LOADERS:
+            flash("Выберите, что загружать.", "warning")
+        elif not file or file.filename == '':
+            flash("Файл не выбран.", "warning")
+        elif fmt not in FORMATS:
+            flash("Поддерживаются только файлы .csv, .ndjson и .json.", "danger")
+        else:
+            result = BulkLoadResult()
+            try:
+                stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+                LOADERS[entity](read_records(stream, fmt, key=entity), result)
+                for error in result.errors:
+                    flash(error, "warning")
+                flash(f"Загрузка завершена: {result.summary()} "
+                      f"({result.rows_per_second:.0f} строк/с).", "success")
+            except Exception as e:
+                db.session.rollback()
+                flash(f"Ошибка при загрузке: {e}. До ошибки {result.summary()}.", "danger")
+        return redirect(url_for('main.bulk_load'))
+    return render_template('admin/bulk_load.html')
 
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
 
-    return send_file(file_path, as_attachment=True, download_name="Заказчики.json")
+@main_bp.route('/export-organizations')
+@login_required
+def export_organizations():
+    if current_user.role != 'admin':
+        flash("Доступ запрещён.", "danger")
+        return redirect(url_for('main.dashboard'))
+
+    ndjson = request.args.get('format') == 'ndjson'
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+
+    # ETag и Last-Modified: время последнего изменения организаций и число заказчиков
+    # (число меняется при удалении, которое время изменения не сдвигает)
+    newest, buyers_count = db.session.query(
+        func.max(func.coalesce(Organization.updated_at, Organization.created_at)),
+        func.count(Organization.id).filter(Organization.buyer == True)
+    ).one()
+    etag = hashlib.sha1(f"{newest}|{buyers_count}|{ndjson}".encode()).hexdigest()
+
+    rows = db.session.query(
+        Organization.name, Organization.inn, Organization.address,
+        Organization.phone, Organization.salesman, Organization.buyer
+    ).filter(Organization.buyer == True).order_by(Organization.id).yield_per(batch_size)
+
+    # Записи пишутся в ответ прямо из курсора, общий файл в temp/ не нужен
+    response = Response(
+        stream_with_context(iter_organizations_json(rows, ndjson=ndjson, batch_size=batch_size)),
+        mimetype=NDJSON_MIMETYPE if ndjson else 'application/json'
+    )
+    set_attachment(response, "Заказчики.ndjson" if ndjson else "Заказчики.json")
+    response.set_etag(etag)
+    if newest:
+        response.last_modified = newest
+    response.cache_control.no_cache = True
+    # Иначе make_conditional прочитает весь поток, чтобы посчитать Content-Length
+    response.automatically_set_content_length = False
+    return response.make_conditional(request)
 
 
 # --- Заказы ---
@@ -388,22 +464,42 @@ def export_organizations():
 @login_required
 def orders_list():
     filter_form = FilterOrdersForm()
-    query = Order.query.join(Organization)
+    query = _filter_orders(filter_form, Order.list_rows())
+    return _render_list('orders.html', query, Order, 'orders', filter_form=filter_form)
+
 
+def _filter_orders(filter_form, query):
+    """Применяет к запросу заказов условия из формы фильтра, если она отправлена."""
     if filter_form.validate_on_submit():
         search = filter_form.search_query.data.strip() if filter_form.search_query.data else None
         date_from = filter_form.date_from.data
         date_to = filter_form.date_to.data
 
         if search:
-            query = query.filter(Order.order_number.contains(search))
+            query = query.filter(search_filter(Order, search))
         if date_from:
             query = query.filter(Order.created_at >= date_from)
         if date_to:
             query = query.filter(Order.created_at <= date_to)
+    return query
+
+
+@main_bp.route('/export-orders/<fmt>', methods=['GET', 'POST'])
+@login_required
+def export_orders(fmt):
+    """
+    Экспорт отфильтрованного списка заказов в XLSX или PDF.
+    Строки читаются из курсора порциями и сразу записываются в файл.
+    """
+    filter_form = FilterOrdersForm()
+    query = _filter_orders(filter_form, Order.list_rows())
+    rows = keyset_query(query, Order.created_at, Order.id).yield_per(current_app.config['STREAM_BATCH_SIZE'])
 
-    filtered_orders = query.all()
-    return render_template('orders.html', orders=filtered_orders, filter_form=filter_form)
+    if fmt == 'xlsx':
+        return send_export(lambda f: write_orders_xlsx(rows, f), "Заказы.xlsx", XLSX_MIMETYPE)
+    if fmt == 'pdf':
+        return send_export(lambda f: write_orders_pdf(rows, f), "Заказы.pdf", PDF_MIMETYPE)
+    abort(404)
 
 
 @main_bp.route('/add-order', methods=['GET', 'POST'])
@@ -416,10 +512,9 @@ def add_order():
             organization_id=form.organization_id.data,
             total_price=float(form.total_price.data)
         )
-        db.session.add(new_order)
-        db.session.commit()
-        flash(f"Заказ {new_order.order_number} успешно добавлен.", 'success')
-        return redirect(url_for('main.orders_list'))
+        if _save(add_row(new_order)):
+            flash(f"Заказ {form.order_number.data} успешно добавлен.", 'success')
+            return redirect(url_for('main.orders_list'))
     return render_template('add_order.html', form=form)
 
 
@@ -429,11 +524,13 @@ def edit_order(id):
     order = Order.query.get_or_404(id)
     form = EditOrderForm(obj=order)
     if form.validate_on_submit():
-        order.order_number = form.order_number.data
-        order.organization_id = form.organization_id.data
-        order.total_price = float(form.total_price.data)
-        db.session.commit()
-        flash(f"Заказ {order.order_number} успешно обновлён.", 'success')
+        if _save(update_row(
+            Order, order.id,
+            order_number=form.order_number.data,
+            organization_id=form.organization_id.data,
+            total_price=float(form.total_price.data)
+        )):
+            flash(f"Заказ {form.order_number.data} успешно обновлён.", 'success')
         return redirect(url_for('main.orders_list'))
     return render_template('edit_order.html', form=form, order=order)
 
@@ -442,9 +539,9 @@ def edit_order(id):
 @login_required
 def delete_order(id):
     order = Order.query.get_or_404(id)
-    db.session.delete(order)
-    db.session.commit()
-    flash(f"Заказ {order.order_number} удалён.", "success")
+    order_number = order.order_number
+    if _save(delete_row(Order, order.id)):
+        flash(f"Заказ {order_number} удалён.", "success")
     return redirect(url_for('main.orders_list'))
 
 
@@ -452,8 +549,8 @@ def delete_order(id):
 @main_bp.route('/reports')
 @login_required
 def reports_list():
-    reports = Report.query.order_by(Report.created_at.desc()).all()
-    return render_template('reports.html', reports=reports)
+    return _render_list('reports.html', Report.query, Report, 'reports', descending=True,
+                        report_jobs=report_queue.visible_jobs())
 
 
 @main_bp.route('/generate-report', methods=['GET', 'POST'])
@@ -464,37 +561,33 @@ def generate_report():
         start = request.form.get('start')
         end = request.form.get('end')
 
-        query = Order.query
-        if start:
-            query = query.filter(Order.created_at >= datetime.fromisoformat(start))
-        if end:
-            query = query.filter(Order.created_at <= datetime.fromisoformat(end))
-
-        total_orders = query.count()
-        total_revenue = db.session.query(func.sum(Order.total_price)).scalar() or 0.0
-
-        report_data = {
-            "total_orders": total_orders,
-            "total_revenue": float(total_revenue),
-            "period_start": start,
-            "period_end": end
-        }
-
-        new_report = Report(
-            report_type=report_type,
-            period_start=datetime.fromisoformat(start) if start else None,
-            period_end=datetime.fromisoformat(end) if end else None,
-            data=report_data
+        job = report_queue.submit(
+            report_type,
+            datetime.fromisoformat(start) if start else None,
+            datetime.fromisoformat(end) if end else None
         )
-        db.session.add(new_report)
-        db.session.commit()
+        if job is None:
+            flash("Очередь отчётов заполнена, попробуйте позже.", "warning")
+            return redirect(url_for('main.generate_report'))
 
-        flash("Отчёт успешно сгенерирован.", "success")
+        flash("Отчёт поставлен в очередь на генерацию.", "info")
         return redirect(url_for('main.reports_list'))
 
     return render_template('generate_report.html')
 
 
+@main_bp.route('/report-jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    """
+    Состояние задания генерации отчёта (для опроса со страницы отчётов).
+    """
+    job = report_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
 # --- Настройки ---
 @main_bp.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -521,17 +614,28 @@ def settings():
             elif len(new_pass) < 6:
                 flash("Пароль должен быть не менее 6 символов.", "danger")
             else:
-                current_user.set_password(new_pass)
-                db.session.commit()
-                flash("Пароль успешно изменён.", "success")
+                # current_user недоступен в потоке очереди, поэтому id берётся заранее
+                user_id = current_user.id
+
+                def change_password(session):
+                    get_row(session, User, user_id).set_password(new_pass)
+
+                if _save(change_password):
+                    flash("Пароль успешно изменён.", "success")
 
         elif action == 'cleanup_temp':
             count = cleanup_temp_files()
             flash(f"Удалено {count} временных файлов.", "info")
 
+    backup_log = read_backup_log()
     return render_template(
         'admin/settings.html',
-        backup_log = read_backup_log(),
+        backup_log = backup_log,
+        backup_status=backup_scheduler.status(),
+        verification=verification_summary(backup_log),
+        upload=backup_uploader.status(backup_log),
+        report_cache_stats=report_cache.stats(),
+        write_queue_stats=write_queue.stats(),
         debug=config.DevelopmentConfig.DEBUG,
         db_uri=config.Config.SQLALCHEMY_DATABASE_URI,
         version="1.0.0"
@@ -542,8 +646,7 @@ def settings():
 @main_bp.route('/products')
 @login_required
 def products_list():
-    items = Product.query.all()
-    return render_template('products.html', items=items)
+    return _render_list('products.html', Product.query, Product, 'items')
 
 
 @main_bp.route('/add-product', methods=['GET', 'POST'])
@@ -557,10 +660,9 @@ def add_product():
             quantity=form.quantity.data,
             cost=float(form.cost.data)
         )
-        db.session.add(new_product)
-        db.session.commit()
-        flash(f"Товар '{new_product.name}' успешно добавлен.", 'success')
-        return redirect(url_for('main.products_list'))
+        if _save(add_row(new_product)):
+            flash(f"Товар '{form.name.data}' успешно добавлен.", 'success')
+            return redirect(url_for('main.products_list'))
     return render_template('add_product.html', form=form)
 
 
@@ -570,12 +672,14 @@ def edit_product(id):
     product = Product.query.get_or_404(id)
     form = EditProductForm(original_name=product.name, obj=product)
     if form.validate_on_submit():
-        product.name = form.name.data
-        product.weight = float(form.weight.data)
-        product.quantity = form.quantity.data
-        product.cost = float(form.cost.data)
-        db.session.commit()
-        flash(f"Товар '{product.name}' успешно обновлён.", 'success')
+        if _save(update_row(
+            Product, product.id,
+            name=form.name.data,
+            weight=float(form.weight.data),
+            quantity=form.quantity.data,
+            cost=float(form.cost.data)
+        )):
+            flash(f"Товар '{form.name.data}' успешно обновлён.", 'success')
         return redirect(url_for('main.products_list'))
     return render_template('edit_product.html', form=form, product=product)
 
@@ -584,9 +688,9 @@ def edit_product(id):
 @login_required
 def delete_product(id):
     product = Product.query.get_or_404(id)
-    db.session.delete(product)
-    db.session.commit()
-    flash(f"Товар '{product.name}' удалён.", 'success')
+    name = product.name
+    if _save(delete_row(Product, product.id)):
+        flash(f"Товар '{name}' удалён.", 'success')
     return redirect(url_for('main.products_list'))
 
 # --- Отчёты: просмотр и экспорт ---
@@ -604,9 +708,15 @@ def view_report(id):
 @login_required
 def export_report(id):
     """
-    Экспорт отчёта в JSON.
+    Экспорт отчёта в JSON, XLSX (?format=xlsx) или PDF (?format=pdf).
     """
     report = Report.query.get_or_404(id)
+    fmt = request.args.get('format', 'json')
+    if fmt == 'xlsx':
+        return send_export(lambda f: write_report_xlsx(report, f), f"Отчёт_{report.id}.xlsx", XLSX_MIMETYPE)
+    if fmt == 'pdf':
+        return send_export(lambda f: write_report_pdf(report, f), f"Отчёт_{report.id}.pdf", PDF_MIMETYPE)
+
     data = {
         "id": report.id,
         "type": report.report_type,
@@ -624,7 +734,7 @@ def export_report(id):
 @main_bp.route('/backup/full', methods=['POST'])
 @login_required
 def backup_full():
-    success, msg = full_backup()
+    success, msg = run_backup('full')
     flash(msg, 'success' if success else 'danger')
     return redirect(url_for('main.settings'))
 
@@ -632,16 +742,48 @@ def backup_full():
 @main_bp.route('/backup/incremental', methods=['POST'])
 @login_required
 def backup_incremental():
-    last_time = get_last_backup_time()
-    success, msg = incremental_backup(last_backup_time=last_time)
+    success, msg = run_backup('incremental')
     flash(msg, 'success' if success else 'danger')
     return redirect(url_for('main.settings'))
 
 @main_bp.route('/backup/differential', methods=['POST'])
 @login_required
 def backup_differential():
-    last_time = get_last_full_backup_time()
-    success, msg = differential_backup(last_full_backup_time=last_time)
+    success, msg = run_backup('differential')
+    flash(msg, 'success' if success else 'danger')
+    return redirect(url_for('main.settings'))
+
+
+@main_bp.route('/backup/prune', methods=['POST'])
+@login_required
+def backup_prune():
+    success, msg = prune_by_config()
+    flash(msg, 'success' if success else 'danger')
+    return redirect(url_for('main.settings'))
+
+
+@main_bp.route('/backup/verify', methods=['POST'])
+@login_required
+def backup_verify():
+    success, msg = verify_by_config(only_unverified=not request.form.get('all'))
+    flash(msg, 'success' if success else 'danger')
+    return redirect(url_for('main.settings'))
+
+
+@main_bp.route('/backup/upload', methods=['POST'])
+@login_required
+def backup_upload():
+    if backup_uploader.submit():
+        flash("Отправка бэкапов в хранилище запущена в фоне.", "info")
+    else:
+        flash("Хранилище для копий бэкапов не настроено (BACKUP_TARGET).", "warning")
+    return redirect(url_for('main.settings'))
+
+
+@main_bp.route('/backup/gc', methods=['POST'])
+@login_required
+def backup_gc():
+    success, msg = collect_repository_garbage()
     flash(msg, 'success' if success else 'danger')
     return redirect(url_for('main.settings'))
 
@@ -649,26 +791,45 @@ def backup_differential():
 @main_bp.route('/restore/<int:backup_id>', methods=['POST'])
 @login_required
 def restore_from_backup(backup_id):
-    log_entries = read_backup_log()
-    if backup_id >= len(log_entries):
+    entry = get_backup(backup_id)
+    if entry is None:
         flash("Неверный ID резервной копии.", "danger")
         return redirect(url_for('main.settings'))
 
-    entry = log_entries[backup_id]
-    success, msg = restore_backup(entry['path'])
+    timeout = current_app.config['RESTORE_WAIT_TIMEOUT']
+    success, msg = restore_backup(
+        entry['path'],
+        db_path=db.engine.url.database,
+        workers=current_app.config['BACKUP_WORKERS'],
+        quiesce=lambda: db_gate.paused(timeout),
+        check=current_app.config['BACKUP_VERIFY_MODE']
+    )
 
     if success:
-        # Сохраняем сообщение в сессии для отображения после перезапуска
-        session['restore_success'] = msg
-        # Возвращаем специальную страницу с JavaScript для перезапуска
-        return render_template('restarting.html')
-    else:
-        flash(msg, 'danger')
-        return redirect(url_for('main.settings'))
+        # Отчёты в кэше посчитаны по прежним данным
+        report_cache.clear()
+    flash(msg, 'success' if success else 'danger')
+    return redirect(url_for('main.settings'))
 
 
-@main_bp.route('/restart', methods=['POST'])
-def restart_app():
-    time.sleep(1)
-    os.execl(sys.executable, sys.executable, *sys.argv)
-    return '', 200
\ No newline at end of file
+@main_bp.route('/restore/point-in-time', methods=['POST'])
+@login_required
+def restore_point_in_time():
+    try:
+        target = datetime.fromisoformat(request.form.get('moment', ''))
+    except ValueError:
+        flash("Укажите дату и время восстановления.", "danger")
+        return redirect(url_for('main.settings'))
+
+    timeout = current_app.config['RESTORE_WAIT_TIMEOUT']
+    success, msg = restore_to_time(
+        target,
+        db_path=db.engine.url.database,
+        workers=current_app.config['BACKUP_WORKERS'],
+        quiesce=lambda: db_gate.paused(timeout),
+        check=current_app.config['BACKUP_VERIFY_MODE']
+    )
+    if success:
+        report_cache.clear()
+    flash(msg, 'success' if success else 'danger')
+    return redirect(url_for('main.settings'))
\ No newline at end of file
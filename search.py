@@ -0,0 +1,114 @@
+import re
+
+from sqlalchemy import literal_column, select, table, text
+
+from extensions import db
+
+# Таблицы и колонки, по которым строится полнотекстовый индекс FTS5
+SEARCH_INDEXES = {
+    'materials': ('name', 'description'),
+    'organizations': ('name', 'inn', 'address'),
+    'orders': ('order_number',),
+}
+
+# unicode61 приводит к нижнему регистру любые буквы Unicode, включая кириллицу
+FTS_OPTIONS = "tokenize='unicode61', prefix='2 3'"
+
+
+def _search_ddl(table_name, columns):
+    """Возвращает SQL для создания FTS-таблицы и триггеров синхронизации."""
+    fts = f"{table_name}_fts"
+    cols = ', '.join(columns)
+    new_values = ', '.join(f"new.{c}" for c in columns)
+    old_values = ', '.join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{table_name}', content_rowid='id', {FTS_OPTIONS})",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def create_search_index(conn):
+    """
+    Создаёт FTS5-индексы и триггеры, если их ещё нет.
+    Новый индекс сразу заполняется из существующих строк.
+
+    Args:
+        conn: Соединение SQLAlchemy с базой SQLite
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+
+    for table_name, columns in SEARCH_INDEXES.items():
+        fts = f"{table_name}_fts"
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts}
+        ).first()
+        for statement in _search_ddl(table_name, columns):
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def drop_search_index(conn):
+    """Удаляет FTS5-индексы и их триггеры."""
+    for table_name in SEARCH_INDEXES:
+        fts = f"{table_name}_fts"
+        for suffix in ('ai', 'ad', 'au'):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+
+
+def rebuild_search_index(conn):
+    """Перестраивает FTS5-индексы по текущему содержимому таблиц."""
+    for table_name in SEARCH_INDEXES:
+        fts = f"{table_name}_fts"
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def build_match_query(search):
+    """
+    Превращает строку из поля поиска в запрос FTS5: каждое слово ищется
+    по префиксу, все слова должны встретиться (AND).
+
+    Returns:
+        str: Выражение для MATCH или None, если в строке нет слов
+    """
+    words = re.findall(r'\w+', search)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_filter(model, search):
+    """
+    Возвращает условие фильтрации модели по полнотекстовому индексу.
+
+    Args:
+        model: Модель из SEARCH_INDEXES (Material, Organization, Order)
+        search (str): Строка из поля поиска
+
+    Returns:
+        Условие SQLAlchemy для query.filter()
+    """
+    table_name = model.__tablename__
+    columns = SEARCH_INDEXES[table_name]
+    match = build_match_query(search)
+
+    # Без FTS5 (не SQLite) или без слов в запросе ищем подстроку, как раньше
+    if match is None or db.engine.dialect.name != 'sqlite':
+        return getattr(model, columns[0]).contains(search)
+
+    fts = f"{table_name}_fts"
+    matched_ids = (
+        select(literal_column('rowid'))
+        .select_from(table(fts))
+        .where(literal_column(fts).op('MATCH')(match))
+    )
+    return model.id.in_(matched_ids)
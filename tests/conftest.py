@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Модули приложения лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Каталог теста как рабочий: бэкапы пишутся в backups/ относительно него."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def connect(path):
+    """Соединение с базой в режиме WAL без автоматических контрольных точек, как у приложения."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    return conn
+
+
+@pytest.fixture
+def items_db(workdir):
+    """База с таблицей items(id, name). Возвращает (путь, соединение)."""
+    path = str(workdir / 'app.db')
+    conn = connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    yield path, conn
+    conn.close()
+
+
+def add_items(conn, *ids):
+    """Добавляет строки items, каждую отдельной транзакцией."""
+    for item_id in ids:
+        conn.execute("INSERT INTO items (id, name) VALUES (?, ?)", (item_id, f"item {item_id}" * 50))
+
+
+def item_ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM items ORDER BY id")]
+    finally:
+        conn.close()
@@ -0,0 +1,84 @@
+import pytest
+
+from backup_system import (
+    differential_backup, full_backup, get_last_backup, incremental_backup, read_backup_log, restore_backup
+)
+from conftest import add_items, item_ids
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib', 'lzma'])
+@pytest.mark.parametrize('storage', ['files', 'repository'])
+def test_chain_restores_each_backup(items_db, compression, storage):
+    path, conn = items_db
+    add_items(conn, *range(1, 200))
+    expected = []
+
+    ok, msg = full_backup(db_path=path, compression=compression, storage=storage)
+    assert ok, msg
+    expected.append(item_ids(path))
+
+    add_items(conn, 200)
+    ok, msg = incremental_backup(db_path=path, compression=compression)
+    assert ok, msg
+    expected.append(item_ids(path))
+
+    add_items(conn, 201)
+    conn.execute("DELETE FROM items WHERE id < 50")
+    ok, msg = differential_backup(db_path=path, compression=compression)
+    assert ok, msg
+    expected.append(item_ids(path))
+
+    add_items(conn, 202)
+    ok, msg = incremental_backup(db_path=path, compression=compression)
+    assert ok, msg
+    expected.append(item_ids(path))
+    conn.close()
+
+    entries = read_backup_log()
+    assert [entry['type'] for entry in entries] == ['full', 'incremental', 'differential', 'incremental']
+    assert entries[2]['parent'] == entries[0]['filename']
+    assert entries[3]['parent'] == entries[2]['filename']
+    # От последнего к первому: каждое следующее восстановление меняет базу
+    for entry, ids in reversed(list(zip(entries, expected))):
+        ok, msg = restore_backup(entry['path'], db_path=path)
+        assert ok, msg
+        assert item_ids(path) == ids
+
+
+def test_corrupted_compressed_backup_is_not_restored(items_db):
+    path, conn = items_db
+    add_items(conn, 1, 2, 3)
+    ok, msg = full_backup(db_path=path, compression='zlib')
+    assert ok, msg
+    add_items(conn, 4)
+    conn.close()
+
+    backup_path = get_last_backup()['path']
+    with open(backup_path, 'r+b') as f:
+        f.seek(-10, 2)
+        byte = f.read(1)
+        f.seek(-10, 2)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    ok, msg = restore_backup(backup_path, db_path=path)
+    assert not ok
+    assert item_ids(path) == [1, 2, 3, 4]
+
+
+def test_repository_stores_unchanged_chunks_once(items_db):
+    path, conn = items_db
+    add_items(conn, *range(1, 2000))
+    ok, msg = full_backup(db_path=path, storage='repository')
+    assert ok, msg
+
+    add_items(conn, 2000)
+    ok, msg = full_backup(db_path=path, storage='repository')
+    assert ok, msg
+    conn.close()
+
+    first, second = read_backup_log()
+    assert first['new_chunks'] == first['chunks']
+    assert second['new_chunks'] < second['chunks']
+    ok, msg = restore_backup(second['path'], db_path=path)
+    assert ok, msg
+    assert item_ids(path) == list(range(1, 2001))
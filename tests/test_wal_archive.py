@@ -0,0 +1,82 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import backup_system
+from backup_system import WalArchiver, full_backup, restore_to_time, wal_segments
+from conftest import add_items, item_ids
+
+
+@pytest.fixture
+def archiver(items_db):
+    path, _ = items_db
+    archiver = WalArchiver(path)
+    assert archiver.acquire()
+    yield archiver
+    archiver.release()
+
+
+def moment_between():
+    """Момент строго между отправкой предыдущих и следующих кадров."""
+    time.sleep(0.01)
+    moment = datetime.now()
+    time.sleep(0.01)
+    return moment
+
+
+def test_restore_to_time_replays_segments_up_to_target(items_db, archiver):
+    path, conn = items_db
+    add_items(conn, 1, 2, 3)
+    assert archiver.ship() > 0
+
+    ok, msg = full_backup(db_path=path)
+    assert ok, msg
+
+    add_items(conn, 4, 5, 6)
+    assert archiver.ship() > 0
+    target = moment_between()
+    add_items(conn, 7, 8, 9)
+    assert archiver.ship() > 0
+    conn.close()
+
+    ok, msg = restore_to_time(target, db_path=path)
+    assert ok, msg
+    assert item_ids(path) == [1, 2, 3, 4, 5, 6]
+
+
+def test_checkpoint_keeps_timeline(items_db, archiver):
+    path, conn = items_db
+    add_items(conn, 1)
+    archiver.ship()
+    ok, msg = full_backup(db_path=path)
+    assert ok, msg
+    timeline = archiver.timeline
+
+    add_items(conn, 2, 3)
+    archiver.checkpoint()
+    # Журнал перенесён в базу: следующая запись начинает его заново с новой солью
+    add_items(conn, 4)
+    assert archiver.ship() > 0
+    assert archiver.timeline == timeline
+    assert len(wal_segments(timeline, '', datetime.now().isoformat())) >= 3
+    conn.close()
+
+    ok, msg = restore_to_time(moment_between(), db_path=path)
+    assert ok, msg
+    assert item_ids(path) == [1, 2, 3, 4]
+
+
+def test_wal_reset_behind_archiver_starts_new_timeline(items_db, archiver):
+    path, conn = items_db
+    add_items(conn, 1)
+    archiver.ship()
+    timeline = archiver.timeline
+
+    # Кадры строки 2 переносятся в базу и журнал начинается заново до отправки в архив
+    add_items(conn, 2)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    add_items(conn, 3)
+    archiver.ship()
+    assert archiver.timeline != timeline
+    assert backup_system.current_wal_timeline() == archiver.timeline
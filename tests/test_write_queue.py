@@ -0,0 +1,67 @@
+from concurrent.futures import Future
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from extensions import db
+from models import Organization
+from write_queue import RowNotFound, add_row, delete_row, update_row, write_queue
+
+
+def make_app(workdir, queue):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{workdir / 'app.db'}",
+        'SQLALCHEMY_ECHO': False,
+        'BACKUP_SCHEDULER': False,
+        'WRITE_QUEUE': queue,
+    })
+
+
+@pytest.fixture(params=[True, False], ids=['queue', 'direct'])
+def app(workdir, request):
+    return make_app(workdir, request.param)
+
+
+def organization(inn):
+    return Organization(name=f"Организация {inn}", inn=inn, address='Адрес', phone='123')
+
+
+def inns():
+    return sorted(inn for inn, in db.session.query(Organization.inn))
+
+
+def test_batch_isolates_failing_job(workdir):
+    app = make_app(workdir, True)
+    writer = app.extensions['write_queue']
+    with app.app_context():
+        write_queue.run(add_row(organization('100')))
+
+        # Одна группа: строка с уже существующим ИНН откатывает только свою точку сохранения
+        batch = [(add_row(organization(inn)), Future()) for inn in ('101', '100', '102', '103')]
+        writer.commit_batch(batch)
+
+        errors = [future.exception() for _, future in batch]
+        assert isinstance(errors[1], IntegrityError)
+        assert [error for i, error in enumerate(errors) if i != 1] == [None, None, None]
+        assert inns() == ['100', '101', '102', '103']
+        assert write_queue.stats() == {"batches": 2, "jobs": 5}
+
+
+def test_run_reports_errors_per_request(app):
+    with app.test_request_context():
+        write_queue.run(add_row(organization('200')))
+        org_id = Organization.query.filter_by(inn='200').one().id
+
+        with pytest.raises(IntegrityError):
+            write_queue.run(add_row(organization('200')))
+        with pytest.raises(RowNotFound):
+            write_queue.run(update_row(Organization, org_id + 1, name='Нет такой'))
+
+        # После ошибок сессия запроса пригодна, а изменения продолжают выполняться
+        write_queue.run(update_row(Organization, org_id, inn='201'))
+        assert inns() == ['201']
+        write_queue.run(delete_row(Organization, org_id))
+        assert inns() == []
+        with pytest.raises(RowNotFound):
+            write_queue.run(delete_row(Organization, org_id))
@@ -1,6 +1,12 @@
+import json
 import os
 import shutil
 from datetime import datetime
+from itertools import islice
+
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import literal, tuple_
+
 
 def cleanup_temp_files(folder='temp'):
     """
@@ -18,4 +24,195 @@ def cleanup_temp_files(folder='temp'):
                 count += 1
         except Exception:
             pass
-    return count
\ No newline at end of file
+    return count
+
+def chunked(iterable, size):
+    """Разбивает итератор на списки по size элементов."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def encode_cursor(created_at, row_id):
+    """
+    Кодирует позицию строки (created_at, id) в строку курсора.
+    """
+    return f"{created_at.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Разбирает строку курсора. Возвращает (created_at, id) или None,
+    если курсор пустой или повреждён.
+    """
+    if not cursor:
+        return None
+    try:
+        created_at, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        return None
+
+
+def keyset_query(query, created_col, id_col, after=None, descending=False):
+    """
+    Добавляет к запросу условие «строго после курсора» и сортировку по ключу
+    (created_at, id), которую обслуживает индекс по created_at.
+    """
+    position = decode_cursor(after)
+    if position is not None:
+        created_at, row_id = position
+        key = tuple_(created_col, id_col)
+        bound = tuple_(literal(created_at, created_col.type), literal(row_id, id_col.type))
+        query = query.filter(key < bound if descending else key > bound)
+
+    if descending:
+        return query.order_by(created_col.desc(), id_col.desc())
+    return query.order_by(created_col.asc(), id_col.asc())
+
+
+def keyset_paginate(query, created_col, id_col, after=None, per_page=None, descending=False):
+    """
+    Возвращает одну страницу результатов запроса, используя пагинацию по ключу
+    (created_at, id) вместо OFFSET.
+
+    Следующая страница начинается строго после последней строки предыдущей,
+    поэтому время загрузки не зависит от того, насколько далеко пролистан список.
+
+    Args:
+        query: Запрос SQLAlchemy (уже с фильтрами)
+        created_col: Колонка времени создания
+        id_col: Колонка первичного ключа
+        after (str): Курсор последней строки предыдущей страницы
+        per_page (int): Размер страницы (по умолчанию ITEMS_PER_PAGE из конфигурации)
+        descending (bool): Сортировать от новых к старым
+
+    Returns:
+        tuple: (items, next_cursor) где next_cursor - None, если страница последняя
+    """
+    if per_page is None:
+        per_page = current_app.config['ITEMS_PER_PAGE']
+
+    query = keyset_query(query, created_col, id_col, after=after, descending=descending)
+
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    items = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return items, next_cursor
+
+
+def stream_page(template_name, **context):
+    """
+    Рендерит шаблон потоком: заголовок страницы и первые строки таблицы
+    уходят клиенту сразу, не дожидаясь, пока будет отрисован весь список.
+
+    Args:
+        template_name (str): Имя шаблона
+        **context: Переменные шаблона (списки могут быть итераторами по курсору)
+
+    Returns:
+        Response: Ответ с потоковым телом
+    """
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    stream = template.stream(context)
+    # Без буферизации каждый фрагмент шаблона был бы отдельной записью в сокет
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream), mimetype='text/html')
+
+
+def iter_json_array(stream, key=None, chunk_size=64 * 1024):
+    """
+    Читает элементы JSON-массива из текстового потока по одному, не загружая
+    весь файл в память.
+
+    Поддерживает как массив на верхнем уровне, так и объект, в котором массив
+    лежит под ключом key (например {"organizations": [...]}).
+
+    Args:
+        stream: Текстовый поток
+        key (str): Ключ массива, если на верхнем уровне объект
+        chunk_size (int): Сколько символов читать за раз
+
+    Yields:
+        Элементы массива
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def peek():
+        # Пропускает пробелы и возвращает следующий символ ('' в конце потока)
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos:pos + 1]
+            buf, pos = stream.read(chunk_size), 0
+            eof = not buf
+
+    def decode():
+        # Разбирает одно значение; если оно не поместилось в буфер, дочитывает поток
+        nonlocal buf, pos, eof
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # Число в конце буфера может продолжаться в следующем фрагменте
+                truncated = (
+                    isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and not buf[end:].strip('0123456789+-.eE')
+                )
+                if eof or (end < len(buf) and not truncated):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"Неверный формат JSON: ожидался символ '{char}'.")
+        pos += 1
+
+    first = peek()
+    if first == '{':
+        pos += 1
+        while True:
+            if peek() == '}':
+                return
+            name = decode()
+            expect(':')
+            if name == key and peek() == '[':
+                break
+            decode()
+            if peek() == ',':
+                pos += 1
+    elif first != '[':
+        raise ValueError("Неверный формат JSON.")
+
+    expect('[')
+    if peek() == ']':
+        return
+    while True:
+        yield decode()
+        char = peek()
+        pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError("Неверный формат JSON: ожидался символ ',' или ']'.")
@@ -0,0 +1,213 @@
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+
+
+def is_lock_error(error):
+    """True, если SQLite не дал выполнить запрос, потому что база занята."""
+    orig = getattr(error, 'orig', error)
+    return isinstance(orig, sqlite3.OperationalError) and ('locked' in str(orig) or 'busy' in str(orig))
+
+
+def lock_backoff(attempt):
+    """Пауза перед повтором после занятой базы: 10, 20, 40... мс, не больше 0.5 с."""
+    return min(0.01 * 2 ** (attempt - 1), 0.5)
+
+
+class RowNotFound(LookupError):
+    """Строки, которую меняет изменение, уже нет: её удалил другой запрос."""
+
+
+def get_row(session, model, row_id):
+    """Строка model с row_id в сессии изменения; RowNotFound, если её уже удалили."""
+    # Строка читается из базы заново: в сессии запроса может остаться уже удалённый объект
+    row = session.get(model, row_id, populate_existing=True)
+    if row is None:
+        raise RowNotFound(f"{model.__name__} {row_id}")
+    return row
+
+
+def add_row(obj):
+    """Изменение для WriteQueue.run: добавить новый объект."""
+    def work(session):
+        session.add(obj)
+    return work
+
+
+def update_row(model, row_id, **values):
+    """Изменение для WriteQueue.run: присвоить полям строки model с row_id значения values."""
+    def work(session):
+        row = get_row(session, model, row_id)
+        for name, value in values.items():
+            setattr(row, name, value)
+    return work
+
+
+def delete_row(model, row_id):
+    """Изменение для WriteQueue.run: удалить строку model с row_id."""
+    def work(session):
+        session.delete(get_row(session, model, row_id))
+    return work
+
+
+class _Writer:
+    """
+    Поток, выполняющий изменения из очереди группами: одна транзакция
+    BEGIN IMMEDIATE на группу, каждое изменение - в своей точке сохранения,
+    одна фиксация (и одна запись на диск) на всю группу.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config['WRITE_BATCH_SIZE']
+        self.batch_wait = app.config['WRITE_BATCH_WAIT']
+        self.retries = app.config['WRITE_LOCK_RETRIES']
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, work):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='write-queue', daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((work, future))
+        return future
+
+    def _next_batch(self):
+        """Ждёт первое изменение и добирает к нему уже накопившиеся (и пришедшие за batch_wait сек)."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run_forever(self):
+        # Шлюз db_gate поток не занимает: пока изменение в очереди, его запрос
+        # держит место в шлюзе, а между группами у потока нет открытых соединений
+        while True:
+            batch = self._next_batch()
+            with self.app.app_context():
+                try:
+                    self.commit_batch(batch)
+                except Exception as e:
+                    # Запрос не должен ждать ответа вечно, даже если поток ошибся
+                    self.app.logger.exception("Ошибка очереди записи")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    db.session.remove()
+
+    def commit_batch(self, batch):
+        """Выполняет группу изменений и передаёт каждому запросу его результат или ошибку."""
+        session = db.session
+        for attempt in itertools.count(1):
+            results = []
+            try:
+                session.execute(text("BEGIN IMMEDIATE"))
+                for work, future in batch:
+                    try:
+                        # Изменение записывается в базу при выходе из блока
+                        with session.begin_nested():
+                            result = work(session)
+                    except Exception as e:
+                        if is_lock_error(e):
+                            raise
+                        # Ошибка одного изменения откатывает только его точку сохранения
+                        results.append((future, None, e))
+                    else:
+                        results.append((future, result, None))
+                session.commit()
+                break
+            except Exception as e:
+                session.rollback()
+                if isinstance(e, OperationalError) and is_lock_error(e) and attempt <= self.retries:
+                    time.sleep(lock_backoff(attempt))
+                    continue
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+
+        self.batches += 1
+        self.jobs += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+class WriteQueue:
+    """
+    Выполняет изменения базы из обработчиков запросов.
+
+    Изменение - функция work(session), которая меняет объекты сессии,
+    но не фиксирует транзакцию. При WRITE_QUEUE=1 изменения одновременных
+    запросов выполняет один поток, объединяя их в общую транзакцию
+    (групповая фиксация): запросы не спорят за блокировку записи, а диск
+    синхронизируется один раз на группу. Без очереди изменение выполняется
+    в сессии запроса. В обоих режимах занятая база (database is locked)
+    приводит к повтору транзакции, не более WRITE_LOCK_RETRIES раз.
+    """
+
+    def init_app(self, app):
+        if app.config['WRITE_QUEUE']:
+            app.extensions['write_queue'] = _Writer(app)
+
+    def run(self, work):
+        """
+        Выполняет и фиксирует изменение.
+
+        Returns:
+            Результат work: при очереди он передаётся из другого потока,
+            поэтому должен быть простым значением, а не объектом сессии
+
+        Raises:
+            Исключение, которое выбросила work (например, RowNotFound),
+            или ошибку фиксации (например, IntegrityError)
+        """
+        writer = current_app.extensions.get('write_queue')
+        if writer is not None:
+            # Пока запрос ждёт, его соединение нужнее потоку очереди: иначе
+            # ждущие запросы могут занять весь пул соединений
+            db.session.rollback()
+            return writer.submit(work).result()
+
+        retries = current_app.config['WRITE_LOCK_RETRIES']
+        for attempt in itertools.count(1):
+            try:
+                result = work(db.session)
+                db.session.commit()
+                return result
+            except Exception as e:
+                # Сессия запроса должна остаться пригодной, например для показа формы с ошибкой
+                db.session.rollback()
+                if not (isinstance(e, OperationalError) and is_lock_error(e)) or attempt > retries:
+                    raise
+                time.sleep(lock_backoff(attempt))
+
+    def stats(self):
+        """Сколько групп и изменений зафиксировал поток очереди (None, если очередь выключена)."""
+        writer = current_app.extensions.get('write_queue')
+        if writer is None:
+            return None
+        return {"batches": writer.batches, "jobs": writer.jobs}
+
+
+write_queue = WriteQueue()